@@ -0,0 +1,143 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from config import Config
+from database import create_activity_log_partition, expire_activity_logs, insert_activity_logs
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_POLICIES = ("drop_oldest", "drop_new", "block")
+
+
+class ActivityLogWriter:
+    """Buffers activity_logs rows and writes them in batches off the request path.
+
+    Rows are timestamped when they are submitted, queued in a bounded queue and
+    flushed with COPY every `flush_interval` seconds or once `batch_size` rows
+    are waiting. When the queue is full, `overflow_policy` decides whether to
+    drop the oldest row, drop the new one or make the caller wait.
+    """
+
+    def __init__(self, max_queue: int, batch_size: int, flush_interval: float, overflow_policy: str):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown activity log overflow policy: {overflow_policy}")
+        self.max_queue = max_queue
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.overflow_policy = overflow_policy
+        self.dropped = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._closing: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._closing = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        logger.info("Activity log writer started")
+
+    async def stop(self) -> None:
+        """Stop the background task and write everything still queued"""
+        if self._task is None:
+            return
+        # Let an in-flight flush finish instead of cancelling it mid-COPY
+        self._closing.set()
+        await self._task
+        self._task = None
+
+        while not self._queue.empty():
+            await self._flush(self._take_batch(self.batch_size))
+        if self.dropped:
+            logger.warning(f"Activity log writer dropped {self.dropped} row(s) due to backpressure")
+        logger.info("Activity log writer stopped")
+
+    async def submit(self, row: tuple) -> None:
+        if not self.running:
+            # Writer not started (e.g. one-off scripts): write inline
+            await insert_activity_logs([row])
+            return
+
+        if self.overflow_policy == "block":
+            await self._queue.put(row)
+            return
+
+        try:
+            self._queue.put_nowait(row)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            if self.overflow_policy == "drop_oldest":
+                self._queue.get_nowait()
+                self._queue.put_nowait(row)
+
+    def _take_batch(self, limit: int) -> list[tuple]:
+        batch = []
+        while len(batch) < limit and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _flush(self, batch: list[tuple]) -> None:
+        if not batch:
+            return
+        try:
+            await insert_activity_logs(batch)
+        except Exception as e:
+            logger.error(f"Failed to write {len(batch)} activity log row(s): {e}")
+
+    async def _run(self) -> None:
+        while not self._closing.is_set():
+            try:
+                first = await asyncio.wait_for(self._queue.get(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                continue
+
+            # Give the batch time to fill unless it is already full or we are shutting down
+            if self._queue.qsize() + 1 < self.batch_size:
+                try:
+                    await asyncio.wait_for(self._closing.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            await self._flush([first] + self._take_batch(self.batch_size - 1))
+
+
+activity_writer = ActivityLogWriter(
+    max_queue=Config.ACTIVITY_LOG_QUEUE_SIZE,
+    batch_size=Config.ACTIVITY_LOG_BATCH_SIZE,
+    flush_interval=Config.ACTIVITY_LOG_FLUSH_INTERVAL,
+    overflow_policy=Config.ACTIVITY_LOG_OVERFLOW,
+)
+
+
+async def maintain_activity_logs() -> None:
+    """Create upcoming daily partitions and roll up + drop the expired ones"""
+    today = datetime.now(timezone.utc).date()
+    for offset in range(Config.ACTIVITY_LOG_PARTITIONS_AHEAD + 1):
+        if await create_activity_log_partition(today + timedelta(days=offset)):
+            logger.info(f"Created activity log partition for {today + timedelta(days=offset)}")
+
+    if Config.ACTIVITY_LOG_RETENTION_DAYS > 0:
+        cutoff = datetime.combine(today - timedelta(days=Config.ACTIVITY_LOG_RETENTION_DAYS), datetime.min.time(), tzinfo=timezone.utc)
+        dropped = await expire_activity_logs(cutoff)
+        if dropped:
+            logger.info(f"Rolled up and dropped {dropped} activity log partition(s) older than {cutoff.date()}")
+
+
+async def activity_log_maintenance_loop() -> None:
+    while True:
+        try:
+            await maintain_activity_logs()
+        except Exception as e:
+            logger.error(f"Activity log maintenance failed: {e}")
+        await asyncio.sleep(Config.ACTIVITY_LOG_MAINTENANCE_INTERVAL)
+
+
+async def log_activity(action: str, user_id: int = None, details: str = None, recipients_count: int = 0):
+    """Log bot activity"""
+    await activity_writer.submit((action, user_id, details, recipients_count, datetime.now(timezone.utc)))
@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import time
 from datetime import datetime
@@ -7,23 +8,40 @@ from aiogram import Bot, Dispatcher, F, types
 from aiogram.exceptions import TelegramForbiddenError
 from aiogram.filters import Command
 from aiogram.enums import ParseMode
+from activity import log_activity
+from broadcast import BroadcastStats
+from cache import MISSING, response_cache
 from config import Config
-from database import add_user, get_active_users, deactivate_user, log_activity, get_last_event, get_power_events
+from outbox import broadcast_outbox
+from middlewares import HandlerMetricsMiddleware, ThrottleMiddleware
+from metrics import BROADCAST_DURATION, BROADCAST_MESSAGES, BROADCAST_RETRIES
+from state import power_state
+from stats import format_duration, get_stats_text
+from subscribers import NOTIFY_MODES, subscribers
+from database import get_outages
 
 logger = logging.getLogger(__name__)
 
-def format_duration(seconds: float) -> str:
-    hours, rem = divmod(int(seconds), 3600)
-    minutes, _ = divmod(rem, 60)
-    return f"{hours}h {minutes}m"
-
 bot = Bot(token=Config.BOT_TOKEN)
 dp = Dispatcher()
+dp.message.middleware(HandlerMetricsMiddleware())
+dp.callback_query.middleware(HandlerMetricsMiddleware())
 
 MENU_BTN_STATUS = "✅ Поточний статус"
 MENU_BTN_HISTORY = "📜 Історія відключень"
+MENU_BTN_STATS = "📊 Статистика"
 MENU_BTN_STOP = "🛑 Відписатися"
 
+# Repeated taps during outage spikes: one reply per user and request kind per cooldown
+dp.message.outer_middleware(ThrottleMiddleware(
+    Config.TAP_COOLDOWN,
+    {
+        MENU_BTN_STATUS: "status", "/status": "status",
+        MENU_BTN_HISTORY: "history", "/history": "history",
+        MENU_BTN_STATS: "stats", "/stats": "stats",
+    },
+))
+
 def build_main_menu() -> types.ReplyKeyboardMarkup:
     return types.ReplyKeyboardMarkup(
         keyboard=[
@@ -32,6 +50,7 @@ def build_main_menu() -> types.ReplyKeyboardMarkup:
                 types.KeyboardButton(text=MENU_BTN_HISTORY),
             ],
             [
+                types.KeyboardButton(text=MENU_BTN_STATS),
                 types.KeyboardButton(text=MENU_BTN_STOP),
             ],
         ],
@@ -39,33 +58,99 @@ def build_main_menu() -> types.ReplyKeyboardMarkup:
         input_field_placeholder="Оберіть дію",
     )
 
-async def send_status(message: types.Message) -> None:
-    last_event = await get_last_event()
-    
-    # Log status request
-    await log_activity("status_request", message.from_user.id)
+def get_all_locations() -> list[str]:
+    return [location for location, _ in Config.DEVICES]
+
+def is_multi_location() -> bool:
+    return len(Config.DEVICES) > 1
+
+async def get_visible_locations(user_id: int) -> list[str]:
+    """Locations the user follows, in Config order (all of them if none selected)"""
+    all_locations = get_all_locations()
+    if not is_multi_location():
+        return all_locations
+    subscribed = await subscribers.followed_locations(user_id)
+    return [location for location in all_locations if location in subscribed] or all_locations
+
+def build_status_parts(last_event: dict) -> tuple[str, str]:
+    """Static part of a status reply: header and the label before the live duration"""
+    if last_event.get('status') == "on":
+        return "✅ **Світло Є**", "💡 Світло доступне вже: "
+    return "❌ **Світла НЕМАЄ**", "🌑 Без світла вже: "
+
+def build_history_parts(outages: list[dict]) -> tuple[str, datetime | None, int] | None:
+    """Static part of a history reply (newest-first outages in, oldest-first lines out).
+
+    Returns the finished-outage lines, the start of an ongoing outage (if any)
+    and its line number, so only the "зараз" duration is computed per request.
+    None if there are no outages.
+    """
+    if not outages:
+        return None
+
+    kyiv_tz = pytz.timezone(Config.TIMEZONE)
+    lines: list[str] = []
+    open_start: datetime | None = None
+    open_idx = 0
+    for idx, outage in enumerate(reversed(outages), start=1):
+        start = outage['started_at'].astimezone(kyiv_tz)
+        if outage['ended_at'] is None:
+            open_start, open_idx = start, idx
+            continue
+        end = outage['ended_at'].astimezone(kyiv_tz)
+        start_str = start.strftime('%d.%m %H:%M')
+        end_str = end.strftime('%d.%m %H:%M')
+        duration = (end - start).total_seconds()
+        lines.append(f"{idx}. ❌ {start_str} — ✅ {end_str} (`{format_duration(duration)}`)")
+
+    return "\n".join(lines), open_start, open_idx
 
+async def get_status_text(location: str) -> str:
+    last_event = await power_state.get_last_event(location)
     if not last_event:
-        await message.answer("⚠️ Немає даних про стан електроенергії", reply_markup=build_main_menu())
-        return
+        return "⚠️ Немає даних про стан електроенергії"
 
-    last_state_str = last_event.get('status')
-    last_time = last_event.get('timestamp')
-    now = time.time()
-    duration = now - last_time
-    time_str = format_duration(duration)
+    parts = response_cache.get("status", location, last_event.get('id'))
+    if parts is MISSING:
+        parts = build_status_parts(last_event)
+        response_cache.set("status", location, last_event.get('id'), parts)
 
-    if last_state_str == "on":
-        status_emoji = "✅"
-        status_text = "**Світло Є**"
-        duration_text = f"💡 Світло доступне вже: `{time_str}`"
-    else:
-        status_emoji = "❌"
-        status_text = "**Світла НЕМАЄ**"
-        duration_text = f"🌑 Без світла вже: `{time_str}`"
+    header, duration_label = parts
+    time_str = format_duration(time.time() - last_event.get('timestamp'))
+    return f"{header}\n\n{duration_label}`{time_str}`"
+
+async def get_history_text(location: str) -> str | None:
+    last_event = await power_state.get_last_event(location)
+    event_id = last_event.get('id') if last_event else None
+
+    async def load():
+        return build_history_parts(await get_outages(limit=10, location=location))
+
+    parts = await response_cache.get_or_load("history", location, event_id, load)
+    if parts is None:
+        return None
+
+    text, open_start, open_idx = parts
+    if open_start is not None:
+        duration = (datetime.now(tz=open_start.tzinfo) - open_start).total_seconds()
+        start_str = open_start.strftime('%d.%m %H:%M')
+        open_line = f"{open_idx}. ❌ {start_str} — зараз (`{format_duration(duration)}`)"
+        text = f"{text}\n{open_line}" if text else open_line
+    return text
+
+async def send_status(message: types.Message) -> None:
+    # Log status request
+    await log_activity("status_request", message.from_user.id)
+
+    blocks: list[str] = []
+    for location in await get_visible_locations(message.from_user.id):
+        block = await get_status_text(location)
+        if is_multi_location():
+            block = f"📍 **{location}**\n{block}"
+        blocks.append(block)
 
     await message.answer(
-        f"{status_emoji} {status_text}\n\n{duration_text}",
+        "\n\n".join(blocks),
         parse_mode=ParseMode.MARKDOWN,
         reply_markup=build_main_menu(),
     )
@@ -73,63 +158,58 @@ async def send_status(message: types.Message) -> None:
 async def send_history(message: types.Message) -> None:
     # Log history request
     await log_activity("history_request", message.from_user.id)
-    
-    events = await get_power_events(limit=250)
-    if not events:
-        await message.answer("⚠️ Немає історії відключень", reply_markup=build_main_menu())
-        return
-
-    kyiv_tz = pytz.timezone(Config.TIMEZONE)
-    events_chrono = list(reversed(events))
-
-    outages: list[tuple[datetime, datetime | None]] = []
-    current_off: datetime | None = None
 
-    for event in events_chrono:
-        state = event.get('state')
-        created_at = event.get('created_at')
-        if not isinstance(created_at, datetime):
-            continue
+    sections: list[str] = []
+    for location in await get_visible_locations(message.from_user.id):
+        history = await get_history_text(location)
+        if not is_multi_location():
+            if history is None:
+                await message.answer("⚠️ Немає зафіксованих відключень", reply_markup=build_main_menu())
+                return
+            sections.append(history)
+        else:
+            sections.append(f"📍 **{location}**\n{history or '⚠️ Немає зафіксованих відключень'}")
 
-        created_at_kyiv = created_at.astimezone(kyiv_tz)
+    text = "📜 **Історія відключень (останні 10):**\n\n" + "\n\n".join(sections)
+    await message.answer(
+        text,
+        parse_mode=ParseMode.MARKDOWN,
+        reply_markup=build_main_menu(),
+    )
 
-        if state == 'off':
-            if current_off is None:
-                current_off = created_at_kyiv
-        elif state == 'on':
-            if current_off is not None:
-                outages.append((current_off, created_at_kyiv))
-                current_off = None
+async def send_stats(message: types.Message) -> None:
+    # Log stats request
+    await log_activity("stats_request", message.from_user.id)
 
-    if current_off is not None:
-        outages.append((current_off, None))
+    sections: list[str] = []
+    for location in await get_visible_locations(message.from_user.id):
+        block = await get_stats_text(location)
+        if is_multi_location():
+            block = f"📍 **{location}**\n{block}"
+        sections.append(block)
 
-    if not outages:
-        await message.answer("⚠️ Немає зафіксованих відключень", reply_markup=build_main_menu())
-        return
-
-    now_kyiv = datetime.now(tz=kyiv_tz)
-    last_outages = outages[-10:]
-    lines: list[str] = []
-    for idx, (start, end) in enumerate(last_outages, start=1):
-        start_str = start.strftime('%d.%m %H:%M')
-        if end is None:
-            duration = (now_kyiv - start).total_seconds()
-            lines.append(f"{idx}. ❌ {start_str} — зараз (`{format_duration(duration)}`)")
-        else:
-            end_str = end.strftime('%d.%m %H:%M')
-            duration = (end - start).total_seconds()
-            lines.append(f"{idx}. ❌ {start_str} — ✅ {end_str} (`{format_duration(duration)}`)")
-
-    text = "📜 **Історія відключень (останні 10):**\n\n" + "\n".join(lines)
+    text = "📊 **Статистика відключень:**\n\n" + "\n\n".join(sections)
     await message.answer(
         text,
         parse_mode=ParseMode.MARKDOWN,
         reply_markup=build_main_menu(),
     )
 
+def build_locations_keyboard(selected: list[str]) -> types.InlineKeyboardMarkup:
+    rows = [
+        [
+            types.InlineKeyboardButton(
+                text=f"{'✅' if location in selected else '▫️'} {location}",
+                callback_data=f"loc:{idx}",
+            )
+        ]
+        for idx, location in enumerate(get_all_locations())
+    ]
+    rows.append([types.InlineKeyboardButton(text="🌍 Усі локації", callback_data="loc:all")])
+    return types.InlineKeyboardMarkup(inline_keyboard=rows)
+
 async def do_stop(message: types.Message) -> None:
-    await deactivate_user(message.chat.id)
+    await subscribers.deactivate_user(message.chat.id)
     await log_activity("unsubscribe", message.chat.id)
     await message.answer(
         "👋 Ти відписався від сповіщень.\n"
@@ -140,7 +220,7 @@ async def do_stop(message: types.Message) -> None:
 @dp.message(Command("start"))
 async def cmd_start(message: types.Message):
     user = message.from_user
-    await add_user(
+    await subscribers.add_user(
         user_id=user.id,
         username=user.username,
         first_name=user.first_name,
@@ -153,19 +233,130 @@ async def cmd_start(message: types.Message):
         "Користуйся кнопками меню нижче 👇\n\n"
         "Команди:\n"
         "/start - Підписатися на сповіщення\n"
+        "/stats - Статистика відключень\n"
+        "/notifications - Тихі години та зведення\n"
         "/stop - Відписатися від сповіщень",
         reply_markup=build_main_menu(),
     )
 
-async def setup_bot_commands(bot_instance: Bot) -> None:
-    await bot_instance.set_my_commands(
-        [
-            types.BotCommand(command="start", description="Підписатися на сповіщення"),
-            types.BotCommand(command="history", description="Історія відключень"),
-            types.BotCommand(command="stop", description="Відписатися"),
-        ]
+@dp.message(Command("locations"))
+async def cmd_locations(message: types.Message):
+    if not is_multi_location():
+        await message.answer("📍 Бот стежить лише за однією локацією", reply_markup=build_main_menu())
+        return
+
+    selected = await get_visible_locations(message.from_user.id)
+    await message.answer(
+        "📍 Оберіть локації, про які надсилати сповіщення:",
+        reply_markup=build_locations_keyboard(selected),
     )
 
+@dp.callback_query(F.data.startswith("loc:"))
+async def locations_callback(callback: types.CallbackQuery):
+    user_id = callback.from_user.id
+    all_locations = get_all_locations()
+    choice = callback.data.split(":", 1)[1]
+
+    if choice == "all":
+        selected = all_locations
+    else:
+        try:
+            location = all_locations[int(choice)]
+        except (ValueError, IndexError):
+            await callback.answer("⚠️ Локацію не знайдено")
+            return
+        selected = await get_visible_locations(user_id)
+        if location in selected:
+            selected = [l for l in selected if l != location]
+        else:
+            selected = [l for l in all_locations if l in selected or l == location]
+
+    if not selected:
+        await callback.answer("Щоб відписатися від усіх локацій, використай /stop", show_alert=True)
+        return
+
+    # Following every location is stored as "no rows", so new locations are picked up automatically
+    await subscribers.set_user_locations(user_id, [] if len(selected) == len(all_locations) else selected)
+    await log_activity("locations_update", user_id, details=", ".join(selected))
+    await callback.message.edit_reply_markup(reply_markup=build_locations_keyboard(selected))
+    await callback.answer()
+
+def build_notify_keyboard(prefs: tuple) -> types.InlineKeyboardMarkup:
+    mode = prefs[0]
+    rows = [[
+        types.InlineKeyboardButton(
+            text=f"{'✅' if mode == 'instant' else '▫️'} Одразу про кожну зміну",
+            callback_data="notify:instant",
+        )
+    ]]
+    for quiet_start, quiet_end in Config.QUIET_HOURS_OPTIONS:
+        rows.append([
+            types.InlineKeyboardButton(
+                text=f"{'✅' if prefs == ('quiet', quiet_start, quiet_end) else '▫️'} "
+                     f"Тихі години {quiet_start:02d}:00–{quiet_end:02d}:00",
+                callback_data=f"notify:quiet:{quiet_start}:{quiet_end}",
+            )
+        ])
+    rows.append([
+        types.InlineKeyboardButton(
+            text=f"{'✅' if mode == 'digest' else '▫️'} Зведення раз на {Config.DIGEST_INTERVAL_HOURS} год",
+            callback_data="notify:digest",
+        )
+    ])
+    return types.InlineKeyboardMarkup(inline_keyboard=rows)
+
+@dp.message(Command("notifications"))
+async def cmd_notifications(message: types.Message):
+    await subscribers.ensure_loaded()
+    await message.answer(
+        "🔔 Як надсилати сповіщення про світло?\n\n"
+        "У тихі години та в режимі зведення зміни не приходять окремо: "
+        "ти отримаєш одне повідомлення з усіма змінами за цей час.",
+        reply_markup=build_notify_keyboard(subscribers.preferences(message.from_user.id)),
+    )
+
+@dp.callback_query(F.data.startswith("notify:"))
+async def notify_callback(callback: types.CallbackQuery):
+    user_id = callback.from_user.id
+    parts = callback.data.split(":")
+    mode = parts[1]
+    quiet_start = quiet_end = None
+    if mode == "quiet":
+        try:
+            quiet_start, quiet_end = int(parts[2]), int(parts[3])
+        except (ValueError, IndexError):
+            pass
+        # Only the offered windows, so summaries go out to a handful of groups
+        valid = (quiet_start, quiet_end) in Config.QUIET_HOURS_OPTIONS
+    else:
+        valid = mode in NOTIFY_MODES
+    if not valid:
+        await callback.answer("⚠️ Такого режиму немає")
+        return
+
+    await subscribers.set_notify_preferences(user_id, mode, quiet_start, quiet_end)
+    await log_activity("notify_mode_update", user_id, details=mode if mode != "quiet" else f"quiet {quiet_start}-{quiet_end}")
+    await callback.message.edit_reply_markup(
+        reply_markup=build_notify_keyboard(subscribers.preferences(user_id))
+    )
+    await callback.answer()
+
+async def setup_bot_commands(bot_instance: Bot) -> None:
+    commands = [
+        types.BotCommand(command="start", description="Підписатися на сповіщення"),
+        types.BotCommand(command="history", description="Історія відключень"),
+        types.BotCommand(command="stats", description="Статистика відключень"),
+        types.BotCommand(command="notifications", description="Тихі години та зведення"),
+        types.BotCommand(command="stop", description="Відписатися"),
+    ]
+    if is_multi_location():
+        commands.insert(3, types.BotCommand(command="locations", description="Обрати локації"))
+    try:
+        await bot_instance.set_my_commands(commands)
+    except Exception as e:
+        # Telegram keeps the menu from the previous start; not worth failing startup over
+        logger.warning(f"Failed to register bot commands: {e}")
+
 @dp.message(Command("status"))
 async def cmd_status(message: types.Message):
     try:
@@ -182,6 +373,14 @@ async def cmd_history(message: types.Message):
         logger.exception(f"Error in /history command: {e}")
         await message.answer("❌ Помилка при завантаженні історії", reply_markup=build_main_menu())
 
+@dp.message(Command("stats"))
+async def cmd_stats(message: types.Message):
+    try:
+        await send_stats(message)
+    except Exception as e:
+        logger.exception(f"Error in /stats command: {e}")
+        await message.answer("❌ Помилка при завантаженні статистики", reply_markup=build_main_menu())
+
 @dp.message(Command("broadcast"))
 async def cmd_broadcast(message: types.Message):
     if message.from_user.id != int(Config.ADMIN_USER_ID):
@@ -201,8 +400,16 @@ async def cmd_broadcast(message: types.Message):
         return
     
     await message.answer("📤 Надсилаю повідомлення всім користувачам...")
-    await broadcast_message(bot, text)
-    await message.answer("✅ Розсилка завершена!")
+    stats = await broadcast_message(bot, text)
+    last_delivery = stats.time_to_last_delivery
+    await message.answer(
+        "✅ Розсилка завершена!\n\n"
+        f"Доставлено: {stats.sent}/{stats.total}\n"
+        f"Заблокували бота: {stats.blocked} (деактивовано: {stats.deactivated})\n"
+        f"Помилки: {stats.failed}\n"
+        f"Швидкість: {stats.throughput:.1f} повід./с\n"
+        f"Остання доставка через: {last_delivery or 0:.1f} с"
+    )
 
 @dp.message(Command("stop"))
 async def cmd_stop(message: types.Message):
@@ -213,12 +420,9 @@ async def status_button(message: types.Message):
     try:
         await send_status(message)
     except TelegramForbiddenError:
-        # User blocked the bot - deactivate them silently
+        # User blocked the bot - deactivate them silently (batched)
         logger.info(f"User {message.from_user.id} blocked the bot")
-        try:
-            await deactivate_user(message.from_user.id)
-        except Exception as e:
-            logger.error(f"Failed to deactivate user {message.from_user.id}: {e}")
+        subscribers.mark_blocked(message.from_user.id)
     except Exception as e:
         logger.exception(f"Error in status button: {e}")
         try:
@@ -226,22 +430,16 @@ async def status_button(message: types.Message):
         except TelegramForbiddenError:
             # User blocked the bot during error handling
             logger.info(f"User {message.from_user.id} blocked the bot during error handling")
-            try:
-                await deactivate_user(message.from_user.id)
-            except Exception as db_error:
-                logger.error(f"Failed to deactivate user {message.from_user.id}: {db_error}")
+            subscribers.mark_blocked(message.from_user.id)
 
 @dp.message(F.text == MENU_BTN_HISTORY)
 async def history_button(message: types.Message):
     try:
         await send_history(message)
     except TelegramForbiddenError:
-        # User blocked the bot - deactivate them silently
+        # User blocked the bot - deactivate them silently (batched)
         logger.info(f"User {message.from_user.id} blocked the bot")
-        try:
-            await deactivate_user(message.from_user.id)
-        except Exception as e:
-            logger.error(f"Failed to deactivate user {message.from_user.id}: {e}")
+        subscribers.mark_blocked(message.from_user.id)
     except Exception as e:
         logger.exception(f"Error in history button: {e}")
         try:
@@ -249,31 +447,66 @@ async def history_button(message: types.Message):
         except TelegramForbiddenError:
             # User blocked the bot during error handling
             logger.info(f"User {message.from_user.id} blocked the bot during error handling")
-            try:
-                await deactivate_user(message.from_user.id)
-            except Exception as db_error:
-                logger.error(f"Failed to deactivate user {message.from_user.id}: {db_error}")
+            subscribers.mark_blocked(message.from_user.id)
+
+@dp.message(F.text == MENU_BTN_STATS)
+async def stats_button(message: types.Message):
+    try:
+        await send_stats(message)
+    except TelegramForbiddenError:
+        # User blocked the bot - deactivate them silently (batched)
+        logger.info(f"User {message.from_user.id} blocked the bot")
+        subscribers.mark_blocked(message.from_user.id)
+    except Exception as e:
+        logger.exception(f"Error in stats button: {e}")
+        try:
+            await message.answer("❌ Помилка при завантаженні статистики", reply_markup=build_main_menu())
+        except TelegramForbiddenError:
+            # User blocked the bot during error handling
+            logger.info(f"User {message.from_user.id} blocked the bot during error handling")
+            subscribers.mark_blocked(message.from_user.id)
 
 @dp.message(F.text == MENU_BTN_STOP)
 async def stop_button(message: types.Message):
     await do_stop(message)
 
-async def broadcast_message(bot_instance: Bot, text: str):
-    users = await get_active_users()
-    count = 0
-    for user_id in users:
-        try:
-            await bot_instance.send_message(user_id, text, parse_mode=ParseMode.MARKDOWN)
-            count += 1
-        except TelegramForbiddenError:
-            await deactivate_user(user_id)
-        except Exception as e:
-            logger.error(f"Failed to send to {user_id}: {e}")
-    
+async def record_broadcast(stats: BroadcastStats, text: str) -> None:
+    BROADCAST_DURATION.observe(stats.duration)
+    BROADCAST_MESSAGES.labels(result="sent").inc(stats.sent)
+    BROADCAST_MESSAGES.labels(result="blocked").inc(stats.blocked)
+    BROADCAST_MESSAGES.labels(result="failed").inc(stats.failed)
+    BROADCAST_RETRIES.inc(stats.retries)
+
     # Log notification sent
-    await log_activity("notification_sent", recipients_count=count, details=f"Broadcast: {text[:50]}...")
-    logger.info(f"Message sent to {count} users.")
+    await log_activity("notification_sent", recipients_count=stats.sent, details=f"Broadcast: {text[:50]}...")
+    logger.info(f"Broadcast finished: {stats.summary()}")
+
+async def broadcast_message(
+    bot_instance: Bot, text: str, location: str | None = None, audience: str | None = None
+) -> BroadcastStats:
+    """Send `text` to active users following `location`; `audience` limits it to a preference group"""
+    stats = await broadcast_outbox.send(bot_instance, text, location, audience)
+    await record_broadcast(stats, text)
+    return stats
+
+async def resume_broadcasts(bot_instance: Bot) -> None:
+    """Leader-only: finish broadcasts whose replica stopped delivering them (lease expired)
+
+    Checks every BROADCAST_LEASE seconds, so a broadcast interrupted on any
+    replica is picked up without waiting for the next leadership change.
+    """
+    while True:
+        for job in await broadcast_outbox.pending_jobs():
+            try:
+                stats = await broadcast_outbox.resume(bot_instance, job)
+                await record_broadcast(stats, job['text'])
+            except Exception as e:
+                logger.exception(f"Failed to resume broadcast job {job['id']}: {e}")
+        await asyncio.sleep(Config.BROADCAST_LEASE)
 
 async def start_bot():
-    await setup_bot_commands(bot)
-    await dp.start_polling(bot)
+    if Config.BOT_MODE == "webhook":
+        from webhook import run_webhook
+        await run_webhook(bot, dp)
+    else:
+        await dp.start_polling(bot, tasks_concurrency_limit=Config.HANDLER_CONCURRENCY)
@@ -0,0 +1,176 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Iterable, Optional
+
+from aiogram import Bot
+from aiogram.enums import ParseMode
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+from config import Config
+from logutil import RateLimitedLog
+
+logger = logging.getLogger(__name__)
+# Per-recipient problems can repeat thousands of times in one broadcast
+noisy_log = RateLimitedLog(logger, Config.LOG_RATE_LIMIT_INTERVAL)
+
+
+class TokenBucket:
+    """Async token bucket shared by all senders"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float) -> None:
+        """Stop handing out tokens for `seconds` (used on flood control)"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        # Refill from the end of the pause, not from before it, so no burst follows flood control
+        self._tokens = 0
+        self._updated = self._paused_until
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+@dataclass
+class BroadcastStats:
+    total: int = 0
+    sent: int = 0
+    failed: int = 0
+    blocked: int = 0
+    deactivated: int = 0
+    retries: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+    finished_at: Optional[float] = None
+    last_delivery_at: Optional[float] = None
+    # Chats that blocked the bot and still have to be deactivated
+    blocked_ids: list[int] = field(default_factory=list)
+
+    @property
+    def duration(self) -> float:
+        end = self.finished_at if self.finished_at is not None else time.monotonic()
+        return end - self.started_at
+
+    @property
+    def time_to_last_delivery(self) -> Optional[float]:
+        if self.last_delivery_at is None:
+            return None
+        return self.last_delivery_at - self.started_at
+
+    @property
+    def throughput(self) -> float:
+        duration = self.duration
+        return self.sent / duration if duration > 0 else 0.0
+
+    def summary(self) -> str:
+        last = self.time_to_last_delivery
+        last_str = f"{last:.2f}s" if last is not None else "n/a"
+        return (
+            f"sent={self.sent}/{self.total} blocked={self.blocked} deactivated={self.deactivated} failed={self.failed} "
+            f"retries={self.retries} duration={self.duration:.2f}s "
+            f"throughput={self.throughput:.1f} msg/s time_to_last_delivery={last_str}"
+        )
+
+
+class Broadcaster:
+    """Fans out a message with bounded concurrency under Telegram flood limits"""
+
+    def __init__(
+        self,
+        concurrency: int,
+        rate_limit: float,
+        per_chat_interval: float,
+        max_retries: int,
+    ):
+        self.concurrency = max(1, concurrency)
+        self.per_chat_interval = per_chat_interval
+        self.max_retries = max_retries
+        self.bucket = TokenBucket(rate_limit)
+        # chat_id -> monotonic time of the next allowed send to that chat
+        self._chat_next_send: dict[int, float] = {}
+
+    async def _wait_for_chat(self, chat_id: int) -> None:
+        now = time.monotonic()
+        next_send = self._chat_next_send.get(chat_id, 0.0)
+        if next_send > now:
+            await asyncio.sleep(next_send - now)
+            now = time.monotonic()
+        self._chat_next_send[chat_id] = now + self.per_chat_interval
+
+    def _prune_chat_slots(self) -> None:
+        now = time.monotonic()
+        self._chat_next_send = {c: t for c, t in self._chat_next_send.items() if t > now}
+
+    async def _send_one(self, bot_instance: Bot, chat_id: int, text: str, stats: BroadcastStats) -> None:
+        for attempt in range(self.max_retries + 1):
+            await self._wait_for_chat(chat_id)
+            await self.bucket.acquire()
+            try:
+                await bot_instance.send_message(chat_id, text, parse_mode=ParseMode.MARKDOWN)
+                stats.sent += 1
+                stats.last_delivery_at = time.monotonic()
+                return
+            except TelegramRetryAfter as e:
+                # Flood control applies to the whole bot, so pause every sender
+                noisy_log.warning("flood_control", f"Flood control hit, pausing broadcast for {e.retry_after}s")
+                self.bucket.pause(e.retry_after)
+                stats.retries += 1
+            except TelegramForbiddenError:
+                stats.blocked += 1
+                # Deactivated in bulk by the caller (see BroadcastOutbox)
+                stats.blocked_ids.append(chat_id)
+                return
+            except Exception as e:
+                noisy_log.error("send_failed", f"Failed to send to {chat_id}: {e}")
+                stats.failed += 1
+                return
+
+        noisy_log.error("retries_exhausted", f"Failed to send to {chat_id}: retries exhausted")
+        stats.failed += 1
+
+    async def broadcast(
+        self, bot_instance: Bot, chat_ids: Iterable[int], text: str, stats: Optional[BroadcastStats] = None
+    ) -> BroadcastStats:
+        """Send `text` to every chat; pass `stats` to keep counting into an existing broadcast"""
+        chat_ids = list(chat_ids)
+        if stats is None:
+            stats = BroadcastStats()
+        stats.total += len(chat_ids)
+        pending = iter(chat_ids)
+
+        async def worker() -> None:
+            # Workers share one iterator, so each chat is picked up exactly once
+            for chat_id in pending:
+                await self._send_one(bot_instance, chat_id, text, stats)
+
+        workers = min(self.concurrency, len(chat_ids))
+        await asyncio.gather(*(worker() for _ in range(workers)))
+
+        stats.finished_at = time.monotonic()
+        self._prune_chat_slots()
+        return stats
+
+
+broadcaster = Broadcaster(
+    concurrency=Config.BROADCAST_CONCURRENCY,
+    rate_limit=Config.BROADCAST_RATE_LIMIT,
+    per_chat_interval=Config.BROADCAST_PER_CHAT_INTERVAL,
+    max_retries=Config.BROADCAST_MAX_RETRIES,
+)
@@ -0,0 +1,76 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Hashable
+
+from metrics import LOOKUPS_COALESCED, RESPONSE_CACHE_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+# Returned by ResponseCache.get on a miss (None is a valid cached value)
+MISSING = object()
+
+
+class SingleFlight:
+    """Concurrent callers asking for the same key share one in-flight call"""
+
+    def __init__(self):
+        self._calls: dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        future = self._calls.get(key)
+        if future is None:
+            future = asyncio.ensure_future(func())
+            self._calls[key] = future
+            future.add_done_callback(lambda _: self._calls.pop(key, None))
+        else:
+            LOOKUPS_COALESCED.inc()
+        # A cancelled caller must not cancel the call the others are waiting for
+        return await asyncio.shield(future)
+
+
+class ResponseCache:
+    """Pre-rendered reply parts per (kind, location), valid for one power event.
+
+    Entries remember the id of the latest power event they were built from
+    (the version; callers may add to it, e.g. the day) and are ignored once a
+    newer event exists. Writers also drop a location's entries explicitly
+    when they record an event.
+    """
+
+    def __init__(self):
+        # (kind, location) -> (event_id, value)
+        self._entries: dict[tuple[str, str], tuple[Hashable, Any]] = {}
+        self._loads = SingleFlight()
+
+    def get(self, kind: str, location: str, event_id: Hashable) -> Any:
+        entry = self._entries.get((kind, location))
+        if entry is None or entry[0] != event_id:
+            RESPONSE_CACHE_LOOKUPS.labels(kind=kind, result="miss").inc()
+            return MISSING
+        RESPONSE_CACHE_LOOKUPS.labels(kind=kind, result="hit").inc()
+        return entry[1]
+
+    def set(self, kind: str, location: str, event_id: Hashable, value: Any) -> None:
+        self._entries[(kind, location)] = (event_id, value)
+
+    async def get_or_load(
+        self, kind: str, location: str, event_id: Hashable, loader: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """Cached value, or the result of `loader`; simultaneous misses share a single load"""
+        value = self.get(kind, location, event_id)
+        if value is not MISSING:
+            return value
+
+        async def load() -> Any:
+            loaded = await loader()
+            self.set(kind, location, event_id, loaded)
+            return loaded
+
+        return await self._loads.do((kind, location, event_id), load)
+
+    def invalidate(self, location: str) -> None:
+        for key in [key for key in self._entries if key[1] == location]:
+            del self._entries[key]
+
+
+response_cache = ResponseCache()
@@ -1,7 +1,8 @@
+import atexit
 import os
 import logging
 import pathlib
-from logging.handlers import TimedRotatingFileHandler
+import queue
 from datetime import datetime
 
 
@@ -31,16 +32,99 @@ def _load_dotenv_if_missing():
 
 _load_dotenv_if_missing()
 
+
+def _parse_devices(raw: str | None, fallback_ip: str | None, fallback_location: str) -> list[tuple[str, str]]:
+    """Parse DEVICES="location=ip,location=ip" into (location, ip) pairs"""
+    devices: list[tuple[str, str]] = []
+    for item in (raw or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        if "=" in item:
+            location, ip = item.split("=", 1)
+        else:
+            location, ip = item, item
+        devices.append((location.strip(), ip.strip()))
+
+    if not devices:
+        devices.append((fallback_location, fallback_ip or ""))
+    return devices
+
+def _parse_hour_ranges(raw: str) -> list[tuple[int, int]]:
+    """Parse "22-7,0-6" into (start_hour, end_hour) pairs"""
+    ranges: list[tuple[int, int]] = []
+    for item in raw.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        start, end = item.split("-", 1)
+        ranges.append((int(start) % 24, int(end) % 24))
+    return ranges
+
+def _hours_dividing_day(raw: str) -> int:
+    """Round an hour count down to a divisor of 24, so its windows tile every day the same way"""
+    hours = min(24, max(1, int(raw)))
+    while 24 % hours:
+        hours -= 1
+    return hours
+
+def _optional_int(raw: str) -> int | None:
+    """Parse an integer setting where "none" means unset"""
+    return None if raw.strip().lower() == "none" else int(raw)
+
 class Config:
     BOT_TOKEN = os.getenv("BOT_TOKEN")
     ADMIN_USER_ID = os.getenv("ADMIN_USER_ID")
+
+    # Update delivery: "polling" or "webhook"
+    BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+    WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")  # Public base URL; empty = don't register with Telegram
+    WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+    WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+    WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+    WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+    HANDLER_CONCURRENCY = int(os.getenv("HANDLER_CONCURRENCY", "100"))
+    # Seconds during which a user's repeated status/history/stats taps are ignored (0 disables)
+    TAP_COOLDOWN = float(os.getenv("TAP_COOLDOWN", "3"))
+
+    # Replicas: only the holder of this Postgres advisory lock probes plugs and sends notifications
+    LEADER_LOCK_ID = int(os.getenv("LEADER_LOCK_ID", "718420"))
+    LEADER_POLL_INTERVAL = float(os.getenv("LEADER_POLL_INTERVAL", "5"))
+    LEADER_CHECK_INTERVAL = float(os.getenv("LEADER_CHECK_INTERVAL", "5"))
+    LEADER_KEEPALIVE_TIMEOUT = int(os.getenv("LEADER_KEEPALIVE_TIMEOUT", "30"))
+    # Power events and subscriber changes are pushed to every replica over LISTEN/NOTIFY
+    LISTEN_RECONNECT_DELAY = float(os.getenv("LISTEN_RECONNECT_DELAY", "5"))
     
     TAPO_EMAIL = os.getenv("TAPO_EMAIL")
     TAPO_PASSWORD = os.getenv("TAPO_PASSWORD")
     DEVICE_IP = os.getenv("DEVICE_IP")
+    DEFAULT_LOCATION = os.getenv("DEFAULT_LOCATION", "default")
+    # Several plugs: DEVICES="Центр=192.168.1.10,Поділ=192.168.2.10" (falls back to DEVICE_IP)
+    DEVICES = _parse_devices(os.getenv("DEVICES"), DEVICE_IP, DEFAULT_LOCATION)
+    MAX_CONCURRENT_PROBES = int(os.getenv("MAX_CONCURRENT_PROBES", "50"))
+    
+    # Probe strategy: "tapo" (authenticated request), "tcp" (connect only) or "layered" (tcp first, tapo periodically)
+    PROBE_STRATEGY = os.getenv("PROBE_STRATEGY", "layered").lower()
+    PROBE_TCP_PORT = int(os.getenv("PROBE_TCP_PORT", "80"))
+    PROBE_TCP_TIMEOUT = float(os.getenv("PROBE_TCP_TIMEOUT", "1.5"))
+    PROBE_FULL_INTERVAL = float(os.getenv("PROBE_FULL_INTERVAL", "300"))
+
+    # Tapo probe budget: per-request timeout, total time per probe and session reuse
+    TAPO_PROBE_TIMEOUT = float(os.getenv("TAPO_PROBE_TIMEOUT", "3.0"))
+    TAPO_PROBE_BUDGET = float(os.getenv("TAPO_PROBE_BUDGET", "7.0"))
+    TAPO_PROBE_ATTEMPTS = int(os.getenv("TAPO_PROBE_ATTEMPTS", "2"))
+    TAPO_PROBE_RETRY_DELAY = float(os.getenv("TAPO_PROBE_RETRY_DELAY", "0.5"))
+    TAPO_SESSION_MAX_AGE = float(os.getenv("TAPO_SESSION_MAX_AGE", "3600"))
     
     CHECK_INTERVAL = int(os.getenv("CHECK_INTERVAL", "30"))
     CONFIRMATION_CHECKS = int(os.getenv("CONFIRMATION_CHECKS", "2"))
+    # Adaptive cadence: probe faster while a change is pending, slower after long stable periods
+    CONFIRMATION_INTERVAL = float(os.getenv("CONFIRMATION_INTERVAL", "5"))
+    MAX_CHECK_INTERVAL = float(os.getenv("MAX_CHECK_INTERVAL", str(CHECK_INTERVAL)))
+    BACKOFF_AFTER = float(os.getenv("BACKOFF_AFTER", "3600"))
+    BACKOFF_FACTOR = float(os.getenv("BACKOFF_FACTOR", "1.5"))
+    # A pending change restored after a restart is continued only if it was first seen this recently
+    PENDING_STATE_MAX_AGE = float(os.getenv("PENDING_STATE_MAX_AGE", "300"))
     TEST_MODE = os.getenv("TEST_MODE", "false").lower() == "true"
     TIMEZONE = os.getenv("TIMEZONE", "Europe/Kyiv")
     
@@ -49,14 +133,73 @@ class Config:
     DB_NAME = os.getenv("DB_NAME", "powerbot")
     DB_USER = os.getenv("DB_USER", "powerbot")
     DB_PASSWORD = os.getenv("DB_PASSWORD", "powerbot")
+    # Connection pool sizing and timeouts (seconds)
+    DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+    DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+    DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+    DB_POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", "300"))
+    DB_POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", "3600"))
+    # Executions before other queries are prepared server-side; "none" disables (PgBouncer in transaction mode)
+    DB_PREPARE_THRESHOLD = _optional_int(os.getenv("DB_PREPARE_THRESHOLD", "5"))
+
+    # Activity log writer: rows are queued and written in batches
+    ACTIVITY_LOG_QUEUE_SIZE = int(os.getenv("ACTIVITY_LOG_QUEUE_SIZE", "10000"))
+    ACTIVITY_LOG_BATCH_SIZE = int(os.getenv("ACTIVITY_LOG_BATCH_SIZE", "500"))
+    ACTIVITY_LOG_FLUSH_INTERVAL = float(os.getenv("ACTIVITY_LOG_FLUSH_INTERVAL", "2.0"))
+    ACTIVITY_LOG_OVERFLOW = os.getenv("ACTIVITY_LOG_OVERFLOW", "drop_oldest")  # drop_oldest | drop_new | block
+    # Daily partitions: raw rows older than the retention are rolled up per day/action and dropped
+    ACTIVITY_LOG_RETENTION_DAYS = int(os.getenv("ACTIVITY_LOG_RETENTION_DAYS", "90"))  # 0 keeps raw rows forever
+    ACTIVITY_LOG_PARTITIONS_AHEAD = int(os.getenv("ACTIVITY_LOG_PARTITIONS_AHEAD", "3"))
+    ACTIVITY_LOG_MAINTENANCE_INTERVAL = int(os.getenv("ACTIVITY_LOG_MAINTENANCE_INTERVAL", "3600"))
+
+    # Broadcast settings (Telegram allows ~30 msg/s overall and ~1 msg/s per chat)
+    BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "20"))
+    BROADCAST_RATE_LIMIT = float(os.getenv("BROADCAST_RATE_LIMIT", "30"))
+    BROADCAST_PER_CHAT_INTERVAL = float(os.getenv("BROADCAST_PER_CHAT_INTERVAL", "1.0"))
+    BROADCAST_MAX_RETRIES = int(os.getenv("BROADCAST_MAX_RETRIES", "3"))
+    # Seconds between re-reading active users from the database (the bot keeps them in memory)
+    SUBSCRIBERS_RECONCILE_INTERVAL = int(os.getenv("SUBSCRIBERS_RECONCILE_INTERVAL", "600"))
+    # Users who blocked the bot outside a broadcast are deactivated in bulk after this many seconds
+    BLOCKED_USERS_FLUSH_INTERVAL = float(os.getenv("BLOCKED_USERS_FLUSH_INTERVAL", "5"))
+    # Broadcast outbox: recipients per checkpoint, and how old an interrupted broadcast may be to still resume
+    BROADCAST_PAGE_SIZE = int(os.getenv("BROADCAST_PAGE_SIZE", "500"))
+    BROADCAST_RESUME_MAX_AGE = int(os.getenv("BROADCAST_RESUME_MAX_AGE", "3600"))
+    # Seconds a replica's claim on a broadcast it is delivering lasts without renewal; the leader
+    # resumes a broadcast only once its lease has expired
+    BROADCAST_LEASE = int(os.getenv("BROADCAST_LEASE", "60"))
+    # Summaries instead of instant notifications: digest period and the quiet hours users can pick (local time)
+    DIGEST_INTERVAL_HOURS = _hours_dividing_day(os.getenv("DIGEST_INTERVAL_HOURS", "3"))
+    QUIET_HOURS_OPTIONS = _parse_hour_ranges(os.getenv("QUIET_HOURS_OPTIONS", "22-7,23-8,0-6"))
+    # Summaries due while no replica was leading are still sent if they are at most this many hours late
+    DIGEST_CATCH_UP_HOURS = int(os.getenv("DIGEST_CATCH_UP_HOURS", "12"))
+    # Seconds past the hour before summaries go out, so changes being confirmed at the boundary are included
+    DIGEST_DELAY = int(os.getenv("DIGEST_DELAY", "120"))
+
+    # Prometheus metrics endpoint (opt-in)
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "false").lower() == "true"
+    METRICS_HOST = os.getenv("METRICS_HOST", "0.0.0.0")
+    METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
+
+    # Logging: "text" or "json" (one compact object per line); noisy paths log once per interval
+    LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+    LOG_RATE_LIMIT_INTERVAL = float(os.getenv("LOG_RATE_LIMIT_INTERVAL", "10"))
 
     # Sentry configuration
     SENTRY_DSN = os.getenv("SENTRY_DSN")
     SENTRY_ENVIRONMENT = os.getenv("SENTRY_ENVIRONMENT", "production")
     SENTRY_TRACES_SAMPLE_RATE = float(os.getenv("SENTRY_TRACES_SAMPLE_RATE", "0.1"))
 
-# Logging setup with daily rotation
+_log_listener = None
+
+# Logging setup with daily rotation. Called by the entry points rather than on import,
+# so tools that only need Config (e.g. migrate.py) don't create log files and threads.
 def setup_logging():
+    global _log_listener
+    if _log_listener is not None:
+        return
+    from logging.handlers import QueueListener, TimedRotatingFileHandler
+    from logutil import JsonFormatter, StructuredQueueHandler
+
     repo_root = pathlib.Path(__file__).resolve().parent.parent
     log_dir = repo_root / "logs"
     log_dir.mkdir(exist_ok=True)
@@ -65,7 +208,10 @@ def setup_logging():
     log_file = log_dir / f"bot_{datetime.now().strftime('%Y-%m-%d')}.log"
     
     # Formatting setup
-    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if Config.LOG_FORMAT == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
     
     # File handler with daily rotation
     file_handler = TimedRotatingFileHandler(
@@ -81,11 +227,15 @@ def setup_logging():
     console_handler = logging.StreamHandler()
     console_handler.setFormatter(formatter)
     
-    # Root logger setup
+    # Root logger only enqueues records; a listener thread does the disk/stdout writes and
+    # midnight rotation, so logging never blocks the event loop
+    log_queue = queue.SimpleQueue()
+    _log_listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+    _log_listener.start()
+    atexit.register(_log_listener.stop)
+
     root_logger = logging.getLogger()
     root_logger.setLevel(logging.INFO)
-    root_logger.addHandler(file_handler)
-    root_logger.addHandler(console_handler)
+    root_logger.addHandler(StructuredQueueHandler(log_queue))
 
-setup_logging()
 logger = logging.getLogger(__name__)
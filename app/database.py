@@ -1,16 +1,31 @@
+from datetime import date, datetime, time, timedelta, timezone
 from typing import List, Optional
+import asyncio
+import json
 import logging
+import re
 import psycopg
 import pytz
+from psycopg import sql
 from psycopg.rows import dict_row
 from psycopg_pool import AsyncConnectionPool
 from config import Config
+from metrics import track_db
 
 logger = logging.getLogger(__name__)
 
 # Global connection pool
 _pool: Optional[AsyncConnectionPool] = None
 
+# NOTIFY channels; payloads are JSON and delivered when the writing transaction commits
+POWER_EVENTS_CHANNEL = "powerbot_power_events"
+SUBSCRIBERS_CHANNEL = "powerbot_subscribers"
+# NOTIFY payloads must stay under 8000 bytes; bigger changes ask listeners to reload instead
+MAX_NOTIFY_IDS = 500
+
+async def _notify(conn, channel: str, payload: dict):
+    await conn.execute("SELECT pg_notify(%s, %s)", (channel, json.dumps(payload)), prepare=True)
+
 def get_connection_info() -> str:
     return f"host={Config.DB_HOST} port={Config.DB_PORT} dbname={Config.DB_NAME} user={Config.DB_USER} password={Config.DB_PASSWORD}"
 
@@ -21,11 +36,13 @@ async def init_db_pool():
         connection_info = get_connection_info()
         _pool = AsyncConnectionPool(
             conninfo=connection_info,
-            min_size=2,
-            max_size=10,
-            timeout=30,
-            max_idle=300,
-            max_lifetime=3600,
+            min_size=Config.DB_POOL_MIN_SIZE,
+            max_size=Config.DB_POOL_MAX_SIZE,
+            timeout=Config.DB_POOL_TIMEOUT,
+            max_idle=Config.DB_POOL_MAX_IDLE,
+            max_lifetime=Config.DB_POOL_MAX_LIFETIME,
+            # Statements run with prepare=True are prepared on first use; None disables preparing (PgBouncer)
+            kwargs={"prepare_threshold": Config.DB_PREPARE_THRESHOLD},
             open=False,  # Don't auto-open in constructor (deprecated behavior)
         )
         await _pool.open()
@@ -45,10 +62,45 @@ def get_pool() -> AsyncConnectionPool:
         raise RuntimeError("Database pool not initialized. Call init_db_pool() first.")
     return _pool
 
+# Recompute outage_daily_stats for one location and an inclusive range of local days
+REFRESH_DAILY_STATS_SQL = """
+    INSERT INTO outage_daily_stats (location, day, outages_count, downtime_seconds, longest_seconds, updated_at)
+    SELECT
+        %(location)s,
+        d.day,
+        count(o.id) FILTER (WHERE o.started_at >= d.day_start),
+        coalesce(sum(extract(epoch FROM least(o.ended_at, d.day_end) - greatest(o.started_at, d.day_start))), 0)::bigint,
+        coalesce(max(extract(epoch FROM o.duration)) FILTER (WHERE o.started_at >= d.day_start), 0)::bigint,
+        now()
+    FROM (
+        SELECT
+            g.day::date AS day,
+            g.day::timestamp AT TIME ZONE %(tz)s AS day_start,
+            (g.day + interval '1 day')::timestamp AT TIME ZONE %(tz)s AS day_end
+        FROM generate_series(%(first_day)s::date, %(last_day)s::date, interval '1 day') AS g(day)
+    ) d
+    LEFT JOIN outages o
+        ON o.location = %(location)s
+        AND o.ended_at IS NOT NULL
+        AND o.started_at < d.day_end
+        AND o.ended_at > d.day_start
+    GROUP BY d.day, d.day_start, d.day_end
+    ON CONFLICT (location, day) DO UPDATE SET
+        outages_count = EXCLUDED.outages_count,
+        downtime_seconds = EXCLUDED.downtime_seconds,
+        longest_seconds = EXCLUDED.longest_seconds,
+        updated_at = EXCLUDED.updated_at
+"""
+
+def _local_day(value) -> date:
+    return value.astimezone(pytz.timezone(Config.TIMEZONE)).date()
+
+@track_db("add_user")
 async def add_user(user_id: int, username: Optional[str] = None, first_name: Optional[str] = None, last_name: Optional[str] = None):
     pool = get_pool()
-    async with pool.connection() as conn:
+    async with pool.connection() as conn, conn.pipeline():
         async with conn.cursor() as cur:
+            # Upsert, NOTIFY and COMMIT go out in one round trip
             await cur.execute(
                 """
                 INSERT INTO users (telegram_user_id, username, first_name, last_name, is_active)
@@ -60,39 +112,154 @@ async def add_user(user_id: int, username: Optional[str] = None, first_name: Opt
                     last_name = EXCLUDED.last_name,
                     updated_at = NOW()
                 """,
-                (user_id, username, first_name, last_name)
+                (user_id, username, first_name, last_name),
+                prepare=True
             )
+            await _notify(conn, SUBSCRIBERS_CHANNEL, {"op": "add", "user_id": user_id})
             await conn.commit()
 
-async def get_active_users() -> List[int]:
+@track_db("get_active_users")
+async def get_active_users(location: Optional[str] = None) -> List[int]:
+    """Active users in id order; with a location, only those subscribed to it (or to all locations)"""
     pool = get_pool()
     async with pool.connection() as conn:
         async with conn.cursor() as cur:
-            await cur.execute("SELECT telegram_user_id FROM users WHERE is_active = TRUE")
+            if location is None:
+                await cur.execute("SELECT telegram_user_id FROM users WHERE is_active = TRUE ORDER BY telegram_user_id")
+            else:
+                await cur.execute(
+                    """
+                    SELECT u.telegram_user_id FROM users u
+                    WHERE u.is_active = TRUE AND (
+                        NOT EXISTS (SELECT 1 FROM user_locations ul WHERE ul.telegram_user_id = u.telegram_user_id)
+                        OR EXISTS (
+                            SELECT 1 FROM user_locations ul
+                            WHERE ul.telegram_user_id = u.telegram_user_id AND ul.location = %s
+                        )
+                    )
+                    ORDER BY u.telegram_user_id
+                    """,
+                    (location,)
+                )
             rows = await cur.fetchall()
             return [row[0] for row in rows]
 
-async def log_power_event(status: str, timestamp: float):
+@track_db("get_all_user_locations")
+async def get_all_user_locations() -> List[tuple]:
+    """(telegram_user_id, location) rows of every user who limited their locations"""
+    pool = get_pool()
+    async with pool.connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("SELECT telegram_user_id, location FROM user_locations")
+            return await cur.fetchall()
+
+@track_db("set_user_locations")
+async def set_user_locations(user_id: int, locations: List[str]):
+    """Replace the user's location subscriptions (empty list means all locations)"""
+    pool = get_pool()
+    async with pool.connection() as conn, conn.pipeline():
+        async with conn.cursor() as cur:
+            await cur.execute("DELETE FROM user_locations WHERE telegram_user_id = %s", (user_id,))
+            if locations:
+                await cur.executemany(
+                    "INSERT INTO user_locations (telegram_user_id, location) VALUES (%s, %s)",
+                    [(user_id, location) for location in locations]
+                )
+            await _notify(conn, SUBSCRIBERS_CHANNEL, {"op": "locations", "user_id": user_id, "locations": locations})
+            await conn.commit()
+
+@track_db("get_notify_preferences")
+async def get_notify_preferences() -> List[tuple]:
+    """(telegram_user_id, notify_mode, quiet_start, quiet_end) of active users who are not on instant delivery"""
     pool = get_pool()
     async with pool.connection() as conn:
         async with conn.cursor() as cur:
-            from datetime import datetime
-            import pytz
-            kiev_tz = pytz.timezone(Config.TIMEZONE)
-            created_at = datetime.fromtimestamp(timestamp, tz=kiev_tz)
             await cur.execute(
-                "INSERT INTO power_events (state, created_at) VALUES (%s, %s)",
-                (status, created_at)
+                """
+                SELECT telegram_user_id, notify_mode, quiet_start, quiet_end FROM users
+                WHERE notify_mode <> 'instant' AND is_active
+                """
+            )
+            return await cur.fetchall()
+
+@track_db("set_notify_preferences")
+async def set_notify_preferences(user_id: int, mode: str, quiet_start: Optional[int] = None, quiet_end: Optional[int] = None):
+    pool = get_pool()
+    async with pool.connection() as conn, conn.pipeline():
+        async with conn.cursor() as cur:
+            await cur.execute(
+                "UPDATE users SET notify_mode = %s, quiet_start = %s, quiet_end = %s, updated_at = NOW() WHERE telegram_user_id = %s",
+                (mode, quiet_start, quiet_end, user_id)
+            )
+            await _notify(
+                conn, SUBSCRIBERS_CHANNEL,
+                {"op": "prefs", "user_id": user_id, "mode": mode, "quiet_start": quiet_start, "quiet_end": quiet_end}
             )
             await conn.commit()
 
-async def get_last_event() -> Optional[dict]:
+@track_db("log_power_event")
+async def log_power_event(status: str, timestamp: float, location: str = Config.DEFAULT_LOCATION) -> int:
+    """Insert a power event, update outages and return the new event id
+
+    Runs in pipeline mode: the event and outage statements share one round
+    trip, the daily stats refresh, NOTIFY and COMMIT share a second one.
+    """
+    created_at = datetime.fromtimestamp(timestamp, tz=pytz.timezone(Config.TIMEZONE))
+    pool = get_pool()
+    async with pool.connection() as conn, conn.pipeline():
+        event_cur = await conn.execute(
+            "INSERT INTO power_events (state, created_at, location) VALUES (%s, %s, %s) RETURNING id",
+            (status, created_at, location),
+            prepare=True
+        )
+        # Keep the outages table in step within the same transaction
+        if status == "off":
+            await conn.execute(
+                """
+                INSERT INTO outages (location, started_at) VALUES (%s, %s)
+                ON CONFLICT (location) WHERE ended_at IS NULL DO NOTHING
+                """,
+                (location, created_at),
+                prepare=True
+            )
+            outage_cur = None
+        else:
+            outage_cur = await conn.execute(
+                "UPDATE outages SET ended_at = %s WHERE location = %s AND ended_at IS NULL RETURNING started_at",
+                (created_at, location),
+                prepare=True
+            )
+        # Fetching flushes the queued statements and waits for their results
+        event_id = (await event_cur.fetchone())[0]
+        closed = await outage_cur.fetchone() if outage_cur is not None else None
+        if closed:
+            # Roll the finished outage into every local day it touched
+            await conn.execute(
+                REFRESH_DAILY_STATS_SQL,
+                {
+                    "location": location,
+                    "tz": Config.TIMEZONE,
+                    "first_day": _local_day(closed[0]),
+                    "last_day": _local_day(created_at),
+                }
+            )
+        await _notify(
+            conn, POWER_EVENTS_CHANNEL,
+            {"id": event_id, "location": location, "status": status, "timestamp": timestamp}
+        )
+        await conn.commit()
+        return event_id
+
+@track_db("get_last_event")
+async def get_last_event(location: str = Config.DEFAULT_LOCATION) -> Optional[dict]:
     pool = get_pool()
     try:
         async with pool.connection() as conn:
             async with conn.cursor(row_factory=dict_row) as cur:
                 await cur.execute(
-                    "SELECT state, created_at FROM power_events ORDER BY id DESC LIMIT 1"
+                    "SELECT id, state, created_at FROM power_events WHERE location = %s ORDER BY id DESC LIMIT 1",
+                    (location,),
+                    prepare=True
                 )
                 row = await cur.fetchone()
                 if row:
@@ -100,6 +267,7 @@ async def get_last_event() -> Optional[dict]:
                     # Convert to UTC timestamp for consistent comparison
                     created_at_utc = result['created_at'].astimezone(pytz.UTC)
                     return {
+                        'id': result['id'],
                         'status': result['state'],
                         'timestamp': created_at_utc.timestamp()
                     }
@@ -108,37 +276,398 @@ async def get_last_event() -> Optional[dict]:
         logger.exception(f"Error in get_last_event: {e}")
         raise
 
-async def get_power_events(limit: int = 100) -> List[dict]:
+@track_db("get_power_events_between")
+async def get_power_events_between(since: datetime, until: datetime, location: str = Config.DEFAULT_LOCATION) -> tuple[Optional[str], List[dict]]:
+    """State in effect at `since` (None if unknown) and the events in [since, until), oldest first"""
+    pool = get_pool()
+    async with pool.connection() as conn:
+        async with conn.cursor(row_factory=dict_row) as cur:
+            await cur.execute(
+                "SELECT state FROM power_events WHERE location = %s AND created_at < %s ORDER BY created_at DESC, id DESC LIMIT 1",
+                (location, since)
+            )
+            previous = await cur.fetchone()
+            await cur.execute(
+                """
+                SELECT state, created_at FROM power_events
+                WHERE location = %s AND created_at >= %s AND created_at < %s
+                ORDER BY created_at, id
+                """,
+                (location, since, until)
+            )
+            events = [dict(r) for r in await cur.fetchall()]
+            return (previous['state'] if previous else None), events
+
+@track_db("get_outages")
+async def get_outages(limit: int = 10, location: str = Config.DEFAULT_LOCATION) -> List[dict]:
+    """Latest outages for a location, newest first"""
     pool = get_pool()
     async with pool.connection() as conn:
         async with conn.cursor(row_factory=dict_row) as cur:
             await cur.execute(
-                "SELECT state, created_at FROM power_events ORDER BY id DESC LIMIT %s",
-                (limit,)
+                """
+                SELECT started_at, ended_at FROM outages
+                WHERE location = %s
+                ORDER BY started_at DESC
+                LIMIT %s
+                """,
+                (location, limit)
             )
             rows = await cur.fetchall()
             return [dict(r) for r in rows]
 
-async def deactivate_user(user_id: int):
+@track_db("get_open_outage")
+async def get_open_outage(location: str = Config.DEFAULT_LOCATION) -> Optional[dict]:
     pool = get_pool()
     async with pool.connection() as conn:
+        async with conn.cursor(row_factory=dict_row) as cur:
+            await cur.execute(
+                "SELECT started_at FROM outages WHERE location = %s AND ended_at IS NULL",
+                (location,)
+            )
+            row = await cur.fetchone()
+            return dict(row) if row else None
+
+@track_db("get_monitor_states")
+async def get_monitor_states() -> dict:
+    """Checkpointed debounce state per location: {location: (pending_state, pending_count, pending_since)}"""
+    pool = get_pool()
+    async with pool.connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                "SELECT location, pending_state, pending_count, extract(epoch FROM pending_since)::float8 FROM monitor_state"
+            )
+            return {row[0]: (row[1], row[2], row[3]) for row in await cur.fetchall()}
+
+@track_db("save_monitor_state")
+async def save_monitor_state(location: str, pending_state: Optional[str], pending_count: int, pending_since: Optional[float]):
+    pool = get_pool()
+    async with pool.connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                """
+                INSERT INTO monitor_state (location, pending_state, pending_count, pending_since, updated_at)
+                VALUES (%s, %s, %s, to_timestamp(%s), NOW())
+                ON CONFLICT (location) DO UPDATE SET
+                    pending_state = EXCLUDED.pending_state,
+                    pending_count = EXCLUDED.pending_count,
+                    pending_since = EXCLUDED.pending_since,
+                    updated_at = EXCLUDED.updated_at
+                """,
+                (location, pending_state, pending_count, pending_since),
+                prepare=True
+            )
+            await conn.commit()
+
+@track_db("get_daily_stats")
+async def get_daily_stats(first_day: date, last_day: date, location: str = Config.DEFAULT_LOCATION) -> List[dict]:
+    """Rolled-up outage stats for finished outages, one row per local day that has data"""
+    pool = get_pool()
+    async with pool.connection() as conn:
+        async with conn.cursor(row_factory=dict_row) as cur:
+            await cur.execute(
+                """
+                SELECT day, outages_count, downtime_seconds, longest_seconds
+                FROM outage_daily_stats
+                WHERE location = %s AND day BETWEEN %s AND %s
+                ORDER BY day
+                """,
+                (location, first_day, last_day)
+            )
+            rows = await cur.fetchall()
+            return [dict(r) for r in rows]
+
+@track_db("backfill_daily_stats")
+async def backfill_daily_stats():
+    """Roll up outages that predate outage_daily_stats (no-op once the table has rows)"""
+    pool = get_pool()
+    async with pool.connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("SELECT EXISTS (SELECT 1 FROM outage_daily_stats)")
+            if (await cur.fetchone())[0]:
+                return
+            await cur.execute(
+                """
+                SELECT location, min(started_at), max(ended_at) FROM outages
+                WHERE ended_at IS NOT NULL
+                GROUP BY location
+                """
+            )
+            ranges = await cur.fetchall()
+            for location, first, last in ranges:
+                await cur.execute(
+                    REFRESH_DAILY_STATS_SQL,
+                    {"location": location, "tz": Config.TIMEZONE, "first_day": _local_day(first), "last_day": _local_day(last)}
+                )
+            await conn.commit()
+            if ranges:
+                logger.info(f"Outage daily stats backfilled for {len(ranges)} location(s)")
+
+@track_db("deactivate_user")
+async def deactivate_user(user_id: int):
+    pool = get_pool()
+    async with pool.connection() as conn, conn.pipeline():
         async with conn.cursor() as cur:
             await cur.execute(
                 "UPDATE users SET is_active = FALSE WHERE telegram_user_id = %s",
-                (user_id,)
+                (user_id,),
+                prepare=True
             )
+            await _notify(conn, SUBSCRIBERS_CHANNEL, {"op": "remove", "user_ids": [user_id]})
             await conn.commit()
 
-async def log_activity(action: str, user_id: int = None, details: str = None, recipients_count: int = 0):
-    """Log bot activity"""
+@track_db("deactivate_users")
+async def deactivate_users(user_ids: List[int]) -> int:
+    """Deactivate many users in one statement; returns how many were still active"""
+    pool = get_pool()
+    async with pool.connection() as conn, conn.pipeline():
+        async with conn.cursor() as cur:
+            await cur.execute(
+                "UPDATE users SET is_active = FALSE, updated_at = NOW() WHERE telegram_user_id = ANY(%s) AND is_active",
+                (list(user_ids),),
+                prepare=True
+            )
+            if len(user_ids) <= MAX_NOTIFY_IDS:
+                await _notify(conn, SUBSCRIBERS_CHANNEL, {"op": "remove", "user_ids": list(user_ids)})
+            else:
+                await _notify(conn, SUBSCRIBERS_CHANNEL, {"op": "reload"})
+            await conn.commit()
+            # Results are in once COMMIT has synced the pipeline
+            return cur.rowcount
+
+@track_db("create_broadcast_job")
+async def create_broadcast_job(text: str, location: Optional[str], audience: Optional[str], owner: str, lease: float) -> int:
+    """Create a running job leased to `owner` for `lease` seconds"""
     pool = get_pool()
     async with pool.connection() as conn:
         async with conn.cursor() as cur:
             await cur.execute(
                 """
-                INSERT INTO activity_logs (action, user_id, details, recipients_count)
-                VALUES (%s, %s, %s, %s)
+                INSERT INTO broadcast_jobs (text, location, audience, owner, lease_until)
+                VALUES (%s, %s, %s, %s, NOW() + %s * INTERVAL '1 second')
+                RETURNING id
+                """,
+                (text, location, audience, owner, lease)
+            )
+            job_id = (await cur.fetchone())[0]
+            await conn.commit()
+            return job_id
+
+@track_db("update_broadcast_job")
+async def update_broadcast_job(
+    job_id: int, owner: str, last_user_id: Optional[int], sent: int, failed: int, blocked: int, status: str = "running"
+) -> bool:
+    """Save the delivery cursor and counters after a page of recipients
+
+    Returns False if `owner` no longer holds the job (its lease expired and another replica took it over).
+    """
+    pool = get_pool()
+    async with pool.connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                """
+                UPDATE broadcast_jobs
+                SET last_user_id = %s, sent = %s, failed = %s, blocked = %s, status = %s, updated_at = NOW()
+                WHERE id = %s AND owner = %s
+                """,
+                (last_user_id, sent, failed, blocked, status, job_id, owner),
+                prepare=True
+            )
+            await conn.commit()
+            return cur.rowcount == 1
+
+@track_db("renew_broadcast_lease")
+async def renew_broadcast_lease(job_id: int, owner: str, lease: float) -> bool:
+    """Extend `owner`'s lease on a running job; False if the job is no longer theirs"""
+    pool = get_pool()
+    async with pool.connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                """
+                UPDATE broadcast_jobs SET lease_until = NOW() + %s * INTERVAL '1 second'
+                WHERE id = %s AND owner = %s AND status = 'running'
+                """,
+                (lease, job_id, owner),
+                prepare=True
+            )
+            await conn.commit()
+            return cur.rowcount == 1
+
+@track_db("claim_expired_broadcast_jobs")
+async def claim_expired_broadcast_jobs(owner: str, lease: float) -> List[dict]:
+    """Take over running jobs whose owner stopped renewing the lease, oldest first"""
+    pool = get_pool()
+    async with pool.connection() as conn:
+        async with conn.cursor(row_factory=dict_row) as cur:
+            await cur.execute(
+                """
+                UPDATE broadcast_jobs
+                SET owner = %s, lease_until = NOW() + %s * INTERVAL '1 second'
+                WHERE status = 'running' AND lease_until < NOW()
+                RETURNING id, text, location, audience, last_user_id, sent, failed, blocked, created_at
                 """,
-                (action, user_id, details, recipients_count)
+                (owner, lease)
             )
+            jobs = await cur.fetchall()
+            await conn.commit()
+            return sorted(jobs, key=lambda job: job['id'])
+
+@track_db("get_last_digest_slot")
+async def get_last_digest_slot() -> Optional[datetime]:
+    pool = get_pool()
+    async with pool.connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("SELECT max(slot) FROM digest_slots")
+            return (await cur.fetchone())[0]
+
+@track_db("claim_digest_slot")
+async def claim_digest_slot(slot: datetime) -> bool:
+    """Mark a summary slot as handled; False if it already was (e.g. by the previous leader)"""
+    pool = get_pool()
+    async with pool.connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                "INSERT INTO digest_slots (slot) VALUES (%s) ON CONFLICT (slot) DO NOTHING",
+                (slot,)
+            )
+            await conn.commit()
+            return cur.rowcount == 1
+
+@track_db("insert_activity_logs")
+async def insert_activity_logs(rows: List[tuple]):
+    """Write (action, user_id, details, recipients_count, created_at) rows in one COPY"""
+    pool = get_pool()
+    async with pool.connection() as conn:
+        async with conn.cursor() as cur:
+            async with cur.copy(
+                "COPY activity_logs (action, user_id, details, recipients_count, created_at) FROM STDIN"
+            ) as copy:
+                for row in rows:
+                    await copy.write_row(row)
+            await conn.commit()
+
+ACTIVITY_PARTITION_PREFIX = "activity_logs_p"
+# Dropping a partition locks all of activity_logs: give up quickly rather than queue inserts behind it, then retry
+PARTITION_DROP_LOCK_TIMEOUT = "1s"
+PARTITION_DROP_ATTEMPTS = 3
+# pg_get_expr() output for a range partition, e.g. FOR VALUES FROM (MINVALUE) TO ('2026-01-02 00:00:00+00')
+_RANGE_BOUND_RE = re.compile(r"FROM \((?:'([^']+)'|MINVALUE)\) TO \((?:'([^']+)'|MAXVALUE)\)")
+
+# Add raw activity rows older than the cutoff to the per-day per-action rollup
+ACTIVITY_ROLLUP_SQL = """
+    INSERT INTO activity_log_daily (day, action, events_count, recipients_total)
+    SELECT (created_at AT TIME ZONE 'UTC')::date, action, count(*), coalesce(sum(recipients_count), 0)
+    FROM {table}
+    WHERE created_at < %(cutoff)s
+    GROUP BY 1, 2
+    ON CONFLICT (day, action) DO UPDATE SET
+        events_count = activity_log_daily.events_count + EXCLUDED.events_count,
+        recipients_total = activity_log_daily.recipients_total + EXCLUDED.recipients_total
+"""
+
+def _utc_midnight(day: date) -> datetime:
+    return datetime.combine(day, time.min, tzinfo=timezone.utc)
+
+def _parse_bound(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+async def _activity_log_partitions(cur) -> list[tuple[str, Optional[datetime], Optional[datetime], bool]]:
+    """(name, lower, upper, is_default) for every activity_logs partition; None bounds are unbounded"""
+    await cur.execute(
+        """
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'activity_logs'::regclass
+        """
+    )
+    partitions = []
+    for name, bound in await cur.fetchall():
+        match = _RANGE_BOUND_RE.search(bound)
+        if match is None:
+            partitions.append((name, None, None, True))
+        else:
+            partitions.append((name, _parse_bound(match.group(1)), _parse_bound(match.group(2)), False))
+    return partitions
+
+@track_db("create_activity_log_partition")
+async def create_activity_log_partition(day: date) -> bool:
+    """Create the activity_logs partition for one UTC day; returns False if the day is already covered"""
+    start, end = _utc_midnight(day), _utc_midnight(day + timedelta(days=1))
+    pool = get_pool()
+    async with pool.connection() as conn:
+        async with conn.cursor() as cur:
+            for _, lower, upper, is_default in await _activity_log_partitions(cur):
+                if not is_default and (lower is None or lower < end) and (upper is None or upper > start):
+                    return False
+
+            table = sql.Identifier(f"{ACTIVITY_PARTITION_PREFIX}{day:%Y%m%d}")
+            # Rows for this day may already sit in the default partition; move them before attaching
+            await cur.execute(sql.SQL("CREATE TABLE {} (LIKE activity_logs INCLUDING DEFAULTS)").format(table))
+            await cur.execute(
+                sql.SQL(
+                    """
+                    WITH moved AS (
+                        DELETE FROM activity_logs_default
+                        WHERE created_at >= %(start)s AND created_at < %(end)s
+                        RETURNING *
+                    )
+                    INSERT INTO {} SELECT * FROM moved
+                    """
+                ).format(table),
+                {"start": start, "end": end},
+            )
+            await cur.execute(
+                sql.SQL("ALTER TABLE activity_logs ATTACH PARTITION {} FOR VALUES FROM ({}) TO ({})").format(
+                    table, sql.Literal(start), sql.Literal(end)
+                )
+            )
+            await conn.commit()
+            return True
+
+@track_db("expire_activity_logs")
+async def expire_activity_logs(cutoff: datetime) -> int:
+    """Roll up and drop activity_logs partitions that end before the cutoff; returns how many were dropped"""
+    pool = get_pool()
+    async with pool.connection() as conn:
+        async with conn.cursor() as cur:
+            partitions = await _activity_log_partitions(cur)
+
+        dropped = 0
+        for name, _, upper, is_default in partitions:
+            table = sql.Identifier(name)
+            params = {"cutoff": cutoff}
+            async with conn.cursor() as cur:
+                if is_default:
+                    # Only trim the expired rows; the default partition itself stays
+                    await cur.execute(sql.SQL(ACTIVITY_ROLLUP_SQL).format(table=table), params)
+                    await cur.execute(sql.SQL("DELETE FROM {} WHERE created_at < %(cutoff)s").format(table), params)
+                elif upper is not None and upper <= cutoff:
+                    if await _drop_activity_log_partition(conn, cur, table, params):
+                        dropped += 1
+                    continue
+            # Rollup and drop of each partition commit together
+            await conn.commit()
+        return dropped
+
+async def _drop_activity_log_partition(conn, cur, table: sql.Identifier, params: dict) -> bool:
+    """Roll up and drop one partition; False if activity_logs stayed busy for every attempt.
+
+    DROP TABLE takes an ACCESS EXCLUSIVE lock on activity_logs, and inserts
+    queue behind it while it waits. A short lock_timeout bounds that wait.
+    DETACH ... CONCURRENTLY is not an option: activity_logs has a default partition.
+    """
+    for attempt in range(1, PARTITION_DROP_ATTEMPTS + 1):
+        try:
+            await cur.execute(sql.SQL(ACTIVITY_ROLLUP_SQL).format(table=table), params)
+            await cur.execute(sql.SQL("SET LOCAL lock_timeout = {}").format(sql.Literal(PARTITION_DROP_LOCK_TIMEOUT)))
+            await cur.execute(sql.SQL("DROP TABLE {}").format(table))
             await conn.commit()
+            return True
+        except psycopg.errors.LockNotAvailable:
+            # Discards the rollup too, so retrying does not count the rows twice
+            await conn.rollback()
+            logger.warning(f"activity_logs busy, could not drop {table.as_string(conn)} (attempt {attempt}/{PARTITION_DROP_ATTEMPTS})")
+            if attempt < PARTITION_DROP_ATTEMPTS:
+                await asyncio.sleep(attempt)
+    return False
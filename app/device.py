@@ -0,0 +1,105 @@
+import asyncio
+import logging
+import math
+import time
+from typing import TYPE_CHECKING, Optional
+
+from config import Config
+
+if TYPE_CHECKING:
+    from tapo import ApiClient
+
+logger = logging.getLogger(__name__)
+
+
+class DeviceSession:
+    """Long-lived authenticated session with a Tapo plug.
+
+    The KLAP handshake is done once and the handler is reused across probes.
+    The session is dropped and re-established only when a request fails or
+    it is older than `max_age` seconds.
+    """
+
+    def __init__(
+        self,
+        ip: str,
+        email: str,
+        password: str,
+        timeout: float,
+        budget: float,
+        max_attempts: int,
+        retry_delay: float,
+        max_age: float,
+    ):
+        self.ip = ip
+        self.email = email
+        self.password = password
+        self.timeout = timeout
+        self.budget = budget
+        self.max_attempts = max(1, max_attempts)
+        self.retry_delay = retry_delay
+        self.max_age = max_age
+        self._client: Optional["ApiClient"] = None
+        self._device = None
+        self._connected_at: float = 0.0
+        self.last_attempts: int = 0
+
+    def _expired(self) -> bool:
+        return time.monotonic() - self._connected_at > self.max_age
+
+    def reset(self) -> None:
+        """Forget the current handler so the next probe re-handshakes"""
+        self._client = None
+        self._device = None
+        self._connected_at = 0.0
+
+    async def _connect(self, timeout: float) -> None:
+        # Imported on first connect: the `tcp` strategy never needs it and `layered` only once a plug answers
+        from tapo import ApiClient
+
+        self._client = ApiClient(self.email, self.password, timeout_s=max(1, math.ceil(timeout)))
+        self._device = await asyncio.wait_for(self._client.p100(self.ip), timeout=timeout)
+        self._connected_at = time.monotonic()
+        logger.debug(f"Tapo session established with {self.ip}")
+
+    async def probe(self) -> bool:
+        """Return True if the plug answered within the timeout budget"""
+        deadline = time.monotonic() + self.budget
+
+        for attempt in range(self.max_attempts):
+            self.last_attempts = attempt + 1
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                if self._device is None or self._expired():
+                    await self._connect(min(self.timeout, remaining))
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise asyncio.TimeoutError()
+                await asyncio.wait_for(self._device.get_device_info(), timeout=min(self.timeout, remaining))
+                return True
+            except asyncio.TimeoutError:
+                logger.debug(f"Timeout connecting to device (attempt {attempt + 1}/{self.max_attempts})")
+            except Exception as e:
+                logger.debug(f"Error checking device (attempt {attempt + 1}/{self.max_attempts}): {e}")
+
+            self.reset()
+            if attempt < self.max_attempts - 1 and deadline - time.monotonic() > self.retry_delay:
+                await asyncio.sleep(self.retry_delay)
+
+        return False
+
+
+def create_device_session(ip: str) -> DeviceSession:
+    """Build a session for one plug using the probe settings from Config"""
+    return DeviceSession(
+        ip=ip,
+        email=Config.TAPO_EMAIL,
+        password=Config.TAPO_PASSWORD,
+        timeout=Config.TAPO_PROBE_TIMEOUT,
+        budget=Config.TAPO_PROBE_BUDGET,
+        max_attempts=Config.TAPO_PROBE_ATTEMPTS,
+        retry_delay=Config.TAPO_PROBE_RETRY_DELAY,
+        max_age=Config.TAPO_SESSION_MAX_AGE,
+    )
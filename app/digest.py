@@ -0,0 +1,122 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Optional
+
+import pytz
+
+from bot import broadcast_message, get_all_locations, is_multi_location
+from config import Config
+from database import claim_digest_slot, get_last_digest_slot, get_power_events_between
+from stats import format_duration
+from subscribers import AUDIENCE_DIGEST, quiet_audience, subscribers
+
+logger = logging.getLogger(__name__)
+
+
+def due_audiences(hour: int, groups: Iterable[tuple]) -> list[tuple[str, int]]:
+    """(audience, window length in hours) of the summaries due at a local hour"""
+    due = []
+    for mode, quiet_start, quiet_end in groups:
+        if mode == "digest" and hour % Config.DIGEST_INTERVAL_HOURS == 0:
+            due.append((AUDIENCE_DIGEST, Config.DIGEST_INTERVAL_HOURS))
+        elif mode == "quiet" and quiet_end == hour:
+            due.append((quiet_audience(quiet_start, quiet_end), (quiet_end - quiet_start) % 24 or 24))
+    return due
+
+
+async def render_summary(location: str, since: datetime, until: datetime) -> Optional[str]:
+    """One message listing every change at `location` in [since, until); None if nothing changed"""
+    previous, events = await get_power_events_between(since, until, location)
+    if not events:
+        return None
+
+    tz = pytz.timezone(Config.TIMEZONE)
+    lines = []
+    downtime = 0.0
+    state, changed_at = previous, since
+    for event in events:
+        if state == "off":
+            downtime += (event['created_at'] - changed_at).total_seconds()
+        local_time = event['created_at'].astimezone(tz).strftime('%H:%M')
+        if event['state'] == "on":
+            lines.append(f"✅ {local_time} світло з'явилося")
+        else:
+            lines.append(f"❌ {local_time} світло зникло")
+        state, changed_at = event['state'], event['created_at']
+    if state == "off":
+        downtime += (until - changed_at).total_seconds()
+
+    until_str = until.astimezone(tz).strftime('%H:%M')
+    header = f"🗞 **Зведення за {since.astimezone(tz).strftime('%H:%M')}–{until_str}**"
+    if is_multi_location():
+        header = f"📍 **{location}**\n{header}"
+    current = "✅ світло є" if state == "on" else "❌ світла немає"
+    return (
+        f"{header}\n\n" + "\n".join(lines) +
+        f"\n\n🌑 Без світла за цей час: `{format_duration(downtime)}`\n"
+        f"Станом на {until_str}: {current}"
+    )
+
+
+async def send_slot(bot_instance, slot: datetime) -> int:
+    """Send the summaries due at one hour boundary; returns how many messages went out"""
+    hour = slot.astimezone(pytz.timezone(Config.TIMEZONE)).hour
+    texts: dict[tuple[str, datetime], Optional[str]] = {}
+    sent = 0
+    for audience, hours in due_audiences(hour, subscribers.summary_audiences()):
+        since = slot - timedelta(hours=hours)
+        for location in get_all_locations():
+            if not await subscribers.page(location, limit=1, audience=audience):
+                continue
+            # Digest and quiet-hours groups with the same window share one rendered text
+            if (location, since) not in texts:
+                texts[(location, since)] = await render_summary(location, since, slot)
+            text = texts[(location, since)]
+            if text is None:
+                continue
+            stats = await broadcast_message(bot_instance, text, location, audience)
+            sent += stats.sent
+    return sent
+
+
+async def send_due_summaries(bot_instance, now: Optional[datetime] = None) -> int:
+    """Handle every hour boundary since the last one handled (at most DIGEST_CATCH_UP_HOURS back)"""
+    now = now or datetime.now(timezone.utc)
+    # Wait a little past the hour: a change first seen just before it is recorded only once confirmed
+    current = (now - timedelta(seconds=Config.DIGEST_DELAY)).replace(minute=0, second=0, microsecond=0)
+    last = await get_last_digest_slot()
+    slot = current if last is None else max(last + timedelta(hours=1), current - timedelta(hours=Config.DIGEST_CATCH_UP_HOURS))
+
+    sent = 0
+    while slot <= current:
+        # Claimed before sending: after a crash mid-slot a summary is skipped rather than sent twice
+        if await claim_digest_slot(slot):
+            sent += await send_slot(bot_instance, slot)
+        slot += timedelta(hours=1)
+    return sent
+
+
+def seconds_until_next_run(now: float) -> float:
+    """Time until the first `hour boundary + DIGEST_DELAY` strictly after `now` (epoch seconds)"""
+    wake = now - now % 3600 + Config.DIGEST_DELAY
+    while wake <= now:
+        wake += 3600
+    return wake - now
+
+
+async def summary_loop(bot_instance) -> None:
+    """Leader-only: send quiet-hours and digest summaries shortly after every hour boundary
+
+    The first pass runs at once and catches up on every slot after the last
+    claimed one, so a leader starting just after a boundary still sends it.
+    """
+    while True:
+        try:
+            sent = await send_due_summaries(bot_instance)
+            if sent:
+                logger.info(f"Sent {sent} summary message(s)")
+        except Exception as e:
+            logger.error(f"Sending summaries failed: {e}")
+        await asyncio.sleep(seconds_until_next_run(time.time()))
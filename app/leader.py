@@ -0,0 +1,110 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+import psycopg
+
+import database
+from config import Config
+from metrics import IS_LEADER
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderElection:
+    """Session-level Postgres advisory lock deciding which replica runs the leader-only work.
+
+    Every replica keeps trying `pg_try_advisory_lock` on a connection taken
+    from the pool. The winner holds that connection for as long as it leads
+    and pings it every `check_interval` seconds; if the ping fails it stops
+    its leader work at once. Postgres releases the lock when the leader's
+    session ends: immediately on a crash or shutdown, and after the TCP
+    keepalive timeout set on the session if the leader just disappears.
+    A standby then takes over within `poll_interval` seconds.
+    """
+
+    def __init__(self, lock_id: int, poll_interval: float, check_interval: float, keepalive_timeout: int):
+        self.lock_id = lock_id
+        self.poll_interval = poll_interval
+        self.check_interval = check_interval
+        self.keepalive_timeout = keepalive_timeout
+        self.is_leader = False
+
+    async def _set_keepalives(self, conn: psycopg.AsyncConnection) -> None:
+        # Let the server notice a vanished leader (and free the lock) within ~keepalive_timeout seconds
+        idle = max(1, self.keepalive_timeout // 2)
+        interval = max(1, self.keepalive_timeout // 6)
+        await conn.execute(f"SET tcp_keepalives_idle = {idle}")
+        await conn.execute(f"SET tcp_keepalives_interval = {interval}")
+        await conn.execute("SET tcp_keepalives_count = 3")
+
+    async def _try_lock(self, conn: psycopg.AsyncConnection) -> bool:
+        cur = await conn.execute("SELECT pg_try_advisory_lock(%s)", (self.lock_id,))
+        return (await cur.fetchone())[0]
+
+    async def _lead(self, conn: psycopg.AsyncConnection, work: Callable[[], Awaitable[None]]) -> None:
+        """Run `work` until it finishes or the lock connection stops answering"""
+        task = asyncio.create_task(work())
+        try:
+            while True:
+                done, _ = await asyncio.wait({task}, timeout=self.check_interval)
+                if done:
+                    # Leader work is not supposed to return; surface its result or error
+                    return task.result()
+                await asyncio.wait_for(conn.execute("SELECT 1"), timeout=self.check_interval)
+        finally:
+            if not task.done():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+
+    async def run(self, work: Callable[[], Awaitable[None]]) -> None:
+        """Campaign forever; run `work` whenever this replica holds the lock"""
+        pool = database.get_pool()
+        while True:
+            conn = await pool.getconn()
+            try:
+                # The lock connection sits idle for hours: it must not hold a transaction open
+                await conn.set_autocommit(True)
+                if await self._try_lock(conn):
+                    await self._set_keepalives(conn)
+                    self.is_leader = True
+                    IS_LEADER.set(1)
+                    logger.info(f"👑 Acquired leadership (lock {self.lock_id})")
+                    await self._lead(conn, work)
+            # except*: leader work runs in a TaskGroup, so its database errors arrive as an ExceptionGroup
+            except* (psycopg.Error, OSError, TimeoutError) as group:
+                errors = "; ".join(str(e) for e in group.exceptions)
+                if self.is_leader:
+                    logger.error(f"Lost leadership: database connection failed: {errors}")
+                else:
+                    logger.warning(f"Leader election attempt failed: {errors}")
+            finally:
+                was_leader, self.is_leader = self.is_leader, False
+                IS_LEADER.set(0)
+                await self._release(conn, was_leader)
+                await pool.putconn(conn)
+
+            await asyncio.sleep(self.poll_interval)
+
+    async def _release(self, conn: psycopg.AsyncConnection, was_leader: bool) -> None:
+        if conn.broken:
+            return
+        try:
+            if was_leader:
+                await asyncio.wait_for(
+                    conn.execute("SELECT pg_advisory_unlock(%s)", (self.lock_id,)), timeout=self.check_interval
+                )
+                logger.info("Leadership released")
+            await conn.set_autocommit(False)
+        except Exception as e:
+            # The pool discards connections it cannot reset
+            logger.warning(f"Failed to release leader connection cleanly: {e}")
+            await conn.close()
+
+
+leader_election = LeaderElection(
+    lock_id=Config.LEADER_LOCK_ID,
+    poll_interval=Config.LEADER_POLL_INTERVAL,
+    check_interval=Config.LEADER_CHECK_INTERVAL,
+    keepalive_timeout=Config.LEADER_KEEPALIVE_TIMEOUT,
+)
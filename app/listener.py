@@ -0,0 +1,62 @@
+import asyncio
+import json
+import logging
+from typing import Awaitable, Callable
+
+import psycopg
+
+import database
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[dict], Awaitable[None]]
+
+
+class NotificationListener:
+    """Dedicated LISTEN connection dispatching JSON NOTIFY payloads to in-process handlers.
+
+    Notifications sent while the connection is down are lost, so after every
+    (re)connect `on_connect` callbacks resync the in-memory state from the
+    database before new notifications are applied.
+    """
+
+    def __init__(self, reconnect_delay: float):
+        self.reconnect_delay = reconnect_delay
+        self._handlers: dict[str, Handler] = {}
+        self._on_connect: list[Callable[[], Awaitable[None]]] = []
+
+    def subscribe(self, channel: str, handler: Handler) -> None:
+        self._handlers[channel] = handler
+
+    def on_connect(self, callback: Callable[[], Awaitable[None]]) -> None:
+        self._on_connect.append(callback)
+
+    async def _dispatch(self, channel: str, payload: str) -> None:
+        handler = self._handlers.get(channel)
+        if handler is None:
+            return
+        try:
+            await handler(json.loads(payload))
+        except Exception as e:
+            logger.error(f"Failed to handle notification on {channel}: {e}")
+
+    async def run(self) -> None:
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(database.get_connection_info(), autocommit=True) as conn:
+                    for channel in self._handlers:
+                        await conn.execute(f"LISTEN {channel}")
+                    # Anything committed before LISTEN took effect is picked up here
+                    for callback in self._on_connect:
+                        await callback()
+                    logger.info(f"Listening for notifications on {', '.join(self._handlers)}")
+
+                    async for notify in conn.notifies():
+                        await self._dispatch(notify.channel, notify.payload)
+            except (psycopg.Error, OSError) as e:
+                logger.warning(f"Notification listener disconnected: {e}; reconnecting in {self.reconnect_delay}s")
+            await asyncio.sleep(self.reconnect_delay)
+
+
+listener = NotificationListener(reconnect_delay=Config.LISTEN_RECONNECT_DELAY)
@@ -0,0 +1,77 @@
+import copy
+import json
+import logging
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler
+
+
+class JsonFormatter(logging.Formatter):
+    """One compact JSON object per line"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, separators=(",", ":"))
+
+
+class StructuredQueueHandler(QueueHandler):
+    """QueueHandler that keeps the traceback apart from the message.
+
+    The stock prepare() formats the traceback into `msg` and drops exc_info,
+    so formatters behind the QueueListener never see the exception. Here the
+    traceback goes to `exc_text` instead: the text formatter still appends it
+    and JsonFormatter emits it as its own field.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        # Tracebacks hold frames, which must not cross to the listener thread
+        record.exc_info = None
+        return record
+
+
+class RateLimitedLog:
+    """Logs at most one message per key every `interval` seconds and counts the ones it skipped.
+
+    For noisy paths (per-recipient send failures, flood control) where one
+    line per event would flood the log and Sentry during an incident.
+    """
+
+    def __init__(self, logger: logging.Logger, interval: float):
+        self.logger = logger
+        self.interval = interval
+        # key -> (monotonic time of the last emitted message, messages suppressed since)
+        self._state: dict[str, tuple[float, int]] = {}
+
+    def log(self, level: int, key: str, msg: str) -> None:
+        if not self.logger.isEnabledFor(level):
+            return
+        now = time.monotonic()
+        last, suppressed = self._state.get(key, (float("-inf"), 0))
+        if now - last < self.interval:
+            self._state[key] = (last, suppressed + 1)
+            return
+        if suppressed:
+            msg = f"{msg} ({suppressed} similar message(s) suppressed)"
+        self._state[key] = (now, 0)
+        self.logger.log(level, msg)
+
+    def warning(self, key: str, msg: str) -> None:
+        self.log(logging.WARNING, key, msg)
+
+    def error(self, key: str, msg: str) -> None:
+        self.log(logging.ERROR, key, msg)
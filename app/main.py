@@ -2,7 +2,14 @@
 """
 Power Bot - Main Application
 """
+import time
+
+# Time-to-first-check is measured from here, before the heavy imports
+PROCESS_STARTED = time.monotonic()
+
+import argparse
 import asyncio
+import importlib
 import logging
 import sys
 import warnings
@@ -14,10 +21,7 @@ sys.path.insert(0, str(Path(__file__).parent))
 # Hide pydantic warnings about protected namespaces
 warnings.filterwarnings("ignore", message=".*protected namespace.*")
 
-from config import Config
-import sentry_sdk
-from sentry_sdk.integrations.asyncio import AsyncioIntegration
-from sentry_sdk.integrations.logging import LoggingIntegration
+from config import Config, setup_logging
 
 
 def sentry_before_send(event, hint):
@@ -35,8 +39,12 @@ def sentry_before_send(event, hint):
     return event
 
 
-# Initialize Sentry
-if Config.SENTRY_DSN:
+def init_sentry():
+    """Initialize Sentry; the SDK is only imported when SENTRY_DSN is set"""
+    import sentry_sdk
+    from sentry_sdk.integrations.asyncio import AsyncioIntegration
+    from sentry_sdk.integrations.logging import LoggingIntegration
+
     sentry_sdk.init(
         dsn=Config.SENTRY_DSN,
         environment=Config.SENTRY_ENVIRONMENT,
@@ -52,25 +60,86 @@ if Config.SENTRY_DSN:
     )
     logging.info("Sentry initialized")
 
-from bot import start_bot, bot
-from monitor import monitor_loop
-from database import init_db_pool, close_db_pool
+# bot (aiogram) is imported at runtime, see main()
+from monitor import create_monitors, monitor_loop, prefetch_first_probes
+from database import init_db_pool, close_db_pool, backfill_daily_stats, POWER_EVENTS_CHANNEL, SUBSCRIBERS_CHANNEL
+from state import power_state
+from subscribers import subscriber_reconcile_loop, subscribers
+from activity import activity_log_maintenance_loop, activity_writer
+from metrics import start_metrics_server
+from leader import leader_election
+from listener import listener
 
 logger = logging.getLogger(__name__)
 
+# Built once so the first probe can start before the pool is open; reused by every leadership term
+monitors = create_monitors()
+# Only the first leadership term measures time-to-first-check from process start
+first_term_since: float | None = PROCESS_STARTED
+
+async def on_power_event(payload: dict):
+    power_state.apply_event(payload)
+
+async def resync_from_database():
+    """Reload what NOTIFY keeps current; runs whenever the listener (re)connects"""
+    await power_state.load(location for location, _ in Config.DEVICES)
+    await subscribers.load()
+
+async def run_leader_tasks():
+    """Work that must run in exactly one replica at a time"""
+    global first_term_since
+    since, first_term_since = first_term_since or time.monotonic(), None
+    from bot import bot, resume_broadcasts
+    from digest import summary_loop
+    # Another replica may have led until now: start from the database, not from our copies
+    await resync_from_database()
+    # A failure in one cancels the others, so nothing leader-only outlives a crash
+    async with asyncio.TaskGroup() as tasks:
+        tasks.create_task(monitor_loop(bot, monitors, since))
+        # Picks up broadcasts interrupted on any replica once their lease expires
+        tasks.create_task(resume_broadcasts(bot))
+        tasks.create_task(activity_log_maintenance_loop())
+        tasks.create_task(summary_loop(bot))
+
 async def main():
     logger.info("🚀 Starting Power Bot...")
 
+    # The asyncio integration hooks the running loop, so Sentry starts here rather than on import
+    if Config.SENTRY_DSN:
+        init_sentry()
+
+    # aiogram takes seconds to import: load the Telegram side in a thread while the first probes
+    # run and the pool opens, none of which need it
+    bot_import = asyncio.create_task(asyncio.to_thread(importlib.import_module, "bot"))
+    prefetch_first_probes(monitors)
+
     # Initialize database connection pool
     await init_db_pool()
 
+    # First run after the outage_daily_stats migration: roll up existing outages
+    await backfill_daily_stats()
+
+    await bot_import
+    from bot import bot, setup_bot_commands, start_bot
+    commands_task = asyncio.create_task(setup_bot_commands(bot))
+
+    # Every replica answers from in-memory copies; the listener loads them and keeps them current
+    listener.subscribe(POWER_EVENTS_CHANNEL, on_power_event)
+    listener.subscribe(SUBSCRIBERS_CHANNEL, subscribers.apply_notification)
+    listener.on_connect(resync_from_database)
+
+    activity_writer.start()
+    metrics_runner = await start_metrics_server()
+
     try:
         bot_task = asyncio.create_task(start_bot())
-        monitor_task = asyncio.create_task(monitor_loop(bot))
+        leader_task = asyncio.create_task(leader_election.run(run_leader_tasks))
+        reconcile_task = asyncio.create_task(subscriber_reconcile_loop())
+        listener_task = asyncio.create_task(listener.run())
         
         # Wait for tasks with proper error handling
         done, pending = await asyncio.wait(
-            [bot_task, monitor_task],
+            [bot_task, leader_task, reconcile_task, listener_task],
             return_when=asyncio.FIRST_COMPLETED
         )
         
@@ -95,10 +164,26 @@ async def main():
         logger.error(f"Fatal error: {e}")
         raise
     finally:
+        commands_task.cancel()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        # Write queued activity logs and blocked users before the pool goes away
+        await activity_writer.stop()
+        await subscribers.close()
         # Always close the database connection pool
         await close_db_pool()
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Power Bot")
+    parser.add_argument("--profile-startup", action="store_true", help="Print an import-time breakdown of startup and exit")
+    args = parser.parse_args()
+    if args.profile_startup:
+        from profiling import print_startup_profile
+        print_startup_profile()
+        sys.exit(0)
+
+    # Not on import: importing main (e.g. to profile it) must not create log files
+    setup_logging()
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
@@ -0,0 +1,141 @@
+import functools
+import logging
+import time
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, REGISTRY, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from config import Config
+
+if TYPE_CHECKING:
+    from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# Device probes
+PROBE_DURATION = Histogram(
+    "powerbot_probe_duration_seconds", "Time to decide whether a plug is powered",
+    ["location", "result"], buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 3, 5, 7.5, 10, 15, 20),
+)
+PROBE_ATTEMPTS = Histogram(
+    "powerbot_probe_attempts", "Requests sent to the plug per probe",
+    ["location"], buckets=(1, 2, 3, 4, 5),
+)
+
+# Monitoring loop
+CONFIRMATION_DELAY = Histogram(
+    "powerbot_confirmation_delay_seconds", "Time from first detecting a state change to confirming it",
+    ["location"], buckets=(1, 5, 10, 15, 30, 45, 60, 90, 120, 180, 300),
+)
+STATE_CHANGES = Counter("powerbot_state_changes_total", "Confirmed power state changes", ["location", "state"])
+IS_LEADER = Gauge("powerbot_leader", "1 while this replica holds the leader lock and runs the monitor")
+TIME_TO_FIRST_CHECK = Gauge(
+    "powerbot_time_to_first_check_seconds",
+    "Seconds from process start (or from taking over leadership) to the first completed check", ["location"],
+)
+TICK_LAG = Histogram(
+    "powerbot_tick_lag_seconds", "How late a probe tick started compared to its schedule",
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 2, 5, 10, 30),
+)
+
+# Broadcasts
+BROADCAST_DURATION = Histogram(
+    "powerbot_broadcast_duration_seconds", "Time to fan out one broadcast",
+    buckets=(0.1, 0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600, 1200),
+)
+BROADCAST_MESSAGES = Counter("powerbot_broadcast_messages_total", "Broadcast messages by outcome", ["result"])
+BROADCAST_RETRIES = Counter("powerbot_broadcast_retries_total", "Sends retried after Telegram flood control")
+USERS_DEACTIVATED = Counter("powerbot_users_deactivated_total", "Users deactivated after blocking the bot")
+
+# Update handlers
+HANDLER_DURATION = Histogram(
+    "powerbot_handler_duration_seconds", "Update handler latency",
+    ["handler"], buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+HANDLER_ERRORS = Counter("powerbot_handler_errors_total", "Update handlers that raised", ["handler"])
+HANDLER_THROTTLED = Counter("powerbot_handler_throttled_total", "Repeated taps dropped by the per-user cooldown", ["kind"])
+RESPONSE_CACHE_LOOKUPS = Counter(
+    "powerbot_response_cache_lookups_total", "Rendered reply cache lookups by outcome", ["kind", "result"]
+)
+LOOKUPS_COALESCED = Counter(
+    "powerbot_lookups_coalesced_total", "Cache misses that joined an identical load already in flight"
+)
+
+# Database
+DB_QUERY_DURATION = Histogram(
+    "powerbot_db_query_duration_seconds", "Database helper latency (pool wait included)",
+    ["query"], buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+
+
+def track_db(name: str) -> Callable:
+    """Decorator recording the latency of an async database helper"""
+    def decorator(func: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+        histogram = DB_QUERY_DURATION.labels(query=name)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+class PoolStatsCollector:
+    """Exposes AsyncConnectionPool.get_stats() at scrape time"""
+
+    COUNTERS = {
+        "requests_num": "Connection requests served by the pool",
+        "requests_queued": "Connection requests that had to wait",
+        "requests_wait_ms": "Total time spent waiting for a connection, ms",
+        "requests_errors": "Connection requests that failed",
+        "usage_ms": "Total time connections were checked out, ms",
+        "connections_num": "Connections opened",
+        "connections_errors": "Failed connection attempts",
+        "connections_lost": "Connections lost",
+    }
+    GAUGES = {
+        "pool_size": "Current number of connections",
+        "pool_available": "Idle connections",
+        "requests_waiting": "Requests currently waiting for a connection",
+    }
+
+    def describe(self):
+        # Metric names are static; avoids touching the pool at registration time
+        return []
+
+    def collect(self):
+        import database
+        if database._pool is None:
+            return
+        stats = database._pool.get_stats()
+        for key, doc in self.COUNTERS.items():
+            yield CounterMetricFamily(f"powerbot_db_pool_{key}", doc, value=stats.get(key, 0))
+        for key, doc in self.GAUGES.items():
+            yield GaugeMetricFamily(f"powerbot_db_pool_{key}", doc, value=stats.get(key, 0))
+
+
+REGISTRY.register(PoolStatsCollector())
+
+
+async def metrics_handler(request: "web.Request") -> "web.Response":
+    from aiohttp import web
+    return web.Response(body=generate_latest(REGISTRY), headers={"Content-Type": CONTENT_TYPE_LATEST})
+
+
+async def start_metrics_server() -> Optional["web.AppRunner"]:
+    """Serve /metrics on the running event loop if METRICS_ENABLED"""
+    if not Config.METRICS_ENABLED:
+        return None
+    # Imported here: aiohttp is only needed when the endpoint is enabled
+    from aiohttp import web
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, Config.METRICS_HOST, Config.METRICS_PORT).start()
+    logger.info(f"Metrics available on http://{Config.METRICS_HOST}:{Config.METRICS_PORT}/metrics")
+    return runner
@@ -0,0 +1,102 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import Message, TelegramObject
+from metrics import HANDLER_DURATION, HANDLER_ERRORS, HANDLER_THROTTLED
+
+logger = logging.getLogger(__name__)
+
+
+class ConcurrencyLimitMiddleware(BaseMiddleware):
+    """Outer update middleware that lets at most `limit` updates be handled at once"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._semaphore = asyncio.Semaphore(limit)
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        async with self._semaphore:
+            return await handler(event, data)
+
+
+class ThrottleMiddleware(BaseMiddleware):
+    """Outer message middleware dropping a user's repeated identical requests.
+
+    `requests` maps message texts (button labels, "/command") to a request
+    kind. A tap of the same kind by the same user is dropped while the
+    previous one is still being handled (it gets that reply) or less than
+    `cooldown` seconds after it started.
+    """
+
+    def __init__(self, cooldown: float, requests: Dict[str, str]):
+        self.cooldown = cooldown
+        self.requests = requests
+        # (user_id, kind) -> monotonic time the last accepted request started
+        self._last: Dict[tuple[int, str], float] = {}
+        self._in_flight: set[tuple[int, str]] = set()
+
+    def _kind(self, event: TelegramObject) -> Optional[str]:
+        if not isinstance(event, Message) or not event.text or event.from_user is None:
+            return None
+        text = event.text.strip()
+        if text.startswith("/"):
+            # "/status@SomeBot args" -> "/status"
+            text = text.split()[0].split("@")[0]
+        return self.requests.get(text)
+
+    def _prune(self, now: float) -> None:
+        self._last = {slot: started for slot, started in self._last.items() if now - started < self.cooldown}
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        kind = self._kind(event)
+        if kind is None or self.cooldown <= 0:
+            return await handler(event, data)
+
+        slot = (event.from_user.id, kind)
+        now = time.monotonic()
+        if slot in self._in_flight or now - self._last.get(slot, float("-inf")) < self.cooldown:
+            HANDLER_THROTTLED.labels(kind=kind).inc()
+            return None
+
+        if len(self._last) > 10_000:
+            self._prune(now)
+        self._last[slot] = now
+        self._in_flight.add(slot)
+        try:
+            return await handler(event, data)
+        finally:
+            self._in_flight.discard(slot)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Inner middleware timing every message and callback handler"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        handler_object = data.get("handler")
+        name = getattr(getattr(handler_object, "callback", None), "__name__", "unknown")
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.labels(handler=name).inc()
+            raise
+        finally:
+            HANDLER_DURATION.labels(handler=name).observe(time.perf_counter() - started)
@@ -58,11 +58,11 @@ def apply_migration(cur: psycopg.Cursor, path: Path) -> None:
     cur.execute("insert into schema_migrations (filename) values (%s);", (path.name,))
 
 
-def run() -> None:
+def run(connection_info: str | None = None) -> None:
     migrations_dir = Path(__file__).parent / "migrations"
     migrations_dir.mkdir(parents=True, exist_ok=True)
 
-    connection_info = get_connection_info()
+    connection_info = connection_info or get_connection_info()
     with psycopg.connect(connection_info) as conn:
         with conn.cursor() as cur:
             ensure_schema_migrations(cur)
@@ -0,0 +1,16 @@
+-- Several plugs per bot: every power event belongs to a location,
+-- and users can limit notifications to the locations they care about.
+
+alter table power_events add column if not exists location text not null default 'default';
+
+create index if not exists idx_power_events_location_id on power_events (location, id desc);
+
+-- No rows for a user means "all locations"
+create table if not exists user_locations (
+    telegram_user_id bigint not null references users (telegram_user_id) on delete cascade,
+    location text not null,
+    created_at timestamptz not null default now(),
+    primary key (telegram_user_id, location)
+);
+
+create index if not exists idx_user_locations_location on user_locations (location);
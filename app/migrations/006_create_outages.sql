@@ -0,0 +1,38 @@
+-- Outage intervals derived from power_events, maintained by log_power_event.
+-- ended_at is NULL while the outage is still going on.
+
+create table if not exists outages (
+    id bigserial primary key,
+    location text not null default 'default',
+    started_at timestamptz not null,
+    ended_at timestamptz null,
+    duration interval generated always as (ended_at - started_at) stored
+);
+
+create index if not exists idx_outages_location_started_at on outages (location, started_at desc);
+
+-- At most one open outage per location
+create unique index if not exists idx_outages_open on outages (location) where ended_at is null;
+
+-- Backfill: collapse repeated states, then pair every 'off' with the following 'on'
+insert into outages (location, started_at, ended_at)
+select location, created_at, next_created_at
+from (
+    select
+        location,
+        state,
+        created_at,
+        lead(created_at) over (partition by location order by id) as next_created_at
+    from (
+        select
+            id,
+            location,
+            state,
+            created_at,
+            lag(state) over (partition by location order by id) as prev_state
+        from power_events
+    ) events
+    where prev_state is distinct from state
+) transitions
+where state = 'off'
+  and not exists (select 1 from outages);
@@ -0,0 +1,14 @@
+-- Per-day outage rollup (days in the bot's TIMEZONE), maintained by log_power_event
+-- whenever an outage closes. Outages that cross midnight count towards the downtime
+-- of every day they touch, and towards outages_count/longest_seconds of the day they started.
+-- Existing outages are rolled up by the bot on startup.
+
+create table if not exists outage_daily_stats (
+    location text not null,
+    day date not null,
+    outages_count integer not null default 0,
+    downtime_seconds bigint not null default 0,
+    longest_seconds bigint not null default 0,
+    updated_at timestamptz not null default now(),
+    primary key (location, day)
+);
@@ -0,0 +1,54 @@
+-- Partition activity_logs by day (UTC) so old data can be dropped a partition at a time.
+-- The existing table becomes a single partition holding everything up to the end of today;
+-- the bot creates new daily partitions ahead of time and rolls up + drops expired ones.
+
+alter table activity_logs rename to activity_logs_legacy;
+alter index idx_activity_logs_user_id rename to idx_activity_logs_legacy_user_id;
+
+-- Rows without a timestamp cannot be routed to a range partition
+delete from activity_logs_legacy where created_at is null;
+alter table activity_logs_legacy alter column created_at set not null;
+
+-- No primary key: it would have to include created_at and only adds index work on every insert.
+-- Action and time lookups are served by partition pruning and activity_log_daily.
+create table activity_logs (
+    id bigint not null default nextval('activity_logs_id_seq'),
+    action varchar(50) not null,
+    user_id bigint,
+    details text,
+    recipients_count integer default 0,
+    created_at timestamptz not null default now()
+) partition by range (created_at);
+
+alter sequence activity_logs_id_seq owned by activity_logs.id;
+
+create index if not exists idx_activity_logs_user_id on activity_logs (user_id);
+
+alter table activity_logs attach partition activity_logs_legacy
+    for values from (minvalue) to (((now() at time zone 'UTC')::date + 1)::timestamp at time zone 'UTC');
+
+-- Catches rows for days without a partition yet; the bot moves them out when it creates one
+create table if not exists activity_logs_default partition of activity_logs default;
+
+do $$
+declare
+    tomorrow date := (now() at time zone 'UTC')::date + 1;
+begin
+    for i in 0..3 loop
+        execute format(
+            'create table if not exists %I partition of activity_logs for values from (%L) to (%L)',
+            'activity_logs_p' || to_char(tomorrow + i, 'YYYYMMDD'),
+            (tomorrow + i)::timestamp at time zone 'UTC',
+            (tomorrow + i + 1)::timestamp at time zone 'UTC'
+        );
+    end loop;
+end $$;
+
+-- Per-day per-action counts kept after raw rows expire
+create table if not exists activity_log_daily (
+    day date not null,
+    action varchar(50) not null,
+    events_count bigint not null default 0,
+    recipients_total bigint not null default 0,
+    primary key (day, action)
+);
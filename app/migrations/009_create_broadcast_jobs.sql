@@ -0,0 +1,18 @@
+-- Broadcast outbox: one row per broadcast with a delivery cursor (not a row per recipient).
+-- Recipients are walked in telegram_user_id order; `last_user_id` is the cursor: the last id whose page is done,
+-- so an interrupted broadcast resumes after it on the next start.
+
+create table if not exists broadcast_jobs (
+    id bigserial primary key,
+    text text not null,
+    location text null,                       -- NULL = every active user
+    status text not null default 'running',   -- running | done | abandoned
+    last_user_id bigint null,                 -- NULL = nothing delivered yet
+    sent integer not null default 0,
+    failed integer not null default 0,
+    blocked integer not null default 0,
+    created_at timestamptz not null default now(),
+    updated_at timestamptz not null default now()
+);
+
+create index if not exists idx_broadcast_jobs_running on broadcast_jobs (id) where status = 'running';
@@ -0,0 +1,6 @@
+-- Only active users are ever looked up by is_active; a partial index on the id
+-- replaces the low-selectivity boolean index and serves the ordered subscriber load.
+
+drop index if exists idx_users_is_active;
+
+create index if not exists idx_users_active on users (telegram_user_id) where is_active;
@@ -0,0 +1,11 @@
+-- Debounce state of each location's monitor: a suspected power change and how many probes agreed with it so far.
+-- Written only when it changes, read when a monitor starts, so a restart or leader failover in the middle
+-- of a confirmation continues it instead of starting over.
+
+create table if not exists monitor_state (
+    location text primary key,
+    pending_state text null,                  -- on | off; NULL = nothing pending
+    pending_count integer not null default 0,
+    pending_since timestamptz null,           -- when the pending change was first seen
+    updated_at timestamptz not null default now()
+);
@@ -0,0 +1,23 @@
+-- How each user receives power notifications:
+--   instant - every confirmed change right away (default)
+--   quiet   - right away, except during the local quiet hours [quiet_start, quiet_end);
+--             changes in that window are merged into one summary sent at quiet_end
+--   digest  - one summary of all changes every DIGEST_INTERVAL_HOURS
+-- Summaries are rendered from power_events, so nothing is queued per user.
+
+alter table users add column if not exists notify_mode text not null default 'instant'
+    check (notify_mode in ('instant', 'quiet', 'digest'));
+alter table users add column if not exists quiet_start smallint null check (quiet_start between 0 and 23);
+alter table users add column if not exists quiet_end smallint null check (quiet_end between 0 and 23);
+
+-- Only the few non-instant users are loaded into memory
+create index if not exists idx_users_notify_mode on users (telegram_user_id) where notify_mode <> 'instant';
+
+-- Which preference group a broadcast goes to; NULL = every recipient (admin broadcasts)
+alter table broadcast_jobs add column if not exists audience text null;
+
+-- Summary slots (hour boundaries) already handled, so a restart or failover never sends one twice
+create table if not exists digest_slots (
+    slot timestamptz primary key,
+    created_at timestamptz not null default now()
+);
@@ -0,0 +1,7 @@
+-- Which replica is delivering a running broadcast, and until when its claim holds.
+-- The delivering replica renews lease_until while it sends; only jobs whose lease has expired
+-- (the owner crashed or was stopped mid-broadcast) are resumed, by the leader.
+
+alter table broadcast_jobs add column if not exists owner text null;
+-- Jobs running before this migration count as expired, so they resume as before
+alter table broadcast_jobs add column if not exists lease_until timestamptz not null default now();
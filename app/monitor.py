@@ -2,129 +2,290 @@ import asyncio
 import time
 import logging
 import random
-from tapo import ApiClient
+from typing import Optional
 from config import Config
-from database import log_power_event, get_last_event
+from probes import Probe, create_probe
+from metrics import CONFIRMATION_DELAY, PROBE_ATTEMPTS, PROBE_DURATION, STATE_CHANGES, TICK_LAG, TIME_TO_FIRST_CHECK
+from activity import log_activity
+from database import get_monitor_states, save_monitor_state
+from state import power_state
+from stats import format_duration
+from subscribers import instant_audience
 
 logger = logging.getLogger(__name__)
 
-async def check_plug_status() -> bool:
+async def check_plug_status(session: Probe, location: str = Config.DEFAULT_LOCATION) -> bool:
     if Config.TEST_MODE:
         # Test mode: simulate random power state changes
         return random.choice([True, False])
-    
-    max_retries = 3
-    
-    for attempt in range(max_retries):
-        client = None
+
+    started = time.perf_counter()
+    result = await session.probe()
+    PROBE_DURATION.labels(location=location, result="on" if result else "off").observe(time.perf_counter() - started)
+    PROBE_ATTEMPTS.labels(location=location).observe(getattr(session, "last_attempts", 1))
+    return result
+
+def build_change_message(location: str, current_state: bool, time_str: str) -> str:
+    if current_state:
+        msg = f"✅ **Світло З'ЯВИЛОСЯ!**\n\n🌑 Світло було вимкнено: `{time_str}`"
+    else:
+        msg = f"❌ **Світло ЗНИКЛО!**\n\n💡 Було доступне: `{time_str}`"
+
+    if len(Config.DEVICES) > 1:
+        msg = f"📍 **{location}**\n{msg}"
+    return msg
+
+
+class Debouncer:
+    """Confirms a state change once `required` consecutive probes agree on it.
+
+    The state is three plain values, so it is cheap to checkpoint whenever it
+    changes and to restore when a monitor starts again.
+    """
+
+    def __init__(self, required: int):
+        self.required = required
+        self.pending_state: Optional[str] = None
+        self.pending_count: int = 0
+        self.pending_since: Optional[float] = None  # Wall-clock time the pending change was first seen
+
+    @property
+    def confirmed(self) -> bool:
+        return self.pending_state is not None and self.pending_count >= self.required
+
+    def observe(self, status: str) -> bool:
+        """Count a probe that disagrees with the recorded state; True if it starts a new pending change"""
+        if self.pending_state == status:
+            self.pending_count += 1
+            return False
+        self.pending_state = status
+        self.pending_count = 1
+        self.pending_since = time.time()
+        return True
+
+    def reset(self) -> None:
+        self.pending_state = None
+        self.pending_count = 0
+        self.pending_since = None
+
+    def snapshot(self) -> tuple:
+        return self.pending_state, self.pending_count, self.pending_since
+
+    def restore(self, snapshot: tuple) -> None:
+        self.pending_state, self.pending_count, self.pending_since = snapshot
+
+
+class DeviceMonitor:
+    """Probe and debounce state machine for a single plug"""
+
+    def __init__(self, location: str, session: Probe):
+        self.location = location
+        self.session = session
+        self.debouncer = Debouncer(Config.CONFIRMATION_CHECKS)
+        # Last snapshot written to monitor_state; checkpoints are skipped while it is unchanged
+        self._saved: tuple = self.debouncer.snapshot()
+        self._prefetch: Optional[asyncio.Task] = None
+        # Adaptive cadence: current steady-state interval and when the state last moved
+        self.interval: float = Config.CHECK_INTERVAL
+        self.stable_since: float = time.monotonic()
+
+    def mark_unstable(self) -> None:
+        self.interval = Config.CHECK_INTERVAL
+        self.stable_since = time.monotonic()
+
+    def next_interval(self) -> float:
+        if Config.TEST_MODE:
+            # In test mode, use random interval between 2-3 minutes
+            return random.randint(120, 180)
+
+        if self.debouncer.pending_state is not None:
+            # Confirm suspected changes quickly, independently of the steady-state cadence
+            return min(Config.CONFIRMATION_INTERVAL, Config.CHECK_INTERVAL)
+
+        if time.monotonic() - self.stable_since >= Config.BACKOFF_AFTER:
+            # Long stable period: slow down step by step, never below CHECK_INTERVAL
+            self.interval = max(Config.CHECK_INTERVAL, min(self.interval * Config.BACKOFF_FACTOR, Config.MAX_CHECK_INTERVAL))
+        return self.interval
+
+    def restore(self, snapshot: Optional[tuple]) -> None:
+        """Continue a confirmation checkpointed by a previous process or leader"""
+        self.debouncer.reset()
+        self._saved = snapshot or self.debouncer.snapshot()
+        if snapshot is None or snapshot[0] is None:
+            return
+        age = time.time() - (snapshot[2] or 0)
+        if age > Config.PENDING_STATE_MAX_AGE:
+            logger.info(f"[{self.location}] Dropping pending change to {snapshot[0]} seen {age:.0f}s ago")
+            return
+        self.debouncer.restore(snapshot)
+        self.mark_unstable()
+        logger.info(f"[{self.location}] Restored pending change to {snapshot[0]} ({snapshot[1]}/{self.debouncer.required} checks)")
+
+    async def checkpoint(self) -> None:
+        """Save the debounce state if it changed since the last save"""
+        snapshot = self.debouncer.snapshot()
+        if snapshot == self._saved:
+            return
         try:
-            client = ApiClient(Config.TAPO_EMAIL, Config.TAPO_PASSWORD)
-            device = await asyncio.wait_for(client.p100(Config.DEVICE_IP), timeout=5.0)
-            await asyncio.wait_for(device.get_device_info(), timeout=5.0)
-            return True
-        except asyncio.TimeoutError:
-            logger.debug(f"Timeout connecting to device (attempt {attempt + 1}/{max_retries})")
-            if attempt < max_retries - 1:
-                await asyncio.sleep(1)
-            continue
+            await save_monitor_state(self.location, *snapshot)
+            self._saved = snapshot
         except Exception as e:
-            logger.debug(f"Error checking device (attempt {attempt + 1}/{max_retries}): {e}")
-            if attempt < max_retries - 1:
-                await asyncio.sleep(1)
-            continue
-        finally:
-            if client:
-                try:
-                    await client.close()
-                except:
-                    pass  # Ignore errors during cleanup
-    
-    return False
-
-def format_duration(seconds: float) -> str:
-    hours, rem = divmod(int(seconds), 3600)
-    minutes, _ = divmod(rem, 60)
-    return f"{hours}h {minutes}m"
-
-async def monitor_loop(bot):
-    if Config.TEST_MODE:
-        logger.info("🚀 Monitoring started in TEST MODE (simulating power changes)")
-    else:
-        logger.info(f"🚀 Monitoring started on {Config.DEVICE_IP}")
-    
-    pending_state: str | None = None
-    pending_count: int = 0
-    pending_first_time: float | None = None
-    
+            logger.warning(f"[{self.location}] Failed to save debounce state: {e}")
+
+    def prefetch(self, semaphore: asyncio.Semaphore) -> None:
+        """Start the first probe early, e.g. while the database pool is still opening"""
+        self._prefetch = asyncio.create_task(self._prefetch_probe(semaphore))
+
+    async def _prefetch_probe(self, semaphore: asyncio.Semaphore) -> Optional[tuple]:
+        try:
+            async with semaphore:
+                return await check_plug_status(self.session, self.location), time.monotonic()
+        except Exception as e:
+            logger.warning(f"[{self.location}] Early probe failed: {e}")
+            return None
+
+    async def probe(self) -> bool:
+        prefetch, self._prefetch = self._prefetch, None
+        if prefetch is not None:
+            result = await prefetch
+            # A standby replica may take over long after its early probe; don't act on a stale answer
+            if result is not None and time.monotonic() - result[1] < Config.CHECK_INTERVAL:
+                return result[0]
+        return await check_plug_status(self.session, self.location)
+
+    async def check(self, bot, notify_tasks: set) -> None:
+        current_state = await self.probe()
+        current_status_str = "on" if current_state else "off"
+
+        last_event = await power_state.get_last_event(self.location)
+
+        if not last_event:
+            now = time.time()
+            await power_state.record_event(current_status_str, now, self.location)
+            logger.info(f"[{self.location}] First event recorded: {current_status_str}")
+            self.debouncer.reset()
+            return
+
+        last_state_str = last_event.get('status')
+        last_time = last_event.get('timestamp')
+
+        if current_status_str == last_state_str:
+            if self.debouncer.pending_state is not None:
+                logger.info(f"[{self.location}] State change cancelled: was pending {self.debouncer.pending_state}, but current is {current_status_str}")
+                self.debouncer.reset()
+            return
+
+        if self.debouncer.observe(current_status_str):
+            self.mark_unstable()
+            logger.info(f"[{self.location}] State change detected: {last_state_str} -> {current_status_str}, waiting for confirmation ({Config.CONFIRMATION_CHECKS} checks)")
+
+        if not self.debouncer.confirmed:
+            return
+
+        now = self.debouncer.pending_since or time.time()
+        CONFIRMATION_DELAY.labels(location=self.location).observe(time.time() - now)
+        STATE_CHANGES.labels(location=self.location, state=current_status_str).inc()
+        time_str = format_duration(now - last_time)
+        msg = build_change_message(self.location, current_state, time_str)
+
+        logger.info(f"[{self.location}] State change confirmed: {last_state_str} -> {current_status_str}")
+
+        await power_state.record_event(current_status_str, now, self.location)
+        self.debouncer.reset()
+
+        # Fan-out can take a while; run it outside the probe schedule so ticks don't drift
+        task = asyncio.create_task(self.notify(bot, msg, current_status_str, time_str, instant_audience(now)))
+        notify_tasks.add(task)
+        task.add_done_callback(notify_tasks.discard)
+
+    async def notify(self, bot, msg: str, status: str, time_str: str, audience: str) -> None:
+        from bot import broadcast_message
+        try:
+            # Quiet-hours and digest users get this change in their next summary instead
+            await broadcast_message(bot, msg, self.location, audience)
+
+            # Log power state change notification
+            await log_activity("power_change_notification", details=f"Location: {self.location}, State: {status}, Duration: {time_str}")
+        except Exception as e:
+            logger.exception(f"[{self.location}] Failed to send power change notification: {e}")
+
+
+async def run_device(monitor: DeviceMonitor, bot, semaphore: asyncio.Semaphore, offset: float, notify_tasks: set, since: float) -> None:
+    loop = asyncio.get_running_loop()
+    next_tick = loop.time() + offset
+    first_check = True
+
     while True:
+        delay = next_tick - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        TICK_LAG.observe(max(0.0, loop.time() - next_tick))
+
         try:
-            current_state = await check_plug_status()
-            current_status_str = "on" if current_state else "off"
-
-            last_event = await get_last_event()
-            
-            if not last_event:
-                now = time.time()
-                await log_power_event(current_status_str, now)
-                logger.info(f"First event recorded: {current_status_str}")
-                pending_state = None
-                pending_count = 0
-            else:
-                last_state_str = last_event.get('status')
-                last_time = last_event.get('timestamp')
-                
-                if current_status_str != last_state_str:
-                    if pending_state == current_status_str:
-                        pending_count += 1
-                    else:
-                        pending_state = current_status_str
-                        pending_count = 1
-                        pending_first_time = time.time()
-                        logger.info(f"State change detected: {last_state_str} -> {current_status_str}, waiting for confirmation ({Config.CONFIRMATION_CHECKS} checks)")
-                    
-                    if pending_count >= Config.CONFIRMATION_CHECKS:
-                        now = pending_first_time if pending_first_time else time.time()
-                        duration = now - last_time
-                        time_str = format_duration(duration)
-                        
-                        if current_state:
-                            msg = f"✅ **Світло З'ЯВИЛОСЯ!**\n\n🌑 Світло було вимкнено: `{time_str}`"
-                        else:
-                            msg = f"❌ **Світло ЗНИКЛО!**\n\n💡 Було доступне: `{time_str}`"
-                        
-                        logger.info(f"State change confirmed: {last_state_str} -> {current_status_str}")
-                        
-                        await log_power_event(current_status_str, now)
-                        
-                        from bot import broadcast_message
-                        await broadcast_message(bot, msg)
-                        
-                        # Log power state change notification
-                        from database import log_activity
-                        await log_activity("power_change_notification", details=f"State: {current_status_str}, Duration: {time_str}")
-                        
-                        pending_state = None
-                        pending_count = 0
-                        pending_first_time = None
-                else:
-                    if pending_state is not None:
-                        logger.info(f"State change cancelled: was pending {pending_state}, but current is {current_status_str}")
-                        pending_state = None
-                        pending_count = 0
-                        pending_first_time = None
-        
+            async with semaphore:
+                await monitor.check(bot, notify_tasks)
         except asyncio.CancelledError:
-            logger.info("Monitoring stopped")
             raise
         except Exception as e:
-            logger.exception(f"Error in monitoring loop: {e}")
-        
-        if Config.TEST_MODE:
-            # In test mode, use random interval between 2-3 minutes
-            sleep_time = random.randint(120, 180)
-            logger.info(f"Test mode: next check in {sleep_time//60}m {sleep_time%60}s")
-            await asyncio.sleep(sleep_time)
-        else:
-            await asyncio.sleep(Config.CHECK_INTERVAL)
-        
-        
+            logger.exception(f"[{monitor.location}] Error in monitoring loop: {e}")
+        await monitor.checkpoint()
+
+        if first_check:
+            first_check = False
+            elapsed = time.monotonic() - since
+            TIME_TO_FIRST_CHECK.labels(location=monitor.location).set(elapsed)
+            logger.info(f"[{monitor.location}] First check done {elapsed:.2f}s after start")
+
+        # Schedule against absolute deadlines so slow probes don't accumulate drift
+        interval = monitor.next_interval()
+        next_tick += interval
+        now = loop.time()
+        if next_tick < now:
+            skipped = int((now - next_tick) // interval) + 1
+            logger.warning(f"[{monitor.location}] Probe fell behind schedule, skipping {skipped} tick(s)")
+            next_tick += skipped * interval
+
+def create_monitors() -> list[DeviceMonitor]:
+    return [DeviceMonitor(location, create_probe(ip)) for location, ip in Config.DEVICES]
+
+def prefetch_first_probes(monitors: list[DeviceMonitor]) -> None:
+    """Probe every plug right away so the first check does not wait for the rest of startup"""
+    semaphore = asyncio.Semaphore(Config.MAX_CONCURRENT_PROBES)
+    for monitor in monitors:
+        monitor.prefetch(semaphore)
+
+async def monitor_loop(bot, monitors: Optional[list[DeviceMonitor]] = None, since: Optional[float] = None):
+    """Probe every plug until cancelled; `since` is the monotonic time time-to-first-check is measured from"""
+    devices = Config.DEVICES
+    since = since if since is not None else time.monotonic()
+    if Config.TEST_MODE:
+        logger.info(f"🚀 Monitoring started in TEST MODE for {len(devices)} location(s) (simulating power changes)")
+    else:
+        logger.info(f"🚀 Monitoring started on {', '.join(f'{location} ({ip})' for location, ip in devices)}")
+
+    semaphore = asyncio.Semaphore(Config.MAX_CONCURRENT_PROBES)
+    notify_tasks: set = set()
+    monitors = monitors if monitors is not None else create_monitors()
+
+    saved = await get_monitor_states()
+    for monitor in monitors:
+        monitor.restore(saved.get(monitor.location))
+
+    # Spread probes evenly across the interval instead of firing them all at once
+    stagger = Config.CHECK_INTERVAL / len(monitors)
+    tasks = [
+        asyncio.create_task(run_device(monitor, bot, semaphore, idx * stagger, notify_tasks, since))
+        for idx, monitor in enumerate(monitors)
+    ]
+
+    try:
+        await asyncio.gather(*tasks)
+    except asyncio.CancelledError:
+        logger.info("Monitoring stopped")
+        raise
+    finally:
+        for task in tasks:
+            task.cancel()
+        # A replica that lost leadership must not keep broadcasting; the new leader resumes from the outbox
+        for task in list(notify_tasks):
+            task.cancel()
@@ -0,0 +1,126 @@
+import asyncio
+import logging
+import os
+import socket
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from aiogram import Bot
+from broadcast import BroadcastStats, Broadcaster, broadcaster
+from config import Config
+from database import claim_expired_broadcast_jobs, create_broadcast_job, renew_broadcast_lease, update_broadcast_job
+from subscribers import subscribers
+
+logger = logging.getLogger(__name__)
+
+
+class BroadcastOutbox:
+    """Durable broadcasts: a job row with a delivery cursor instead of a row per recipient.
+
+    Recipients are loaded `page_size` at a time in telegram_user_id order and
+    the cursor is saved after each page, so a restart resumes where delivery
+    stopped and re-sends at most one page. Jobs older than `resume_max_age`
+    seconds are abandoned rather than resumed, so stale alerts are not sent.
+
+    The replica delivering a job holds a lease on it, renewed every third of
+    `lease` seconds. Only jobs whose lease expired are resumed, so a broadcast
+    still being sent by another replica (e.g. an admin /broadcast handled by a
+    standby) is not delivered twice. A replica that finds its lease taken over
+    stops delivering.
+    """
+
+    def __init__(self, sender: Broadcaster, page_size: int, resume_max_age: float, lease: float):
+        self.sender = sender
+        self.page_size = max(1, page_size)
+        self.resume_max_age = resume_max_age
+        self.lease = lease
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+
+    async def send(
+        self, bot_instance: Bot, text: str, location: Optional[str] = None, audience: Optional[str] = None
+    ) -> BroadcastStats:
+        job_id = await create_broadcast_job(text, location, audience, self.owner, self.lease)
+        return await self._deliver(bot_instance, job_id, text, location, audience, None, BroadcastStats())
+
+    async def pending_jobs(self) -> list[dict]:
+        """Claim interrupted jobs (lease expired) that are still worth finishing"""
+        jobs = []
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=self.resume_max_age)
+        for job in await claim_expired_broadcast_jobs(self.owner, self.lease):
+            if job['created_at'] < cutoff:
+                logger.warning(f"Abandoning broadcast job {job['id']} from {job['created_at']}: too old to resume")
+                await update_broadcast_job(
+                    job['id'], self.owner, job['last_user_id'], job['sent'], job['failed'], job['blocked'],
+                    status="abandoned"
+                )
+            else:
+                jobs.append(job)
+        return jobs
+
+    async def resume(self, bot_instance: Bot, job: dict) -> BroadcastStats:
+        logger.info(f"Resuming broadcast job {job['id']} after user {job['last_user_id']}")
+        stats = BroadcastStats(sent=job['sent'], failed=job['failed'], blocked=job['blocked'])
+        stats.total = stats.sent + stats.failed + stats.blocked
+        return await self._deliver(
+            bot_instance, job['id'], job['text'], job['location'], job['audience'], job['last_user_id'], stats
+        )
+
+    async def _keep_lease(self, job_id: int) -> None:
+        """Renew the lease until cancelled; returns if another replica took the job over"""
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            try:
+                if not await renew_broadcast_lease(job_id, self.owner, self.lease):
+                    logger.warning(f"Lost the lease on broadcast job {job_id}, stopping delivery")
+                    return
+            except Exception as e:
+                # Keep delivering: the lease only lapses if renewals fail for the whole `lease`
+                logger.warning(f"Failed to renew the lease on broadcast job {job_id}: {e}")
+
+    async def _deliver(
+        self,
+        bot_instance: Bot,
+        job_id: int,
+        text: str,
+        location: Optional[str],
+        audience: Optional[str],
+        cursor: Optional[int],
+        stats: BroadcastStats,
+    ) -> BroadcastStats:
+        lease = asyncio.create_task(self._keep_lease(job_id))
+        try:
+            while True:
+                if lease.done():
+                    # Another replica owns the job now and continues from the saved cursor
+                    return stats
+                page = await subscribers.page(location, after=cursor, limit=self.page_size, audience=audience)
+                if not page:
+                    break
+                await self.sender.broadcast(bot_instance, page, text, stats)
+                # One UPDATE for every chat in the page that blocked the bot
+                blocked, stats.blocked_ids = stats.blocked_ids, []
+                try:
+                    stats.deactivated += await subscribers.deactivate_users(blocked)
+                except Exception as e:
+                    # Bookkeeping must not stop delivery: the delayed bulk flush retries these
+                    logger.error(f"Failed to deactivate {len(blocked)} blocked user(s) of job {job_id}: {e}")
+                    for user_id in blocked:
+                        subscribers.mark_blocked(user_id)
+                cursor = page[-1]
+                if len(page) < self.page_size:
+                    break
+                if not await update_broadcast_job(job_id, self.owner, cursor, stats.sent, stats.failed, stats.blocked):
+                    logger.warning(f"Broadcast job {job_id} was taken over by another replica, stopping delivery")
+                    return stats
+        finally:
+            lease.cancel()
+
+        await update_broadcast_job(job_id, self.owner, cursor, stats.sent, stats.failed, stats.blocked, status="done")
+        return stats
+
+broadcast_outbox = BroadcastOutbox(
+    sender=broadcaster,
+    page_size=Config.BROADCAST_PAGE_SIZE,
+    resume_max_age=Config.BROADCAST_RESUME_MAX_AGE,
+    lease=Config.BROADCAST_LEASE,
+)
@@ -0,0 +1,103 @@
+import asyncio
+import errno
+import logging
+import time
+from typing import Optional, Protocol
+
+from config import Config
+from device import create_device_session
+
+logger = logging.getLogger(__name__)
+
+# Errors meaning "nothing at that address answered"
+UNREACHABLE_ERRNOS = {errno.EHOSTUNREACH, errno.ENETUNREACH, errno.EHOSTDOWN}
+
+
+class Probe(Protocol):
+    """Anything that can tell whether a plug is powered"""
+
+    async def probe(self) -> bool: ...
+
+
+class TcpProbe:
+    """Non-blocking TCP connect to the plug: cheap liveness check without authentication"""
+
+    def __init__(self, ip: str, port: int, timeout: float):
+        self.ip = ip
+        self.port = port
+        self.timeout = timeout
+        self.last_attempts = 1
+
+    async def check(self) -> Optional[bool]:
+        """True if the host answered, False if it did not, None if the result is ambiguous"""
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_connection(self.ip, self.port), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            return False
+        except ConnectionRefusedError:
+            # A RST still means the plug's network stack is powered
+            return True
+        except OSError as e:
+            if e.errno in UNREACHABLE_ERRNOS:
+                return False
+            logger.debug(f"TCP probe to {self.ip}:{self.port} failed: {e}")
+            return None
+
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except Exception:
+            pass
+        return True
+
+    async def probe(self) -> bool:
+        return bool(await self.check())
+
+
+class LayeredProbe:
+    """TCP pre-probe first, authenticated Tapo request only when needed.
+
+    A failed TCP connect is a fast "off". A successful one is trusted as "on"
+    as long as the last authenticated check succeeded less than
+    `full_interval` seconds ago; otherwise (and when the TCP result is
+    ambiguous) the full Tapo request decides.
+    """
+
+    def __init__(self, cheap: TcpProbe, full: Probe, full_interval: float):
+        self.cheap = cheap
+        self.full = full
+        self.full_interval = full_interval
+        self.last_attempts = 1
+        self._last_full_at = 0.0
+        self._last_full_ok = False
+
+    async def probe(self) -> bool:
+        quick = await self.cheap.check()
+        self.last_attempts = 1
+        if quick is False:
+            # Power came back? Make the next positive answer go through the full check
+            self._last_full_ok = False
+            return False
+
+        if quick and self._last_full_ok and time.monotonic() - self._last_full_at < self.full_interval:
+            return True
+
+        result = await self.full.probe()
+        self.last_attempts = 1 + getattr(self.full, "last_attempts", 1)
+        self._last_full_at = time.monotonic()
+        self._last_full_ok = result
+        return result
+
+
+def create_probe(ip: str) -> Probe:
+    """Build the probe selected by PROBE_STRATEGY for one plug"""
+    strategy = Config.PROBE_STRATEGY
+    if strategy == "tapo":
+        return create_device_session(ip)
+
+    tcp = TcpProbe(ip, Config.PROBE_TCP_PORT, Config.PROBE_TCP_TIMEOUT)
+    if strategy == "tcp":
+        return tcp
+    if strategy == "layered":
+        return LayeredProbe(tcp, create_device_session(ip), Config.PROBE_FULL_INTERVAL)
+    raise ValueError(f"Unknown PROBE_STRATEGY: {strategy}")
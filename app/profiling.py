@@ -0,0 +1,67 @@
+import re
+import subprocess
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+from config import Config
+
+# -X importtime line: "import time:       530 |      61323 |   asyncio" (self us, cumulative us, indented name)
+_IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$")
+
+
+def startup_modules() -> list[str]:
+    """Modules a normal start imports, including the ones main() loads lazily"""
+    # main imports without side effects; the logging setup it runs at start is imported separately
+    modules = ["main", "logging.handlers", "logutil", "bot"]
+    if Config.PROBE_STRATEGY != "tcp":
+        modules.append("tapo")
+    if Config.BOT_MODE == "webhook":
+        modules.append("webhook")
+    if Config.SENTRY_DSN:
+        modules += ["sentry_sdk", "sentry_sdk.integrations.asyncio", "sentry_sdk.integrations.logging"]
+    return modules
+
+
+def import_times(modules: list[str]) -> list[tuple[str, int, int, int]]:
+    """Import `modules` in a fresh interpreter under -X importtime.
+
+    Returns (module, depth, self_us, cumulative_us) in the order the imports finished.
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {', '.join(modules)}"],
+        cwd=Path(__file__).parent,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"Importing {', '.join(modules)} failed:\n{proc.stderr[-2000:]}")
+
+    rows = []
+    for line in proc.stderr.splitlines():
+        match = _IMPORTTIME_RE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            rows.append((name, len(indent) // 2, int(self_us), int(cumulative_us)))
+    return rows
+
+
+def print_startup_profile(top: int = 15) -> None:
+    """Print the cold-start import cost, by package and by slowest top-level import"""
+    rows = import_times(startup_modules())
+    total_us = sum(self_us for _, _, self_us, _ in rows)
+
+    by_package: dict[str, int] = defaultdict(int)
+    for name, _, self_us, _ in rows:
+        by_package[name.split(".")[0]] += self_us
+
+    print(f"Startup imports: {total_us / 1000:.1f} ms in {len(rows)} modules (Python {sys.version.split()[0]})")
+    print()
+    print("By package (self time):")
+    for package, self_us in sorted(by_package.items(), key=lambda item: item[1], reverse=True)[:top]:
+        print(f"  {package:<28} {self_us / 1000:9.1f} ms  {self_us * 100 / total_us:5.1f}%")
+    print()
+    print("Slowest direct imports (cumulative):")
+    direct = [(name, cumulative_us) for name, depth, _, cumulative_us in rows if depth == 0]
+    for name, cumulative_us in sorted(direct, key=lambda item: item[1], reverse=True)[:top]:
+        print(f"  {name:<28} {cumulative_us / 1000:9.1f} ms")
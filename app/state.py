@@ -0,0 +1,59 @@
+import logging
+from typing import Iterable, Optional
+
+import database
+from cache import response_cache
+
+logger = logging.getLogger(__name__)
+
+
+class PowerStateStore:
+    """Process-local copy of the latest power event per location.
+
+    monitor_loop is the only writer to power_events, so once loaded the
+    store answers "what is the current state" without a DB round trip.
+    Other replicas learn about new events through `apply_event` (NOTIFY).
+    A location whose write failed is dropped from the store and re-read
+    from the database on next access.
+    """
+
+    def __init__(self):
+        # location -> last event ({'id', 'status', 'timestamp'}) or None if there are no events yet
+        self._events: dict[str, Optional[dict]] = {}
+
+    async def load(self, locations: Iterable[str]) -> None:
+        for location in locations:
+            self._events[location] = await database.get_last_event(location)
+        logger.info(f"Power state loaded for {len(self._events)} location(s)")
+
+    def invalidate(self, location: str) -> None:
+        self._events.pop(location, None)
+        response_cache.invalidate(location)
+
+    async def get_last_event(self, location: str) -> Optional[dict]:
+        if location not in self._events:
+            self._events[location] = await database.get_last_event(location)
+        return self._events[location]
+
+    def apply_event(self, event: dict) -> None:
+        """Take a power event announced over NOTIFY (possibly by another replica)"""
+        location = event['location']
+        current = self._events.get(location)
+        if current is not None and current.get('id', 0) >= event['id']:
+            return
+        self._events[location] = {'id': event['id'], 'status': event['status'], 'timestamp': event['timestamp']}
+        response_cache.invalidate(location)
+
+    async def record_event(self, status: str, timestamp: float, location: str) -> None:
+        """Persist a power event and update the store only after the commit succeeded"""
+        try:
+            event_id = await database.log_power_event(status, timestamp, location)
+        except Exception:
+            # The row may or may not have been written; let the next read ask the database
+            self.invalidate(location)
+            raise
+        self._events[location] = {'id': event_id, 'status': status, 'timestamp': timestamp}
+        response_cache.invalidate(location)
+
+
+power_state = PowerStateStore()
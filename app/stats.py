@@ -0,0 +1,111 @@
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+import pytz
+from cache import response_cache
+from config import Config
+from database import get_daily_stats, get_open_outage
+from state import power_state
+
+DAYS_IN_BREAKDOWN = 7
+
+
+@dataclass
+class PeriodStats:
+    outages: int = 0
+    downtime: float = 0.0
+    longest: float = 0.0
+    seconds: float = 0.0  # Length of the period so far
+
+    @property
+    def uptime_pct(self) -> float:
+        if self.seconds <= 0:
+            return 100.0
+        return max(0.0, 100.0 * (1 - self.downtime / self.seconds))
+
+
+def format_duration(seconds: float) -> str:
+    """Duration as shown in replies and notifications, e.g. 3h 25m"""
+    hours, rem = divmod(int(seconds), 3600)
+    minutes, _ = divmod(rem, 60)
+    return f"{hours}h {minutes}m"
+
+
+def day_start(day: date, tz) -> datetime:
+    return tz.localize(datetime.combine(day, datetime.min.time()))
+
+
+def aggregate(
+    rows: list[dict],
+    first_day: date,
+    last_day: date,
+    open_start: Optional[datetime],
+    now: datetime,
+) -> PeriodStats:
+    """Combine rolled-up days with the part of an ongoing outage that falls into the period"""
+    tz = now.tzinfo
+    period_start = day_start(first_day, tz)
+    period_end = min(now, day_start(last_day + timedelta(days=1), tz))
+
+    stats = PeriodStats(seconds=(period_end - period_start).total_seconds())
+    for row in rows:
+        if first_day <= row['day'] <= last_day:
+            stats.outages += row['outages_count']
+            stats.downtime += row['downtime_seconds']
+            stats.longest = max(stats.longest, row['longest_seconds'])
+
+    if open_start is not None and open_start < period_end:
+        overlap_start = max(open_start, period_start)
+        stats.downtime += (period_end - overlap_start).total_seconds()
+        if open_start >= period_start:
+            stats.outages += 1
+            stats.longest = max(stats.longest, (now - open_start).total_seconds())
+    return stats
+
+
+def render_period(title: str, stats: PeriodStats) -> str:
+    if stats.outages == 0 and stats.downtime == 0:
+        return f"**{title}:** відключень не було"
+    return (
+        f"**{title}:** {stats.outages} відкл., без світла `{format_duration(stats.downtime)}`, "
+        f"найдовше `{format_duration(stats.longest)}`, світло було {stats.uptime_pct:.1f}% часу"
+    )
+
+
+async def load_stats_parts(location: str, today: date) -> tuple[list[dict], Optional[datetime]]:
+    """Rollup rows and the start of the ongoing outage, cached until the next power event or day"""
+    last_event = await power_state.get_last_event(location)
+    # The day is part of the version, not the kind, so yesterday's entry is replaced rather than kept
+    version = (last_event.get('id') if last_event else None, today)
+
+    async def load():
+        first_day = min(today.replace(day=1), today - timedelta(days=DAYS_IN_BREAKDOWN - 1))
+        rows = await get_daily_stats(first_day, today, location)
+        open_outage = await get_open_outage(location)
+        return rows, open_outage['started_at'] if open_outage else None
+
+    return await response_cache.get_or_load("stats", location, version, load)
+
+
+async def get_stats_text(location: str) -> str:
+    tz = pytz.timezone(Config.TIMEZONE)
+    now = datetime.now(tz=tz)
+    today = now.date()
+    rows, open_start = await load_stats_parts(location, today)
+    if open_start is not None:
+        open_start = open_start.astimezone(tz)
+
+    week_start = today - timedelta(days=today.weekday())
+    lines = [
+        render_period("Сьогодні", aggregate(rows, today, today, open_start, now)),
+        render_period("Цей тиждень", aggregate(rows, week_start, today, open_start, now)),
+        render_period("Цей місяць", aggregate(rows, today.replace(day=1), today, open_start, now)),
+        "",
+        f"По днях (останні {DAYS_IN_BREAKDOWN}):",
+    ]
+    for offset in range(DAYS_IN_BREAKDOWN - 1, -1, -1):
+        day = today - timedelta(days=offset)
+        stats = aggregate(rows, day, day, open_start, now)
+        lines.append(f"{day.strftime('%d.%m')} — {stats.outages} відкл., `{format_duration(stats.downtime)}`")
+    return "\n".join(lines)
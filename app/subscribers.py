@@ -0,0 +1,292 @@
+import asyncio
+import logging
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from typing import Callable, Iterable, Optional
+
+import pytz
+
+import database
+from config import Config
+from metrics import USERS_DEACTIVATED
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_MODES = ("instant", "quiet", "digest")
+# Broadcast audiences (broadcast_jobs.audience); None means every recipient regardless of preferences
+AUDIENCE_INSTANT = "instant"
+AUDIENCE_DIGEST = "digest"
+# Longest wait between retries of a failed bulk deactivation of blocked users
+BLOCKED_FLUSH_MAX_DELAY = 300.0
+
+
+def instant_audience(timestamp: float) -> str:
+    """Audience of the notification about a change seen at `timestamp`.
+
+    Carries the local hour of the change rather than of the send, so a change
+    just before a quiet window opens is still sent and one inside it is left
+    to the summary, even if the broadcast runs or resumes later.
+    """
+    return f"{AUDIENCE_INSTANT}:{datetime.fromtimestamp(timestamp, pytz.timezone(Config.TIMEZONE)).hour}"
+
+
+def quiet_audience(quiet_start: int, quiet_end: int) -> str:
+    """Audience of the summary sent to users with these quiet hours"""
+    return f"quiet:{quiet_start}-{quiet_end}"
+
+
+def in_quiet_window(hour: int, quiet_start: int, quiet_end: int) -> bool:
+    """Whether a local hour falls in [quiet_start, quiet_end), which may wrap past midnight"""
+    if quiet_start <= quiet_end:
+        return quiet_start <= hour < quiet_end
+    return hour >= quiet_start or hour < quiet_end
+
+
+class SubscriberSet:
+    """Process-local copy of the active users, so a broadcast needs no query to find recipients.
+
+    Active telegram_user_ids are kept as a sorted int64 array; users who
+    limited themselves to some locations are kept in a small dict. The set
+    is loaded once, updated by the add/deactivate/set-locations/preferences wrappers
+    after their commit, and periodically reconciled against Postgres to pick
+    up changes made outside the bot (e.g. manual SQL).
+
+    Notification preferences of the (few) users not on instant delivery are
+    kept in another dict, so `page` can pick the recipients of a power
+    notification or of a quiet-hours/digest summary without a query.
+
+    Chats that turn out to have blocked the bot are dropped from the set at
+    once but written to the database in bulk: `mark_blocked` queues them and
+    a single UPDATE runs `blocked_flush_interval` seconds later.
+    """
+
+    def __init__(self, blocked_flush_interval: float):
+        self.blocked_flush_interval = blocked_flush_interval
+        self._ids = array('q')
+        # telegram_user_id -> locations; users without an entry follow every location
+        self._locations: dict[int, frozenset[str]] = {}
+        # telegram_user_id -> (notify_mode, quiet_start, quiet_end); users without an entry get instant delivery
+        self._prefs: dict[int, tuple[str, Optional[int], Optional[int]]] = {}
+        self._loaded = False
+        # Changes made while a reload is in flight, replayed on top of the fresh snapshot
+        self._replay: Optional[list[tuple]] = None
+        # The listener and a new leader may both resync at once; reloads run one at a time
+        self._load_lock = asyncio.Lock()
+        self._blocked: set[int] = set()
+        self._blocked_flush: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    async def load(self) -> None:
+        async with self._load_lock:
+            self._replay = []
+            try:
+                ids = array('q', await database.get_active_users())
+                locations: dict[int, set[str]] = {}
+                for user_id, location in await database.get_all_user_locations():
+                    locations.setdefault(user_id, set()).add(location)
+                prefs = {row[0]: tuple(row[1:]) for row in await database.get_notify_preferences()}
+                replay = self._replay
+            finally:
+                self._replay = None
+
+            drift = len(set(self._ids).symmetric_difference(ids)) if self._loaded else 0
+            self._ids = ids
+            self._locations = {user_id: frozenset(locs) for user_id, locs in locations.items()}
+            self._prefs = prefs
+            self._loaded = True
+            for op, *args in replay:
+                op(*args)
+
+        if drift:
+            logger.warning(f"Subscriber set was out of sync with the database by {drift} user(s)")
+        logger.info(f"Subscriber set loaded: {len(self._ids)} active user(s)")
+
+    async def ensure_loaded(self) -> None:
+        if not self._loaded:
+            await self.load()
+
+    def _apply(self, op, *args) -> None:
+        op(*args)
+        if self._replay is not None:
+            self._replay.append((op, *args))
+
+    def _add(self, user_id: int) -> None:
+        idx = bisect_left(self._ids, user_id)
+        if idx == len(self._ids) or self._ids[idx] != user_id:
+            self._ids.insert(idx, user_id)
+
+    def _remove(self, user_ids: Iterable[int]) -> None:
+        for user_id in user_ids:
+            idx = bisect_left(self._ids, user_id)
+            if idx < len(self._ids) and self._ids[idx] == user_id:
+                del self._ids[idx]
+
+    def _set_locations(self, user_id: int, locations: frozenset[str]) -> None:
+        if locations:
+            self._locations[user_id] = locations
+        else:
+            self._locations.pop(user_id, None)
+
+    def _set_prefs(self, user_id: int, prefs: tuple) -> None:
+        if prefs[0] == "instant":
+            self._prefs.pop(user_id, None)
+        else:
+            self._prefs[user_id] = prefs
+
+    async def add_user(self, user_id: int, **profile) -> None:
+        await database.add_user(user_id, **profile)
+        self._apply(self._add, user_id)
+
+    async def deactivate_user(self, user_id: int) -> None:
+        await database.deactivate_user(user_id)
+        self._apply(self._remove, (user_id,))
+
+    async def deactivate_users(self, user_ids: Iterable[int]) -> int:
+        """Deactivate many users with one UPDATE; returns how many were still active"""
+        user_ids = list(user_ids)
+        if not user_ids:
+            return 0
+        self._apply(self._remove, user_ids)
+        deactivated = await database.deactivate_users(user_ids)
+        USERS_DEACTIVATED.inc(deactivated)
+        if deactivated:
+            logger.info(f"Deactivated {deactivated} user(s) who blocked the bot")
+        return deactivated
+
+    def mark_blocked(self, user_id: int) -> None:
+        """Queue a user who blocked the bot for the next bulk deactivation"""
+        self._apply(self._remove, (user_id,))
+        self._blocked.add(user_id)
+        if self._blocked_flush is None or self._blocked_flush.done():
+            self._blocked_flush = asyncio.create_task(self._flush_blocked_later())
+
+    async def _flush_blocked_later(self) -> None:
+        """Flush after `blocked_flush_interval` until nothing is queued, backing off while the UPDATE fails
+
+        Users marked while a flush is in flight land in the fresh set and are
+        flushed by the next pass, since this task still counts as running.
+        """
+        delay = self.blocked_flush_interval
+        await asyncio.sleep(delay)
+        while self._blocked:
+            if await self.flush_blocked() is None:
+                delay = min(max(delay, 1.0) * 2, BLOCKED_FLUSH_MAX_DELAY)
+                await asyncio.sleep(delay)
+
+    async def flush_blocked(self) -> Optional[int]:
+        """Deactivate the queued blocked users now; None if that failed (they stay queued)"""
+        blocked, self._blocked = self._blocked, set()
+        try:
+            return await self.deactivate_users(blocked)
+        except Exception as e:
+            logger.error(f"Failed to deactivate {len(blocked)} blocked user(s): {e}")
+            self._blocked |= blocked
+            return None
+
+    async def close(self) -> None:
+        """Stop the delayed flush and write the queued blocked users before shutdown"""
+        if self._blocked_flush is not None and not self._blocked_flush.done():
+            self._blocked_flush.cancel()
+            await asyncio.gather(self._blocked_flush, return_exceptions=True)
+        await self.flush_blocked()
+
+    async def set_user_locations(self, user_id: int, locations: list[str]) -> None:
+        await database.set_user_locations(user_id, locations)
+        self._apply(self._set_locations, user_id, frozenset(locations))
+
+    async def set_notify_preferences(self, user_id: int, mode: str, quiet_start: Optional[int] = None, quiet_end: Optional[int] = None) -> None:
+        if mode not in NOTIFY_MODES:
+            raise ValueError(f"Unknown notify mode: {mode}")
+        await database.set_notify_preferences(user_id, mode, quiet_start, quiet_end)
+        self._apply(self._set_prefs, user_id, (mode, quiet_start, quiet_end))
+
+    async def followed_locations(self, user_id: int) -> frozenset[str]:
+        """Locations `user_id` chose to follow; empty if they follow every location"""
+        await self.ensure_loaded()
+        return self._locations.get(user_id, frozenset())
+
+    def preferences(self, user_id: int) -> tuple[str, Optional[int], Optional[int]]:
+        return self._prefs.get(user_id, ("instant", None, None))
+
+    def summary_audiences(self) -> set[tuple[str, Optional[int], Optional[int]]]:
+        """Distinct non-instant preferences in use: ("digest", None, None) and ("quiet", start, end) groups"""
+        return set(self._prefs.values())
+
+    async def apply_notification(self, payload: dict) -> None:
+        """Mirror a change committed by any replica (including this one; every op is idempotent)"""
+        op = payload.get("op")
+        if op == "add":
+            self._apply(self._add, payload["user_id"])
+        elif op == "remove":
+            self._apply(self._remove, payload["user_ids"])
+        elif op == "locations":
+            self._apply(self._set_locations, payload["user_id"], frozenset(payload["locations"]))
+        elif op == "prefs":
+            self._apply(self._set_prefs, payload["user_id"], (payload["mode"], payload["quiet_start"], payload["quiet_end"]))
+        elif op == "reload":
+            await self.load()
+
+    def _audience_filter(self, audience: Optional[str]) -> Optional[Callable[[int], bool]]:
+        """Predicate selecting `audience` among active users; None if everyone qualifies"""
+        if audience is None:
+            return None
+        prefs = self._prefs
+        kind, _, arg = audience.partition(":")
+        if kind == AUDIENCE_INSTANT:
+            if not prefs:
+                return None
+            # Quiet-hours users get power notifications only outside their quiet window
+            hour = int(arg)
+            def instant(user_id: int) -> bool:
+                mode, quiet_start, quiet_end = prefs.get(user_id, ("instant", None, None))
+                return mode == "instant" or (mode == "quiet" and not in_quiet_window(hour, quiet_start, quiet_end))
+            return instant
+        if kind == AUDIENCE_DIGEST:
+            return lambda user_id: prefs.get(user_id, ("instant",))[0] == "digest"
+        quiet_start, _, quiet_end = arg.partition("-")
+        group = ("quiet", int(quiet_start), int(quiet_end))
+        return lambda user_id: prefs.get(user_id) == group
+
+    async def page(
+        self,
+        location: Optional[str] = None,
+        after: Optional[int] = None,
+        limit: int = 500,
+        audience: Optional[str] = None,
+    ) -> list[int]:
+        """Up to `limit` active users with telegram_user_id > `after`, in id order, following `location`
+        and belonging to `audience` (see AUDIENCE_*; None = everyone)"""
+        await self.ensure_loaded()
+        start = 0 if after is None else bisect_right(self._ids, after)
+        selected = self._audience_filter(audience)
+        if selected is None and (location is None or not self._locations):
+            return self._ids[start:start + limit].tolist()
+
+        result = []
+        for idx in range(start, len(self._ids)):
+            user_id = self._ids[idx]
+            if location is not None:
+                followed = self._locations.get(user_id)
+                if followed is not None and location not in followed:
+                    continue
+            if selected is not None and not selected(user_id):
+                continue
+            result.append(user_id)
+            if len(result) == limit:
+                break
+        return result
+
+
+subscribers = SubscriberSet(blocked_flush_interval=Config.BLOCKED_USERS_FLUSH_INTERVAL)
+
+
+async def subscriber_reconcile_loop() -> None:
+    while True:
+        await asyncio.sleep(Config.SUBSCRIBERS_RECONCILE_INTERVAL)
+        try:
+            await subscribers.load()
+        except Exception as e:
+            logger.error(f"Subscriber set reconcile failed: {e}")
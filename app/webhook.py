@@ -0,0 +1,112 @@
+"""
+Webhook delivery mode: an aiohttp server that receives updates from Telegram.
+
+Run `python app/webhook.py --count 1000` to post fake button taps to a locally
+running webhook server (BOT_MODE=webhook with WEBHOOK_URL left empty).
+"""
+import argparse
+import asyncio
+import logging
+import sys
+import time
+from pathlib import Path
+
+# Add app directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent))
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import ClientSession, web
+from config import Config
+from middlewares import ConcurrencyLimitMiddleware
+
+logger = logging.getLogger(__name__)
+
+
+async def run_webhook(bot: Bot, dp: Dispatcher) -> None:
+    """Serve updates over a webhook until cancelled"""
+    if not Config.WEBHOOK_SECRET:
+        raise RuntimeError("WEBHOOK_SECRET must be set when BOT_MODE=webhook")
+
+    dp.update.outer_middleware(ConcurrencyLimitMiddleware(Config.HANDLER_CONCURRENCY))
+
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=Config.WEBHOOK_SECRET,
+    ).register(app, path=Config.WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, Config.WEBHOOK_HOST, Config.WEBHOOK_PORT)
+    await site.start()
+    logger.info(f"Webhook server listening on {Config.WEBHOOK_HOST}:{Config.WEBHOOK_PORT}{Config.WEBHOOK_PATH}")
+
+    if Config.WEBHOOK_URL:
+        await bot.set_webhook(
+            url=Config.WEBHOOK_URL.rstrip("/") + Config.WEBHOOK_PATH,
+            secret_token=Config.WEBHOOK_SECRET,
+            allowed_updates=dp.resolve_used_update_types(),
+        )
+        logger.info(f"Webhook registered at {Config.WEBHOOK_URL}")
+    else:
+        logger.info("WEBHOOK_URL is empty, not registering the webhook with Telegram")
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        # The webhook stays registered so Telegram queues updates during restarts
+        await runner.cleanup()
+
+
+def build_fake_update(update_id: int, user_id: int, text: str) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private", "first_name": "Test"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Test"},
+            "text": text,
+        },
+    }
+
+
+async def send_fake_updates(url: str, secret: str, count: int, concurrency: int, text: str) -> None:
+    """Post `count` fake message updates to the webhook and print latency stats"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+    statuses: dict[int, int] = {}
+
+    async with ClientSession() as session:
+        async def send(idx: int) -> None:
+            update = build_fake_update(idx + 1, 100000 + idx, text)
+            async with semaphore:
+                started = time.monotonic()
+                async with session.post(url, json=update, headers={"X-Telegram-Bot-Api-Secret-Token": secret}) as resp:
+                    statuses[resp.status] = statuses.get(resp.status, 0) + 1
+                latencies.append(time.monotonic() - started)
+
+        started = time.monotonic()
+        await asyncio.gather(*(send(i) for i in range(count)))
+        elapsed = time.monotonic() - started
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+    print(f"Sent {count} updates in {elapsed:.2f}s ({count / elapsed:.0f}/s), statuses={statuses}, p50={p50:.1f}ms p99={p99:.1f}ms")
+
+
+if __name__ == "__main__":
+    from bot import MENU_BTN_STATUS
+
+    parser = argparse.ArgumentParser(description="Send fake updates to a local webhook server")
+    parser.add_argument("--url", default=f"http://127.0.0.1:{Config.WEBHOOK_PORT}{Config.WEBHOOK_PATH}")
+    parser.add_argument("--secret", default=Config.WEBHOOK_SECRET or "")
+    parser.add_argument("--count", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--text", default=MENU_BTN_STATUS)
+    args = parser.parse_args()
+    asyncio.run(send_fake_updates(args.url, args.secret, args.count, args.concurrency, args.text))
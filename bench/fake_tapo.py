@@ -0,0 +1,68 @@
+"""
+Fake Tapo plug for benchmarks.
+
+Implements the same `probe()` interface as device.DeviceSession. While
+"powered" it answers after `latency`; while off it behaves like an
+unreachable plug and only gives up after `off_timeout` (the probe budget).
+`start_tcp()` opens a local TCP listener so the TCP pre-probe can be
+pointed at the fake plug too; `start_blackhole()` opens one whose accept
+queue is full, so connects time out like they do for an unpowered plug.
+"""
+import asyncio
+import socket
+
+
+class FakeTapoDevice:
+    def __init__(self, ip: str, powered: bool = True, latency: float = 0.05, off_timeout: float = 1.0):
+        self.ip = ip
+        self.powered = powered
+        self.latency = latency
+        self.off_timeout = off_timeout
+        self.probes = 0
+        self.port: int | None = None
+        self._server: asyncio.AbstractServer | None = None
+        self._blackhole: list[socket.socket] = []
+
+    async def probe(self) -> bool:
+        self.probes += 1
+        if not self.powered:
+            await asyncio.sleep(self.off_timeout)
+            return False
+        await asyncio.sleep(self.latency)
+        return True
+
+    async def start_tcp(self, host: str = "127.0.0.1") -> int:
+        async def handle(reader, writer):
+            writer.close()
+
+        self._server = await asyncio.start_server(handle, host, 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def stop_tcp(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    def start_blackhole(self, host: str = "127.0.0.1") -> int:
+        """Listener with a full backlog: further SYNs are dropped and connects time out"""
+        listener = socket.socket()
+        listener.bind((host, 0))
+        listener.listen(0)
+        port = listener.getsockname()[1]
+        self._blackhole.append(listener)
+        for _ in range(3):
+            filler = socket.socket()
+            filler.setblocking(False)
+            try:
+                filler.connect((host, port))
+            except BlockingIOError:
+                pass
+            self._blackhole.append(filler)
+        return port
+
+    def stop_blackhole(self) -> None:
+        for sock in self._blackhole:
+            sock.close()
+        self._blackhole.clear()
@@ -0,0 +1,110 @@
+"""
+Local stand-in for the Telegram Bot API.
+
+Answers every method with a successful result after a configurable latency,
+and fails a configurable share of sendMessage calls with 429 (flood control)
+or 403 (bot blocked). Successful sends are timestamped so the benchmark can
+compute time-to-last-notification.
+"""
+import asyncio
+import random
+import time
+
+from aiohttp import web
+
+
+class FakeTelegramServer:
+    def __init__(
+        self,
+        latency: float = 0.02,
+        jitter: float = 0.01,
+        rate_429: float = 0.0,
+        retry_after: int = 1,
+        rate_403: float = 0.0,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.rate_403 = rate_403
+        self.host = host
+        self.port = port
+        self.delivered: list[tuple[float, int]] = []  # (monotonic time, chat_id)
+        self.calls: dict[str, int] = {}
+        self.responses_429 = 0
+        self.responses_403 = 0
+        self._message_id = 0
+        self._runner: web.AppRunner | None = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def reset(self) -> None:
+        self.delivered.clear()
+        self.calls.clear()
+        self.responses_429 = 0
+        self.responses_403 = 0
+
+    def delivered_since(self, since: float) -> list[tuple[float, int]]:
+        return [d for d in self.delivered if d[0] >= since]
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls[method] = self.calls.get(method, 0) + 1
+        data = dict(await request.post())
+
+        await asyncio.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+
+        if method.lower() != "sendmessage":
+            return web.json_response({"ok": True, "result": True})
+
+        roll = random.random()
+        if roll < self.rate_429:
+            self.responses_429 += 1
+            return web.json_response(
+                {
+                    "ok": False,
+                    "error_code": 429,
+                    "description": f"Too Many Requests: retry after {self.retry_after}",
+                    "parameters": {"retry_after": self.retry_after},
+                },
+                status=429,
+            )
+        if roll < self.rate_429 + self.rate_403:
+            self.responses_403 += 1
+            return web.json_response(
+                {"ok": False, "error_code": 403, "description": "Forbidden: bot was blocked by the user"},
+                status=403,
+            )
+
+        chat_id = int(data.get("chat_id", 0))
+        self._message_id += 1
+        self.delivered.append((time.monotonic(), chat_id))
+        return web.json_response(
+            {
+                "ok": True,
+                "result": {
+                    "message_id": self._message_id,
+                    "date": int(time.time()),
+                    "chat": {"id": chat_id, "type": "private"},
+                    "text": data.get("text", ""),
+                },
+            }
+        )
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_route("POST", "/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
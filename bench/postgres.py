@@ -0,0 +1,58 @@
+"""
+Throwaway Postgres database for benchmarks.
+
+Connects to the server configured through DB_* (the same settings the bot
+uses), creates a fresh database, applies all migrations and points Config at
+it. The database is dropped on exit.
+"""
+import os
+
+import psycopg
+from psycopg import sql
+
+import database
+import migrate
+from config import Config
+
+
+class PostgresFixture:
+    def __init__(self, name: str | None = None):
+        self.name = name or f"powerbot_bench_{os.getpid()}"
+        self._original_db_name = Config.DB_NAME
+
+    def _admin_conninfo(self) -> str:
+        return (
+            f"host={Config.DB_HOST} port={Config.DB_PORT} dbname=postgres "
+            f"user={Config.DB_USER} password={Config.DB_PASSWORD}"
+        )
+
+    async def __aenter__(self) -> "PostgresFixture":
+        async with await psycopg.AsyncConnection.connect(self._admin_conninfo(), autocommit=True) as conn:
+            await conn.execute(sql.SQL("DROP DATABASE IF EXISTS {}").format(sql.Identifier(self.name)))
+            await conn.execute(sql.SQL("CREATE DATABASE {}").format(sql.Identifier(self.name)))
+
+        Config.DB_NAME = self.name
+        migrate.run(database.get_connection_info())
+        await database.init_db_pool()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await database.close_db_pool()
+        Config.DB_NAME = self._original_db_name
+        async with await psycopg.AsyncConnection.connect(self._admin_conninfo(), autocommit=True) as conn:
+            await conn.execute(sql.SQL("DROP DATABASE IF EXISTS {} WITH (FORCE)").format(sql.Identifier(self.name)))
+
+    async def seed_users(self, count: int, first_id: int = 1_000_000) -> list[int]:
+        """Insert `count` active subscribers and return their ids"""
+        user_ids = list(range(first_id, first_id + count))
+        async with database.get_pool().connection() as conn:
+            async with conn.cursor() as cur:
+                async with cur.copy("COPY users (telegram_user_id, is_active) FROM STDIN") as copy:
+                    for user_id in user_ids:
+                        await copy.write_row((user_id, True))
+            await conn.commit()
+        return user_ids
+
+    def pool_stats(self) -> dict[str, int]:
+        """Pool counters since the previous call"""
+        return database.get_pool().pop_stats()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Compare probe strategies (tapo, tcp, layered) against a local fake plug.
+
+"on" rounds hit a fake plug listening on localhost; "off" rounds point the
+TCP pre-probe at a local listener that never completes a handshake and let
+the fake Tapo request time out, the way an unpowered plug behaves.
+
+    python bench/probes.py --rounds 200 --handshake-latency 0.3
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path[:0] = [str(BENCH_DIR.parent / "app"), str(BENCH_DIR)]
+os.environ.setdefault("BOT_TOKEN", "123456:BENCHMARK")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Probe strategy benchmark")
+    parser.add_argument("--rounds", type=int, default=100, help="Probes per strategy while the plug is on")
+    parser.add_argument("--off-rounds", type=int, default=3, help="Probes per strategy while the plug is off")
+    parser.add_argument("--handshake-latency", type=float, default=0.3, help="Simulated authenticated request time")
+    parser.add_argument("--full-interval", type=float, default=300)
+    return parser.parse_args()
+
+
+async def measure(probe, rounds: int) -> tuple[list[float], int]:
+    latencies = []
+    positives = 0
+    for _ in range(rounds):
+        started = time.perf_counter()
+        positives += bool(await probe.probe())
+        latencies.append(time.perf_counter() - started)
+    return latencies, positives
+
+
+def report(name: str, latencies: list[float], positives: int) -> None:
+    ordered = sorted(latencies)
+    p50 = ordered[len(ordered) // 2] * 1000
+    p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000
+    print(f"  {name:<8} rounds={len(latencies):<5} on={positives:<5} p50={p50:8.1f}ms p99={p99:8.1f}ms")
+
+
+async def main(args: argparse.Namespace) -> None:
+    import logging
+    from config import Config, setup_logging
+    setup_logging()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    from fake_tapo import FakeTapoDevice
+    from probes import LayeredProbe, TcpProbe
+
+    device = FakeTapoDevice("127.0.0.1", latency=args.handshake_latency, off_timeout=Config.TAPO_PROBE_BUDGET)
+    port = await device.start_tcp()
+
+    print("[plug on]")
+    tcp = TcpProbe("127.0.0.1", port, Config.PROBE_TCP_TIMEOUT)
+    report("tapo", *await measure(device, args.rounds))
+    report("tcp", *await measure(tcp, args.rounds))
+    report("layered", *await measure(LayeredProbe(tcp, device, args.full_interval), args.rounds))
+
+    print("[plug off]")
+    device.powered = False
+    tcp_off = TcpProbe("127.0.0.1", device.start_blackhole(), Config.PROBE_TCP_TIMEOUT)
+    report("tapo", *await measure(device, args.off_rounds))
+    report("tcp", *await measure(tcp_off, args.off_rounds))
+    report("layered", *await measure(LayeredProbe(tcp_off, device, args.full_interval), args.off_rounds))
+
+    device.stop_blackhole()
+    await device.stop_tcp()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Offline end-to-end benchmark: fake Telegram, fake Tapo plugs, real Postgres.
+
+Scenarios:
+  broadcast - broadcast_message to every subscriber
+  taps      - status/history button taps fed through the dispatcher at a fixed rate
+  monitor   - monitor_loop detects an outage on every plug and notifies subscribers
+
+Needs a reachable Postgres (DB_* settings); a temporary database is created
+and dropped. Example:
+
+    python bench/run.py --subscribers 50000 --taps-per-second 1000 --tap-duration 10
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+APP_DIR = BENCH_DIR.parent / "app"
+
+SCENARIOS = ("broadcast", "taps", "monitor")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Power Bot load test")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated subset of: " + ", ".join(SCENARIOS))
+    parser.add_argument("--subscribers", type=int, default=50_000)
+    parser.add_argument("--taps-per-second", type=int, default=1000)
+    parser.add_argument("--tap-duration", type=int, default=10, help="Seconds of tap traffic")
+    parser.add_argument("--devices", type=int, default=1, help="Number of fake plugs for the monitor scenario")
+    parser.add_argument("--check-interval", type=int, default=2)
+    parser.add_argument("--tg-latency", type=float, default=0.03, help="Fake Telegram response latency, seconds")
+    parser.add_argument("--tg-429-rate", type=float, default=0.0, help="Share of sendMessage calls answered with 429")
+    parser.add_argument("--tg-403-rate", type=float, default=0.0, help="Share of sendMessage calls answered with 403")
+    parser.add_argument("--rate-limit", type=float, default=1000, help="BROADCAST_RATE_LIMIT (the fake server has no real limit)")
+    parser.add_argument("--concurrency", type=int, default=100, help="BROADCAST_CONCURRENCY")
+    parser.add_argument("--timeout", type=float, default=600, help="Give up on a scenario after this many seconds")
+    return parser.parse_args()
+
+
+def configure_env(args: argparse.Namespace) -> None:
+    """App modules read Config at import time, so settings go into the environment first"""
+    os.environ.setdefault("BOT_TOKEN", "123456:BENCHMARK")
+    os.environ["TEST_MODE"] = "false"
+    os.environ["DEVICES"] = ",".join(f"bench-{i}=fake-{i}" for i in range(args.devices))
+    os.environ["CHECK_INTERVAL"] = str(args.check_interval)
+    os.environ["CONFIRMATION_CHECKS"] = os.getenv("CONFIRMATION_CHECKS", "2")
+    os.environ["BROADCAST_RATE_LIMIT"] = str(args.rate_limit)
+    os.environ["BROADCAST_CONCURRENCY"] = str(args.concurrency)
+    sys.path[:0] = [str(APP_DIR), str(BENCH_DIR)]
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def pool_wait_line(stats: dict[str, int]) -> str:
+    requests = stats.get("requests_num", 0)
+    wait_ms = stats.get("requests_wait_ms", 0)
+    avg = wait_ms / requests if requests else 0.0
+    return f"pool: requests={requests} queued={stats.get('requests_queued', 0)} wait_total={wait_ms}ms wait_avg={avg:.2f}ms"
+
+
+async def bench_broadcast(bot, server, db) -> None:
+    from bot import broadcast_message
+
+    server.reset()
+    db.pool_stats()
+    started = time.monotonic()
+    stats = await broadcast_message(bot, "⚡ benchmark")
+    last = server.delivered[-1][0] - started if server.delivered else 0.0
+
+    print("\n[broadcast]")
+    print(f"  {stats.summary()}")
+    print(f"  time_to_last_notification={last:.2f}s 429s={server.responses_429} 403s={server.responses_403}")
+    print(f"  {pool_wait_line(db.pool_stats())}")
+
+
+async def bench_taps(bot, server, db, args: argparse.Namespace) -> None:
+    from aiogram import types
+    from bot import dp, MENU_BTN_HISTORY, MENU_BTN_STATUS
+    from webhook import build_fake_update
+
+    total = args.taps_per_second * args.tap_duration
+    latencies: list[float] = []
+    errors = 0
+
+    async def tap(idx: int) -> None:
+        nonlocal errors
+        text = MENU_BTN_STATUS if idx % 2 == 0 else MENU_BTN_HISTORY
+        update = types.Update.model_validate(build_fake_update(idx + 1, 2_000_000 + idx % 10_000, text), context={"bot": bot})
+        started = time.monotonic()
+        try:
+            await dp.feed_update(bot, update)
+        except Exception:
+            errors += 1
+        latencies.append(time.monotonic() - started)
+
+    server.reset()
+    db.pool_stats()
+    tasks = []
+    started = time.monotonic()
+    for idx in range(total):
+        # Open-loop load: schedule taps on time regardless of how fast they finish
+        delay = started + idx / args.taps_per_second - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(tap(idx)))
+    await asyncio.wait_for(asyncio.gather(*tasks), timeout=args.timeout)
+    elapsed = time.monotonic() - started
+
+    print("\n[taps]")
+    print(f"  taps={total} errors={errors} elapsed={elapsed:.2f}s rate={total / elapsed:.0f}/s")
+    print(
+        f"  handler latency: p50={percentile(latencies, 50) * 1000:.1f}ms "
+        f"p99={percentile(latencies, 99) * 1000:.1f}ms max={max(latencies, default=0) * 1000:.1f}ms"
+    )
+    print(f"  {pool_wait_line(db.pool_stats())}")
+
+
+async def bench_monitor(bot, server, db, args: argparse.Namespace, subscribers: int) -> None:
+    import monitor
+    from config import Config
+    from fake_tapo import FakeTapoDevice
+    from state import power_state
+
+    devices = {ip: FakeTapoDevice(ip, off_timeout=Config.TAPO_PROBE_BUDGET) for _, ip in Config.DEVICES}
+    monitor.create_probe = lambda ip: devices[ip]
+    locations = [location for location, _ in Config.DEVICES]
+    await power_state.load(locations)
+
+    task = asyncio.create_task(monitor.monitor_loop(bot))
+    try:
+        # Wait until every plug has its first "on" event
+        deadline = time.monotonic() + args.timeout
+        while not all([await power_state.get_last_event(location) for location in locations]):
+            if time.monotonic() > deadline:
+                raise TimeoutError("monitor did not record initial events")
+            await asyncio.sleep(0.1)
+
+        server.reset()
+        db.pool_stats()
+        flipped = time.monotonic()
+        for device in devices.values():
+            device.powered = False
+
+        expected = subscribers * len(devices)
+        while len(server.delivered) < expected and time.monotonic() - flipped < args.timeout:
+            await asyncio.sleep(0.1)
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    delivered = server.delivered
+    first = delivered[0][0] - flipped if delivered else 0.0
+    last = delivered[-1][0] - flipped if delivered else 0.0
+    print("\n[monitor]")
+    print(f"  devices={len(devices)} notifications={len(delivered)}/{expected}")
+    print(f"  outage_to_first_notification={first:.2f}s time_to_last_notification={last:.2f}s")
+    print(f"  probes={sum(d.probes for d in devices.values())}")
+    print(f"  {pool_wait_line(db.pool_stats())}")
+
+
+async def main(args: argparse.Namespace) -> None:
+    from aiogram import Bot
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    from activity import activity_writer
+    from config import Config
+    from fake_telegram import FakeTelegramServer
+    from postgres import PostgresFixture
+    from subscribers import subscribers
+
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    server = FakeTelegramServer(latency=args.tg_latency, rate_429=args.tg_429_rate, rate_403=args.tg_403_rate)
+    await server.start()
+    bot = Bot(token=Config.BOT_TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(server.base_url)))
+
+    try:
+        async with PostgresFixture() as db:
+            activity_writer.start()
+            await db.seed_users(args.subscribers)
+            await subscribers.load()
+            print(f"Seeded {args.subscribers} subscribers into {db.name}")
+
+            if "broadcast" in scenarios:
+                await bench_broadcast(bot, server, db)
+            if "taps" in scenarios:
+                await bench_taps(bot, server, db, args)
+            if "monitor" in scenarios:
+                await bench_monitor(bot, server, db, args, len(subscribers))
+
+            await activity_writer.stop()
+    finally:
+        await bot.session.close()
+        await server.stop()
+
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    configure_env(arguments)
+    from config import setup_logging
+    setup_logging()
+    logging.getLogger().setLevel(logging.WARNING)
+    asyncio.run(main(arguments))
@@ -0,0 +1,7 @@
+import os
+import sys
+from pathlib import Path
+
+# Modules in app/ import each other by bare name, as they do when main.py runs
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+os.environ.setdefault("BOT_TOKEN", "123456:TEST")
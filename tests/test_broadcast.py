@@ -0,0 +1,18 @@
+import asyncio
+import time
+
+from broadcast import TokenBucket
+
+
+def test_bucket_does_not_refill_during_a_flood_control_pause():
+    async def scenario():
+        bucket = TokenBucket(rate=10, capacity=10)
+        bucket.pause(0.5)
+        await asyncio.sleep(0.5)
+        started = time.monotonic()
+        for _ in range(5):
+            await bucket.acquire()
+        return time.monotonic() - started
+
+    # Refilling from the end of the pause, 5 tokens at 10/s take ~0.5s; crediting the pause would make them instant
+    assert asyncio.run(scenario()) >= 0.35
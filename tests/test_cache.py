@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+from prometheus_client import REGISTRY
+
+from cache import MISSING, ResponseCache, SingleFlight
+
+
+def sample(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_concurrent_calls_share_one_load():
+    flight = SingleFlight()
+    calls = 0
+
+    async def load():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return {"rows": calls}
+
+    coalesced = sample("powerbot_lookups_coalesced_total")
+
+    async def scenario():
+        first, second, third = await asyncio.gather(*(flight.do("stats", load) for _ in range(3)))
+        assert first is second is third
+        assert sample("powerbot_lookups_coalesced_total") - coalesced == 2
+        # Finished calls are forgotten: a later miss loads again
+        assert await flight.do("stats", load) == {"rows": 2}
+
+    asyncio.run(scenario())
+    assert calls == 2
+
+
+def test_concurrent_callers_all_get_the_loader_error():
+    flight = SingleFlight()
+    calls = 0
+
+    async def load():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        raise ConnectionError("database unavailable")
+
+    async def scenario():
+        return await asyncio.gather(*(flight.do("stats", load) for _ in range(2)), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert calls == 1
+    assert [type(result) for result in results] == [ConnectionError, ConnectionError]
+
+
+def test_cancelled_caller_does_not_cancel_the_shared_load():
+    flight = SingleFlight()
+
+    async def load():
+        await asyncio.sleep(0.02)
+        return "reply"
+
+    async def scenario():
+        first = asyncio.create_task(flight.do("status", load))
+        second = asyncio.create_task(flight.do("status", load))
+        await asyncio.sleep(0)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(scenario()) == "reply"
+
+
+def test_response_cache_counts_hits_and_misses_per_kind():
+    cache = ResponseCache()
+    hits = sample("powerbot_response_cache_lookups_total", kind="history", result="hit")
+    misses = sample("powerbot_response_cache_lookups_total", kind="history", result="miss")
+
+    assert cache.get("history", "Home", 7) is MISSING
+    cache.set("history", "Home", 7, "reply")
+    assert cache.get("history", "Home", 7) == "reply"
+    # A newer power event makes the entry stale
+    assert cache.get("history", "Home", 8) is MISSING
+
+    assert sample("powerbot_response_cache_lookups_total", kind="history", result="hit") - hits == 1
+    assert sample("powerbot_response_cache_lookups_total", kind="history", result="miss") - misses == 2
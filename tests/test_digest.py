@@ -0,0 +1,126 @@
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+
+import digest
+from config import Config
+from digest import due_audiences, render_summary, seconds_until_next_run
+from subscribers import SubscriberSet, in_quiet_window, instant_audience
+
+HOUR = 1_700_000_000 - 1_700_000_000 % 3600
+
+
+def test_next_run_is_this_hour_when_started_before_the_delay(monkeypatch):
+    monkeypatch.setattr(Config, "DIGEST_DELAY", 120)
+    assert seconds_until_next_run(HOUR + 30) == 90
+
+
+def test_next_run_is_next_hour_once_this_hours_run_is_due(monkeypatch):
+    monkeypatch.setattr(Config, "DIGEST_DELAY", 120)
+    assert seconds_until_next_run(HOUR + 120) == 3600
+    assert seconds_until_next_run(HOUR + 600) == 3600 - 480
+
+
+def test_digest_interval_is_rounded_down_to_a_divisor_of_24():
+    from config import _hours_dividing_day
+
+    assert [_hours_dividing_day(str(h)) for h in (0, 1, 3, 5, 7, 9, 12, 24, 30)] == [1, 1, 3, 4, 6, 8, 12, 24, 24]
+
+
+@pytest.mark.parametrize("hour, start, end, expected", [
+    (21, 22, 7, False),
+    (22, 22, 7, True),
+    (23, 22, 7, True),
+    (0, 22, 7, True),
+    (6, 22, 7, True),
+    (7, 22, 7, False),
+    (12, 22, 7, False),
+    (0, 0, 6, True),
+    (5, 0, 6, True),
+    (6, 0, 6, False),
+    (23, 0, 6, False),
+    (23, 23, 8, True),
+    (8, 23, 8, False),
+])
+def test_in_quiet_window(hour, start, end, expected):
+    assert in_quiet_window(hour, start, end) is expected
+
+
+@pytest.mark.parametrize("timestamp, timezone_name, audience", [
+    (datetime(2026, 1, 15, 21, 59, tzinfo=timezone.utc).timestamp(), "UTC", "instant:21"),
+    (datetime(2026, 1, 15, 22, 0, tzinfo=timezone.utc).timestamp(), "UTC", "instant:22"),
+    # Kyiv is UTC+2 in winter
+    (datetime(2026, 1, 15, 21, 30, tzinfo=timezone.utc).timestamp(), "Europe/Kyiv", "instant:23"),
+])
+def test_instant_audience_carries_local_hour_of_the_change(monkeypatch, timestamp, timezone_name, audience):
+    monkeypatch.setattr(Config, "TIMEZONE", timezone_name)
+    assert instant_audience(timestamp) == audience
+
+
+@pytest.mark.parametrize("hour, receives", [
+    # User 1: instant, 2: quiet 22-7, 3: quiet 0-6, 4: digest
+    (12, [1, 2, 3]),
+    (21, [1, 2, 3]),
+    (22, [1, 3]),
+    (0, [1]),
+    (5, [1]),
+    (6, [1, 3]),
+    (7, [1, 2, 3]),
+])
+def test_instant_filter_skips_users_inside_their_quiet_window(hour, receives):
+    subscribers = SubscriberSet(blocked_flush_interval=3600)
+    subscribers._ids.extend([1, 2, 3, 4])
+    subscribers._prefs = {2: ("quiet", 22, 7), 3: ("quiet", 0, 6), 4: ("digest", None, None)}
+    subscribers._loaded = True
+    assert asyncio.run(subscribers.page(audience=f"instant:{hour}")) == receives
+
+
+GROUPS = {("digest", None, None), ("quiet", 22, 7), ("quiet", 0, 6)}
+
+
+@pytest.mark.parametrize("interval, hour, due", [
+    (3, 7, {("quiet:22-7", 9)}),
+    (3, 6, {("digest", 3), ("quiet:0-6", 6)}),
+    (3, 0, {("digest", 3)}),
+    (3, 22, set()),
+    (3, 1, set()),
+    (4, 8, {("digest", 4)}),
+    (4, 6, {("quiet:0-6", 6)}),
+    (24, 0, {("digest", 24)}),
+    (24, 12, set()),
+])
+def test_due_audiences(monkeypatch, interval, hour, due):
+    monkeypatch.setattr(Config, "DIGEST_INTERVAL_HOURS", interval)
+    assert set(due_audiences(hour, GROUPS)) == due
+
+
+def test_summary_over_midnight_counts_downtime_inside_the_window(monkeypatch):
+    monkeypatch.setattr(Config, "TIMEZONE", "UTC")
+    monkeypatch.setattr(Config, "DEVICES", [("Home", "10.0.0.2")])
+    since = datetime(2026, 1, 14, 22, tzinfo=timezone.utc)
+    until = datetime(2026, 1, 15, 7, tzinfo=timezone.utc)
+
+    async def get_power_events_between(start, end, location):
+        assert (start, end, location) == (since, until, "Home")
+        # Off since before the window, back at 01:30, off again from 06:00
+        return "off", [
+            {"state": "on", "created_at": datetime(2026, 1, 15, 1, 30, tzinfo=timezone.utc)},
+            {"state": "off", "created_at": datetime(2026, 1, 15, 6, 0, tzinfo=timezone.utc)},
+        ]
+
+    monkeypatch.setattr(digest, "get_power_events_between", get_power_events_between)
+    text = asyncio.run(render_summary("Home", since, until))
+    assert "22:00–07:00" in text
+    assert "✅ 01:30" in text and "❌ 06:00" in text
+    assert "`4h 30m`" in text
+    assert text.endswith("Станом на 07:00: ❌ світла немає")
+
+
+def test_summary_without_changes_is_not_sent(monkeypatch):
+    async def get_power_events_between(start, end, location):
+        return "on", []
+
+    monkeypatch.setattr(digest, "get_power_events_between", get_power_events_between)
+    now = datetime(2026, 1, 15, 7, tzinfo=timezone.utc)
+    assert asyncio.run(render_summary("Home", now, now)) is None
@@ -0,0 +1,59 @@
+import asyncio
+
+import psycopg
+
+import database
+from leader import LeaderElection
+
+
+class FakeCursor:
+    async def fetchone(self):
+        return (True,)
+
+
+class FakeConnection:
+    broken = False
+
+    async def set_autocommit(self, value):
+        pass
+
+    async def execute(self, query, params=None):
+        return FakeCursor()
+
+    async def close(self):
+        pass
+
+
+class FakePool:
+    async def getconn(self):
+        return FakeConnection()
+
+    async def putconn(self, conn):
+        pass
+
+
+def test_database_error_in_leader_task_group_steps_down_and_retries(monkeypatch):
+    monkeypatch.setattr(database, "get_pool", lambda: FakePool())
+    election = LeaderElection(lock_id=1, poll_interval=0.01, check_interval=0.05, keepalive_timeout=6)
+    terms = []
+    second_term = asyncio.Event()
+
+    async def work():
+        terms.append(election.is_leader)
+        if len(terms) == 1:
+            async with asyncio.TaskGroup() as tasks:
+                tasks.create_task(asyncio.sleep(3600))
+                raise psycopg.OperationalError("connection lost")
+        second_term.set()
+        await asyncio.sleep(3600)
+
+    async def scenario():
+        campaign = asyncio.create_task(election.run(work))
+        await asyncio.wait_for(second_term.wait(), timeout=5)
+        assert not campaign.done()
+        campaign.cancel()
+        await asyncio.gather(campaign, return_exceptions=True)
+
+    asyncio.run(scenario())
+    assert terms == [True, True]
+    assert not election.is_leader
@@ -0,0 +1,44 @@
+import io
+import json
+import logging
+import queue
+from logging.handlers import QueueListener
+
+from logutil import JsonFormatter, StructuredQueueHandler
+
+
+def log_through_queue(formatter: logging.Formatter) -> str:
+    """Log an exception through the same QueueHandler/QueueListener path setup_logging() builds"""
+    stream = io.StringIO()
+    output = logging.StreamHandler(stream)
+    output.setFormatter(formatter)
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, output)
+    logger = logging.getLogger("test_logutil")
+    logger.propagate = False
+    handler = StructuredQueueHandler(log_queue)
+    logger.addHandler(handler)
+    listener.start()
+    try:
+        try:
+            1 / 0
+        except ZeroDivisionError:
+            logger.exception("Division failed for %s", "user 42")
+    finally:
+        listener.stop()
+        logger.removeHandler(handler)
+    return stream.getvalue()
+
+
+def test_json_log_keeps_traceback_in_its_own_field():
+    entry = json.loads(log_through_queue(JsonFormatter()))
+    assert entry["msg"] == "Division failed for user 42"
+    assert entry["level"] == "ERROR"
+    assert "ZeroDivisionError" in entry["exc"]
+    assert "Traceback" not in entry["msg"]
+
+
+def test_text_log_still_appends_traceback():
+    output = log_through_queue(logging.Formatter("%(levelname)s %(message)s"))
+    assert output.startswith("ERROR Division failed for user 42\nTraceback")
+    assert "ZeroDivisionError" in output
@@ -0,0 +1,63 @@
+import asyncio
+from datetime import datetime
+
+from aiogram.types import Chat, Message, User
+
+from middlewares import ThrottleMiddleware
+
+REQUESTS = {"/status": "status", "✅ Поточний статус": "status", "/history": "history"}
+
+
+def message(text: str, user_id: int = 1) -> Message:
+    return Message(
+        message_id=1,
+        date=datetime.now(),
+        chat=Chat(id=user_id, type="private"),
+        from_user=User(id=user_id, is_bot=False, first_name="Test"),
+        text=text,
+    )
+
+
+def run_taps(middleware: ThrottleMiddleware, taps, handler_delay: float = 0.0) -> list[str]:
+    """Send (delay before, text, user_id) taps through the middleware; returns the texts that were handled"""
+    handled = []
+
+    async def handler(event, data):
+        handled.append(event.text)
+        await asyncio.sleep(handler_delay)
+
+    async def scenario():
+        tasks = []
+        for delay, text, user_id in taps:
+            await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(middleware(handler, message(text, user_id), {})))
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(scenario())
+    return handled
+
+
+def test_repeated_taps_within_cooldown_are_dropped():
+    middleware = ThrottleMiddleware(cooldown=0.2, requests=REQUESTS)
+    handled = run_taps(middleware, [
+        (0, "/status", 1),
+        (0.01, "✅ Поточний статус", 1),  # same kind, same user: dropped
+        (0.01, "/status@PowerBot", 1),    # same command addressed to the bot: dropped
+        (0.01, "/history", 1),            # another kind: handled
+        (0.01, "/status", 2),             # another user: handled
+        (0.3, "/status", 1),              # after the cooldown: handled
+    ])
+    assert handled == ["/status", "/history", "/status", "/status"]
+
+
+def test_tap_is_dropped_while_the_previous_one_is_still_handled():
+    middleware = ThrottleMiddleware(cooldown=0.05, requests=REQUESTS)
+    # The first reply takes longer than the cooldown
+    handled = run_taps(middleware, [(0, "/status", 1), (0.1, "/status", 1)], handler_delay=0.2)
+    assert handled == ["/status"]
+
+
+def test_unknown_texts_and_disabled_cooldown_pass_through():
+    assert run_taps(ThrottleMiddleware(cooldown=1, requests=REQUESTS), [(0, "hello", 1), (0, "hello", 1)]) == ["hello", "hello"]
+    assert run_taps(ThrottleMiddleware(cooldown=0, requests=REQUESTS), [(0, "/status", 1), (0, "/status", 1)]) == ["/status", "/status"]
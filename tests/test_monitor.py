@@ -0,0 +1,125 @@
+import asyncio
+import time
+
+import monitor
+from config import Config
+from monitor import Debouncer, DeviceMonitor
+
+
+class FakePlug:
+    """Probe answering from a script of on/off results"""
+
+    def __init__(self, results):
+        self.results = list(results)
+
+    async def probe(self) -> bool:
+        return self.results.pop(0)
+
+
+class FakePowerState:
+    def __init__(self, status):
+        self.last = {"status": status, "timestamp": time.time() - 3600}
+        self.recorded = []
+
+    async def get_last_event(self, location):
+        return self.last
+
+    async def record_event(self, status, timestamp, location):
+        self.recorded.append(status)
+        self.last = {"status": status, "timestamp": timestamp}
+
+
+def run_checks(monkeypatch, last_status, results, required=3):
+    """Run one check per scripted probe result; returns the recorded events and the final debouncer"""
+    monkeypatch.setattr(Config, "CONFIRMATION_CHECKS", required)
+    state = FakePowerState(last_status)
+    monkeypatch.setattr(monitor, "power_state", state)
+    notified = []
+
+    async def notify(self, bot, msg, status, time_str, audience):
+        notified.append(status)
+
+    monkeypatch.setattr(DeviceMonitor, "notify", notify)
+    device = DeviceMonitor("Home", FakePlug(results))
+
+    async def scenario():
+        tasks = set()
+        for _ in results:
+            await device.check(None, tasks)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(scenario())
+    return state.recorded, notified, device.debouncer
+
+
+def test_debouncer_confirms_after_required_agreeing_probes():
+    debouncer = Debouncer(required=3)
+    assert debouncer.observe("off") is True
+    assert debouncer.observe("off") is False
+    assert not debouncer.confirmed
+    debouncer.observe("off")
+    assert debouncer.confirmed
+    assert debouncer.pending_count == 3
+
+
+def test_debouncer_restarts_count_when_probes_disagree():
+    debouncer = Debouncer(required=2)
+    debouncer.observe("off")
+    since = debouncer.pending_since
+    assert debouncer.observe("on") is True
+    assert (debouncer.pending_state, debouncer.pending_count) == ("on", 1)
+    assert debouncer.pending_since >= since
+    debouncer.reset()
+    assert debouncer.snapshot() == (None, 0, None)
+
+
+def test_debouncer_snapshot_round_trip():
+    debouncer = Debouncer(required=3)
+    debouncer.observe("off")
+    debouncer.observe("off")
+    restored = Debouncer(required=3)
+    restored.restore(debouncer.snapshot())
+    restored.observe("off")
+    assert restored.confirmed
+
+
+def test_change_is_recorded_once_confirmed(monkeypatch):
+    recorded, notified, debouncer = run_checks(monkeypatch, "on", [False, False, False])
+    assert recorded == ["off"]
+    assert notified == ["off"]
+    assert debouncer.pending_state is None
+
+
+def test_change_is_cancelled_when_the_state_comes_back(monkeypatch):
+    recorded, notified, debouncer = run_checks(monkeypatch, "on", [False, False, True, False])
+    assert recorded == []
+    assert notified == []
+    # The last probe starts a new confirmation from scratch
+    assert (debouncer.pending_state, debouncer.pending_count) == ("off", 1)
+
+
+def test_restore_continues_a_recent_pending_change(monkeypatch):
+    monkeypatch.setattr(Config, "CONFIRMATION_CHECKS", 3)
+    monkeypatch.setattr(Config, "PENDING_STATE_MAX_AGE", 300)
+    device = DeviceMonitor("Home", FakePlug([]))
+    snapshot = ("off", 2, time.time() - 30)
+    device.restore(snapshot)
+    assert device.debouncer.snapshot() == snapshot
+    device.debouncer.observe("off")
+    assert device.debouncer.confirmed
+
+
+def test_restore_drops_a_stale_pending_change(monkeypatch):
+    monkeypatch.setattr(Config, "PENDING_STATE_MAX_AGE", 300)
+    device = DeviceMonitor("Home", FakePlug([]))
+    device.restore(("off", 2, time.time() - 301))
+    assert device.debouncer.snapshot() == (None, 0, None)
+
+
+def test_restore_without_snapshot_starts_clean(monkeypatch):
+    device = DeviceMonitor("Home", FakePlug([]))
+    device.debouncer.observe("off")
+    device.restore(None)
+    assert device.debouncer.snapshot() == (None, 0, None)
+    device.restore((None, 0, None))
+    assert device.debouncer.snapshot() == (None, 0, None)
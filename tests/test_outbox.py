@@ -0,0 +1,54 @@
+import asyncio
+
+import psycopg
+
+import outbox as outbox_module
+from broadcast import BroadcastStats
+from outbox import BroadcastOutbox
+from subscribers import SubscriberSet
+
+
+class FakeSender:
+    """Delivers every page; users 2 and 5 have blocked the bot"""
+
+    def __init__(self):
+        self.pages = []
+
+    async def broadcast(self, bot_instance, page, text, stats):
+        self.pages.append(list(page))
+        for user_id in page:
+            if user_id in (2, 5):
+                stats.blocked += 1
+                stats.blocked_ids.append(user_id)
+            else:
+                stats.sent += 1
+
+
+def test_failed_deactivation_does_not_stop_delivery(monkeypatch):
+    subscribers = SubscriberSet(blocked_flush_interval=3600)
+    subscribers._ids.extend(range(1, 8))
+    subscribers._loaded = True
+    monkeypatch.setattr(outbox_module, "subscribers", subscribers)
+
+    async def deactivate_users(user_ids):
+        raise psycopg.OperationalError("pool timeout")
+
+    async def update_broadcast_job(*args, **kwargs):
+        return True
+
+    monkeypatch.setattr(subscribers, "deactivate_users", deactivate_users)
+    monkeypatch.setattr(outbox_module, "update_broadcast_job", update_broadcast_job)
+
+    async def scenario():
+        sender = FakeSender()
+        outbox = BroadcastOutbox(sender, page_size=3, resume_max_age=3600, lease=60)
+        stats = await outbox._deliver(None, 1, "alert", None, None, None, BroadcastStats())
+        queued = set(subscribers._blocked)
+        subscribers._blocked_flush.cancel()
+        return sender.pages, stats, queued
+
+    pages, stats, queued = asyncio.run(scenario())
+    assert pages == [[1, 2, 3], [4, 5, 6], [7]]
+    assert stats.sent == 5
+    # Handed to the delayed bulk flush instead
+    assert queued == {2, 5}
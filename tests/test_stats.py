@@ -0,0 +1,61 @@
+from datetime import date, datetime
+
+import pytest
+import pytz
+
+from stats import PeriodStats, aggregate, render_period
+
+TZ = pytz.utc
+# Thursday 15 Oct, 02:00: the current day is two hours old
+NOW = TZ.localize(datetime(2026, 10, 15, 2, 0))
+TODAY = NOW.date()
+# An outage that started yesterday at 23:00 is still going on
+OPEN_START = TZ.localize(datetime(2026, 10, 14, 23, 0))
+ROWS = [
+    {"day": date(2026, 10, 1), "outages_count": 1, "downtime_seconds": 1800, "longest_seconds": 1800},
+    {"day": date(2026, 10, 12), "outages_count": 1, "downtime_seconds": 3600, "longest_seconds": 3600},
+    {"day": date(2026, 10, 14), "outages_count": 2, "downtime_seconds": 5400, "longest_seconds": 3600},
+]
+HOUR = 3600
+DAY = 24 * HOUR
+
+
+@pytest.mark.parametrize("first_day, last_day, expected", [
+    # Today: only the part of the ongoing outage after midnight; it is counted on the day it started
+    (TODAY, TODAY, PeriodStats(outages=0, downtime=2 * HOUR, longest=0, seconds=2 * HOUR)),
+    # Yesterday: rolled-up outages plus the hour before midnight of the ongoing one
+    (date(2026, 10, 14), date(2026, 10, 14), PeriodStats(outages=3, downtime=5400 + HOUR, longest=3 * HOUR, seconds=DAY)),
+    # This week (from Monday 12 Oct)
+    (date(2026, 10, 12), TODAY, PeriodStats(outages=4, downtime=3600 + 5400 + 3 * HOUR, longest=3 * HOUR, seconds=3 * DAY + 2 * HOUR)),
+    # This month
+    (date(2026, 10, 1), TODAY, PeriodStats(outages=5, downtime=1800 + 3600 + 5400 + 3 * HOUR, longest=3 * HOUR, seconds=14 * DAY + 2 * HOUR)),
+    # Last 7 days (9-15 Oct) leave out the 1 Oct row
+    (date(2026, 10, 9), TODAY, PeriodStats(outages=4, downtime=3600 + 5400 + 3 * HOUR, longest=3 * HOUR, seconds=6 * DAY + 2 * HOUR)),
+    # A quiet day in the breakdown
+    (date(2026, 10, 13), date(2026, 10, 13), PeriodStats(outages=0, downtime=0, longest=0, seconds=DAY)),
+])
+def test_aggregate_periods(first_day, last_day, expected):
+    assert aggregate(ROWS, first_day, last_day, OPEN_START, NOW) == expected
+
+
+def test_aggregate_without_ongoing_outage():
+    stats = aggregate(ROWS, date(2026, 10, 14), date(2026, 10, 14), None, NOW)
+    assert stats == PeriodStats(outages=2, downtime=5400, longest=3600, seconds=DAY)
+
+
+@pytest.mark.parametrize("stats, uptime", [
+    (PeriodStats(downtime=2 * HOUR, seconds=2 * HOUR), 0.0),
+    (PeriodStats(downtime=6 * HOUR, seconds=DAY), 75.0),
+    (PeriodStats(downtime=0, seconds=DAY), 100.0),
+    (PeriodStats(seconds=0), 100.0),
+    # Never below zero, e.g. rounding in the rollup
+    (PeriodStats(downtime=DAY + 1, seconds=DAY), 0.0),
+])
+def test_uptime_pct(stats, uptime):
+    assert stats.uptime_pct == pytest.approx(uptime)
+
+
+def test_render_period():
+    assert render_period("Сьогодні", PeriodStats(seconds=DAY)) == "**Сьогодні:** відключень не було"
+    line = render_period("Цей тиждень", PeriodStats(outages=2, downtime=6 * HOUR, longest=4 * HOUR + 30 * 60, seconds=DAY))
+    assert line == "**Цей тиждень:** 2 відкл., без світла `6h 0m`, найдовше `4h 30m`, світло було 75.0% часу"
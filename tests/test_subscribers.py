@@ -0,0 +1,178 @@
+import asyncio
+
+import psycopg
+
+import database
+import subscribers as subscribers_module
+from subscribers import SubscriberSet
+
+# 2 follows only A, 3 only B, the rest every location
+LOCATIONS = [(2, "A"), (3, "B")]
+# 4 gets digests, 5 and 6 have quiet hours (5 wraps past midnight)
+PREFS = [(4, "digest", None, None), (5, "quiet", 22, 7), (6, "quiet", 0, 6)]
+
+
+def use_database(monkeypatch, ids, locations=(), prefs=(), gate=None):
+    """Point SubscriberSet.load at fixed rows; with `gate`, the first query waits for it"""
+    async def get_active_users():
+        if gate is not None:
+            await gate.wait()
+        return list(ids)
+
+    async def get_all_user_locations():
+        return list(locations)
+
+    async def get_notify_preferences():
+        return list(prefs)
+
+    monkeypatch.setattr(database, "get_active_users", get_active_users)
+    monkeypatch.setattr(database, "get_all_user_locations", get_all_user_locations)
+    monkeypatch.setattr(database, "get_notify_preferences", get_notify_preferences)
+
+
+def pages(monkeypatch, calls, ids=range(1, 11)):
+    """Results of page(**kwargs) for each kwargs in `calls`, on a set loaded from fixed rows"""
+    use_database(monkeypatch, ids, LOCATIONS, PREFS)
+    subscribers = SubscriberSet(blocked_flush_interval=3600)
+
+    async def scenario():
+        return [await subscribers.page(**kwargs) for kwargs in calls]
+
+    return asyncio.run(scenario())
+
+
+def test_page_walks_ids_with_cursor_and_limit(monkeypatch):
+    assert pages(monkeypatch, [
+        {"limit": 4},
+        {"after": 3, "limit": 4},
+        {"after": 8, "limit": 4},
+        {"after": 10},
+        {"after": 0, "limit": 1},
+    ]) == [[1, 2, 3, 4], [4, 5, 6, 7], [9, 10], [], [1]]
+
+
+def test_page_filters_by_location(monkeypatch):
+    assert pages(monkeypatch, [
+        {"location": "A", "limit": 3},
+        {"location": "B", "limit": 3},
+        {"location": "A", "after": 1, "limit": 2},
+        {"location": "C", "after": 8},
+        {"location": None, "limit": 3},
+    ]) == [[1, 2, 4], [1, 3, 4], [2, 4], [9, 10], [1, 2, 3]]
+
+
+def test_page_with_no_location_choices_returns_everyone(monkeypatch):
+    use_database(monkeypatch, [1, 2, 3])
+    subscribers = SubscriberSet(blocked_flush_interval=3600)
+    assert asyncio.run(subscribers.page("A")) == [1, 2, 3]
+
+
+def test_page_filters_by_audience(monkeypatch):
+    assert pages(monkeypatch, [
+        # Outside every quiet window: everyone but the digest user
+        {"audience": "instant:12"},
+        # 23:00 is inside 22-7 only
+        {"audience": "instant:23"},
+        # 03:00 is inside both quiet windows
+        {"audience": "instant:3"},
+        {"audience": "digest"},
+        {"audience": "quiet:22-7"},
+        {"audience": "quiet:0-6"},
+        {"audience": None, "limit": 5},
+    ]) == [
+        [1, 2, 3, 5, 6, 7, 8, 9, 10],
+        [1, 2, 3, 6, 7, 8, 9, 10],
+        [1, 2, 3, 7, 8, 9, 10],
+        [4],
+        [5],
+        [6],
+        [1, 2, 3, 4, 5],
+    ]
+
+
+def test_page_combines_location_audience_and_cursor(monkeypatch):
+    assert pages(monkeypatch, [
+        {"location": "B", "audience": "instant:23", "limit": 3},
+        {"location": "B", "audience": "instant:23", "after": 3, "limit": 3},
+        {"location": "A", "audience": "digest"},
+        {"location": "A", "audience": "quiet:22-7", "after": 5},
+    ]) == [[1, 3, 6], [6, 7, 8], [4], []]
+
+
+def test_changes_during_load_are_replayed_on_the_snapshot(monkeypatch):
+    gate = asyncio.Event()
+    # The snapshot was read before the changes below were committed
+    use_database(monkeypatch, [1, 2, 3], gate=gate)
+    subscribers = SubscriberSet(blocked_flush_interval=3600)
+
+    async def scenario():
+        load = asyncio.create_task(subscribers.load())
+        await asyncio.sleep(0)
+        await subscribers.apply_notification({"op": "add", "user_id": 9})
+        await subscribers.apply_notification({"op": "remove", "user_ids": [1]})
+        await subscribers.apply_notification({"op": "locations", "user_id": 2, "locations": ["A"]})
+        await subscribers.apply_notification({"op": "prefs", "user_id": 3, "mode": "digest", "quiet_start": None, "quiet_end": None})
+        gate.set()
+        await load
+        return await subscribers.page(), await subscribers.page("B"), await subscribers.page(audience="digest")
+
+    everyone, in_b, digest = asyncio.run(scenario())
+    assert everyone == [2, 3, 9]
+    assert in_b == [3, 9]
+    assert digest == [3]
+    assert subscribers._replay is None
+
+
+def test_failed_blocked_flush_is_retried_and_flushed_on_close(monkeypatch):
+    monkeypatch.setattr(subscribers_module, "BLOCKED_FLUSH_MAX_DELAY", 0.02)
+    calls = []
+
+    async def deactivate_users(user_ids):
+        calls.append(sorted(user_ids))
+        if len(calls) == 1:
+            raise psycopg.OperationalError("database is restarting")
+        return len(user_ids)
+
+    monkeypatch.setattr(database, "deactivate_users", deactivate_users)
+
+    async def scenario():
+        subscribers = SubscriberSet(blocked_flush_interval=0.01)
+        subscribers._loaded = True
+        subscribers.mark_blocked(1)
+        subscribers.mark_blocked(2)
+        # First attempt fails, the retry goes through without another mark_blocked
+        for _ in range(100):
+            if len(calls) == 2:
+                break
+            await asyncio.sleep(0.01)
+        assert calls == [[1, 2], [1, 2]]
+
+        subscribers.mark_blocked(3)
+        await subscribers.close()
+        assert calls[-1] == [3]
+
+    asyncio.run(scenario())
+
+
+def test_users_blocked_during_a_flush_are_flushed_by_the_same_task(monkeypatch):
+    calls = []
+    subscribers = SubscriberSet(blocked_flush_interval=0.01)
+
+    async def deactivate_users(user_ids):
+        calls.append(sorted(user_ids))
+        if len(calls) == 1:
+            # Arrives while the first UPDATE is in flight: no new flush task is started for it
+            subscribers.mark_blocked(3)
+            await asyncio.sleep(0)
+        return len(user_ids)
+
+    monkeypatch.setattr(database, "deactivate_users", deactivate_users)
+
+    async def scenario():
+        subscribers._loaded = True
+        subscribers.mark_blocked(1)
+        await asyncio.wait_for(subscribers._blocked_flush, timeout=1)
+        assert calls == [[1], [3]]
+        assert not subscribers._blocked
+
+    asyncio.run(scenario())